@@ -0,0 +1,307 @@
+"""
+    Loopback load benchmark of the connection code.
+
+    For every combination of peer count, message size and message rate a
+    fresh app process listens with a ConnectionManager, the way the chat
+    window does. A generator process opens one conversation per simulated
+    peer with ConnectionManagers of its own and sends at the given rate
+    for a while. Both sides run the real Connection, SendQueue and
+    ChatCodec code from src.core, events are handed to callbacks instead
+    of a window, so no display or PySimpleGUI is needed.
+
+    Every message starts with its send time, so the app measures end to
+    end latency when the message is emitted. The app also reports
+    its CPU use and memory. Results are printed and saved as JSON so runs
+    of different commits can be compared.
+
+    Run from the Code folder:
+        python bench/load.py --peers 1,10,50 --sizes 64,1024 --rates 10,100
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from queue import SimpleQueue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.logger import Logger
+from src.core.engine import NetworkEngine
+from src.core.manager import ConnectionManager
+from src.core.events import EVENT_CONNECTED, EVENT_MESSAGES
+
+
+TICK = 0.01 # Seconds between send bursts of the generator
+DRAIN_TIMEOUT = 30 # Seconds the app waits for messages still on the way
+WORDS = ("the quick brown fox jumps over lazy dog hello world chat message"
+         " server client port connection send receive window contact"
+         " history search file queue").split()
+
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024 # Bytes on macOS, KiB elsewhere
+    return rss / 1024
+
+
+def app_main(port: int, compress: bool, start, control, results) -> None:
+
+    """
+        The side under test, receives from every peer.
+    """
+
+    sys.stdout = open(os.devnull, "w") # Silences the connection prints
+
+    latencies = []
+    received = [0]
+
+    def on_event(key, value) -> None:
+        if key == EVENT_MESSAGES:
+            now = time.perf_counter()
+            messages = value[1]
+
+            for msg in messages:
+                latencies.append(now - float(msg[:msg.index("|")]))
+
+            received[0] += len(messages)
+
+    logger = Logger()
+    engine = NetworkEngine(logger=logger)
+    engine.start()
+
+    manager = ConnectionManager(emit=on_event,
+                                logger=logger, engine=engine, s_port=port,
+                                compress=compress, outbox=None)
+    manager.listen()
+    results.put("ready")
+
+    start.wait()
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+
+    sent = control.get()
+    deadline = time.perf_counter() + DRAIN_TIMEOUT
+
+    while received[0] < sent and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+
+    manager.close_all()
+    engine.stop()
+
+    latencies.sort()
+    percentiles = (statistics.quantiles(latencies, n=100,
+                                        method="inclusive")
+                   if len(latencies) > 1 else latencies * 99)
+
+    results.put({
+        "received": received[0],
+        "seconds": round(wall, 3),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 3)
+                          if latencies else None,
+        "latency_p99_ms": round(percentiles[98] * 1000, 3)
+                          if latencies else None,
+        "latency_max_ms": round(latencies[-1] * 1000, 3)
+                          if latencies else None,
+        "cpu_percent": round(cpu / wall * 100, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    })
+
+
+def generator_main(port: int, peers: int, size: int, rate: float,
+                   duration: float, compress: bool, start, stop,
+                   results) -> None:
+
+    """
+        The simulated peers, each sends rate messages per second.
+    """
+
+    sys.stdout = open(os.devnull, "w")
+
+    logger = Logger()
+    engine = NetworkEngine(logger=logger)
+    engine.start()
+
+    queues = []
+    managers = []
+
+    for i in range(peers):
+        events = SimpleQueue()
+        # Never listens, the port only tells the app apart from the others.
+        # Every peer talks to "app", they cannot share one outbox file.
+        manager = ConnectionManager(emit=lambda event, value, events=events:
+                                         events.put((event, value)),
+                                    logger=logger,
+                                    engine=engine, s_port=port + 1 + i,
+                                    compress=compress, outbox=None)
+        manager.open(key="app", ip="127.0.0.1", port=port)
+
+        queues.append(events)
+        managers.append(manager)
+
+    for events in queues:
+        while events.get(timeout=30)[0] != EVENT_CONNECTED:
+            pass
+
+    random.seed(size)
+    padding = []
+    for _ in range(256):
+        text = ""
+        while len(text) < size:
+            text += random.choice(WORDS) + " "
+        padding.append(text)
+
+    start.set()
+
+    sent = 0
+    per_peer = 0 # Messages every peer has sent
+    begin = tick = time.perf_counter()
+
+    while tick < begin + duration:
+        burst = int(rate * (tick - begin + TICK)) - per_peer
+        per_peer += burst
+
+        for manager in managers:
+            for _ in range(burst):
+                stamp = f"{time.perf_counter():.6f}|"
+                manager.send("app", stamp + padding[sent % 256][:size
+                                                        - len(stamp)])
+                sent += 1
+
+        tick += TICK
+        time.sleep(max(0.0, tick - time.perf_counter()))
+
+    results.put(sent)
+
+    stop.wait() # Keep the connections open until the app has read everything
+
+    for manager in managers:
+        manager.close_all()
+    engine.stop()
+
+
+def run(port: int, peers: int, size: int, rate: float, duration: float,
+        compress: bool) -> dict:
+
+    """
+        Runs one configuration and returns its results.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    stop = context.Event()
+    control = context.Queue()
+    app_results = context.Queue()
+    generator_results = context.Queue()
+
+    app = context.Process(target=app_main,
+                          args=(port, compress, start, control, app_results))
+    app.start()
+    app_results.get(timeout=30) # Listening
+
+    generator = context.Process(target=generator_main,
+                                args=(port, peers, size, rate, duration,
+                                      compress, start, stop,
+                                      generator_results))
+    generator.start()
+
+    try:
+        sent = generator_results.get(timeout=duration + 60)
+        control.put(sent)
+        result = app_results.get(timeout=DRAIN_TIMEOUT + 30)
+
+    finally:
+        stop.set()
+        for process in (app, generator):
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+    result = {"peers": peers, "size": size, "rate": rate, "sent": sent,
+              **result}
+    result["messages_per_second"] = round(result["received"]
+                                          / result["seconds"])
+    result["megabytes_per_second"] = round(result["received"] * size
+                                           / result["seconds"] / 1e6, 3)
+    return result
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def numbers(text: str, kind=int) -> list:
+    return [kind(item) for item in text.split(",")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=17600)
+    parser.add_argument("--peers", type=numbers, default=[1, 10, 50],
+                        help="Comma separated peer counts")
+    parser.add_argument("--sizes", type=numbers, default=[64, 1024],
+                        help="Comma separated message sizes in bytes")
+    parser.add_argument("--rates", type=lambda text: numbers(text, float),
+                        default=[10, 100],
+                        help="Comma separated messages per second per peer")
+    parser.add_argument("--duration", type=float, default=5,
+                        help="Seconds every configuration sends for")
+    parser.add_argument("--no-compress", action="store_true")
+    parser.add_argument("--output", default="load.json",
+                        help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "duration": args.duration,
+        "compress": not args.no_compress,
+        "runs": [],
+    }
+
+    for peers in args.peers:
+        for size in args.sizes:
+            for rate in args.rates:
+                result = run(args.port, peers, size, rate, args.duration,
+                             not args.no_compress)
+                report["runs"].append(result)
+
+                print(f"{peers:>4} peers {size:>6} B {rate:>7g}/s:"
+                      f" {result['messages_per_second']:>8} msg/s"
+                      f" p50 {result['latency_p50_ms']} ms"
+                      f" p99 {result['latency_p99_ms']} ms"
+                      f" cpu {result['cpu_percent']}%"
+                      f" rss {result['peak_rss_mb']} MB"
+                      f" ({result['received']}/{result['sent']})")
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
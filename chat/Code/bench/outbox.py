@@ -0,0 +1,209 @@
+"""
+    Outbox benchmark and crash check.
+
+    The benchmark appends messages to an outbox, which gathers them into
+    one fsync every SYNC_DELAY seconds, and compares it with an fsync
+    after every message.
+
+    The crash check runs a writer process that appends and acknowledges
+    messages as fast as it can, and kills it with SIGKILL at a random
+    moment, in the middle of writes and fsyncs. After every kill the
+    outbox is opened again and must give back every message the writer
+    had added, in order and unchanged. Messages may come back that were
+    acknowledged, as the acknowledgements are saved lazily, but never
+    fewer. A torn record is then written by hand and must be cut off.
+    The script exits with status 1 if a check fails.
+
+    Run from the Code folder: python bench/outbox.py
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE)
+
+from src.core.outbox import OutboxFile, RECORD
+
+
+# Prints "seq acked" after every message added
+WRITER = """
+import asyncio, sys
+from src.core.outbox import OutboxFile
+
+async def main(path):
+    store = OutboxFile(path)
+    acked = store.acked
+
+    while True:
+        seq = store.next_seq
+        store.add(f"message {seq} " + "x" * (seq % 300))
+
+        if seq % 50 == 0:
+            acked = seq - 200
+            store.acknowledge(acked)
+            await asyncio.sleep(0) # Lets the sync run
+
+        print(seq, acked, flush=True)
+
+asyncio.run(main(sys.argv[1]))
+"""
+
+
+def text(seq: int) -> str:
+    return f"message {seq} " + "x" * (seq % 300)
+
+
+async def bench(path: str, count: int, size: int) -> None:
+
+    """
+        Prints the appends per second with batched and with per message
+        fsync.
+    """
+
+    message = "x" * size
+
+    store = OutboxFile(path)
+    start = time.perf_counter()
+
+    for i in range(count):
+        store.add(message)
+        if i % 1000 == 0:
+            await asyncio.sleep(0)
+
+    await store.close()
+    batched = time.perf_counter() - start
+
+    os.remove(path)
+    os.remove(path + ".state")
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    each = max(count // 20, 1)
+    start = time.perf_counter()
+
+    for _ in range(each):
+        os.write(fd, RECORD.pack(size, 0, 0) + message.encode())
+        os.fsync(fd)
+
+    single = (time.perf_counter() - start) / each * count
+    os.close(fd)
+
+    print(f"batched fsync     {count / batched:10.0f} messages/s")
+    print(f"fsync per message {count / single:10.0f} messages/s")
+
+
+def crash_once(path: str, seconds: float) -> str:
+
+    """
+        Kills a writer after the given seconds and checks the replay.
+        Returns what went wrong, or None.
+    """
+
+    # A file never blocks the writer the way a full pipe would
+    with open(path + ".progress", "w") as progress:
+        writer = subprocess.Popen([sys.executable, "-c", WRITER, path],
+                                  cwd=CODE, stdout=progress)
+        time.sleep(seconds)
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+
+    with open(path + ".progress") as progress:
+        reported = [tuple(map(int, line.split())) for line in progress
+                    if len(line.split()) == 2]
+
+    async def check() -> str:
+        store = OutboxFile(path)
+        records = store.pending()
+        await store.close()
+
+        if not reported:
+            return None
+
+        last, acked = reported[-1]
+        seqs = [seq for seq, _ in records]
+
+        if seqs and seqs != list(range(seqs[0], seqs[0] + len(seqs))):
+            return "records are not in order"
+
+        if any(message != text(seq) for seq, message in records):
+            return "a record came back changed"
+
+        if not seqs or seqs[0] > acked + 1 or seqs[-1] < last:
+            return (f"added up to {last}, acknowledged {acked}, but"
+                    f" {len(seqs)} records came back")
+
+        return None
+
+    return asyncio.run(check())
+
+
+def torn(path: str) -> str:
+
+    """
+        Appends half a record and checks it is cut off and the outbox
+        still takes messages. Returns what went wrong, or None.
+    """
+
+    async def check() -> str:
+        store = OutboxFile(path)
+        before = store.pending()
+        await store.close()
+
+        with open(path, "ab") as log_file:
+            log_file.write(RECORD.pack(100, 0, 1)[:10])
+
+        store = OutboxFile(path)
+        seq = store.add(text(store.next_seq))
+        after = store.pending()
+        await store.close()
+
+        if after != before + [(seq, text(seq))]:
+            return "the torn record was not cut off"
+
+        return None
+
+    return asyncio.run(check())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--crashes", type=int, default=20)
+    args = parser.parse_args()
+
+    failed = False
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(bench(os.path.join(directory, "bench.out"), args.count,
+                          args.size))
+
+        path = os.path.join(directory, "crash.out")
+
+        for i in range(args.crashes):
+            problem = crash_once(path, random.uniform(0.2, 1.0))
+
+            if problem is not None:
+                print(f"crash {i + 1}: {problem}")
+                failed = True
+
+        problem = torn(path)
+        if problem is not None:
+            print(f"torn record: {problem}")
+            failed = True
+
+    print("crash check", "FAILED" if failed else "ok",
+          f"({args.crashes} kills)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
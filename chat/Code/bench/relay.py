@@ -0,0 +1,183 @@
+"""
+    Loopback benchmark of the relay hub.
+
+    Starts relay.py in its own process, connects many members split into
+    rooms, lets every member send a number of messages and measures how
+    many relayed messages per second reach the members. With --workers
+    the relay runs that many worker processes, and with --clients the
+    members are split over that many benchmark processes, so the
+    benchmark itself does not limit a relay using several cores.
+
+    Run from the Code folder: python bench/relay.py --members 2000
+    Scaling: python bench/relay.py --workers 4 --clients 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.protocol import (encode_chat, encode_frame, encode_hello,
+                               HEADER_SIZE, MSG_CONTROL, MSG_HELLO_ACK)
+
+
+def wait_for_port(port: int) -> None:
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Relay did not start")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=17500)
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--room-size", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=20,
+                        help="Messages sent by every member")
+    parser.add_argument("--size", type=int, default=64,
+                        help="Bytes of text per message")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes of the relay")
+    parser.add_argument("--clients", type=int, default=1,
+                        help="Benchmark processes the members are split over")
+    args = parser.parse_args()
+
+    code = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    relay = subprocess.Popen([sys.executable, "relay.py", "--port",
+                              str(args.port), "--workers",
+                              str(args.workers)], cwd=code,
+                             stdout=subprocess.DEVNULL)
+
+    try:
+        wait_for_port(args.port)
+        measure(args)
+    finally:
+        relay.terminate()
+        relay.wait()
+
+
+def measure(args: argparse.Namespace) -> None:
+
+    """
+        Runs the members in up to args.clients processes, whole rooms in
+        each, and prints the messages delivered per second by all of them.
+    """
+
+    rooms = -(-args.members // args.room_size)
+    per_client = -(-rooms // args.clients) * args.room_size
+    firsts = range(0, args.members, per_client)
+
+    barrier = multiprocessing.Barrier(len(firsts))
+    results = multiprocessing.Queue()
+
+    clients = [multiprocessing.Process(target=run, args=(args, first,
+                                        min(per_client, args.members - first),
+                                        barrier, results))
+               for first in firsts]
+
+    for client in clients:
+        client.start()
+
+    outcomes = [results.get() for _ in clients]
+
+    for client in clients:
+        client.join()
+
+    delivered = sum(count for count, _ in outcomes)
+    elapsed = max(seconds for _, seconds in outcomes)
+
+    print(f"{args.members} members, {args.workers} relay workers,"
+          f" {len(clients)} clients: {delivered} messages delivered in"
+          f" {elapsed:.2f} s, {delivered / elapsed:,.0f} messages/s")
+
+
+def run(args: argparse.Namespace, first: int, count: int,
+        barrier: multiprocessing.Barrier, results: multiprocessing.Queue
+        ) -> None:
+
+    """
+        Connects the members first to first + count, sends their messages
+        and puts (messages delivered, seconds) into results.
+    """
+
+    selector = selectors.DefaultSelector()
+    members = []
+
+    # Every member announces a five digit port, so all names and therefore
+    # all relayed frames have the same size and can be counted by bytes.
+    for i in range(first, first + count):
+        sock = socket.create_connection(("127.0.0.1", args.port))
+        room = f"room{i // args.room_size}"
+        sock.sendall(encode_hello(os.urandom(8), 10000 + i)
+                     + encode_frame(MSG_CONTROL, f"join {room}".encode()))
+        members.append(sock)
+
+    ack = len(encode_frame(MSG_HELLO_ACK))
+    for sock in members:
+        received = 0
+        while received < ack:
+            received += len(sock.recv(ack - received))
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+
+    text = "x" * args.size
+    frame = encode_chat(text)
+    relayed = HEADER_SIZE + len("127.0.0.1:10000: ") + args.size
+
+    # Every member of a room gets the messages of the others, the last
+    # room may be smaller
+    sizes = [min(args.room_size, first + count - start)
+             for start in range(first, first + count, args.room_size)]
+    expected = sum(size * (size - 1) for size in sizes) * args.messages
+    expected_bytes = expected * relayed
+
+    time.sleep(0.5) # Let the hub process every join, on every worker
+    barrier.wait()  # Every client starts sending at once
+
+    batch = frame * args.messages
+    received = 0
+    start = time.perf_counter()
+
+    pending = {sock: memoryview(batch) for sock in members}
+
+    while received < expected_bytes:
+        for sock in list(pending):
+            try:
+                sent = sock.send(pending[sock])
+            except BlockingIOError:
+                continue
+            if sent == len(pending[sock]):
+                del pending[sock]
+            else:
+                pending[sock] = pending[sock][sent:]
+
+        for key, _ in selector.select(timeout=0 if pending else 1):
+            try:
+                received += len(key.fileobj.recv(1 << 20))
+            except BlockingIOError:
+                pass
+
+        if time.perf_counter() - start > 120:
+            print("Timed out")
+            break
+
+    elapsed = time.perf_counter() - start
+    results.put((received // relayed, elapsed))
+
+    for sock in members:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+    Startup time benchmark and budget check.
+
+    Every measurement runs in a fresh interpreter and is the median of a
+    number of runs. Import time is taken for the GUI-free core and for
+    the main window module. Time to first window is taken from before
+    the first import until ChatWindow is shown, and network ready from
+    then until the engine listens. The script exits with status 1 if a
+    median is over its budget, so a startup regression fails the check.
+
+    PySimpleGUI needs a display. Without PySimpleGUI or a display the
+    window measurements are skipped and only the core import is checked.
+    Any other error fails the check, and the core import is never
+    skipped.
+
+    Run from the Code folder: python bench/startup.py
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds allowed for the median of each measurement, with headroom
+# for slow machines
+BUDGETS_MS = {
+    "core_import": 250,
+    "ui_import": 600,
+    "first_window": 1500,
+    "network_ready": 300,
+}
+
+# Errors of the window scripts meaning the window cannot be shown here
+MISSING_GUI = ("No module named 'PySimpleGUI'", "no display name",
+               "couldn't connect to display")
+
+PROLOGUE = "import time\nstart = time.perf_counter()\n"
+REPORT = "print((time.perf_counter() - start) * 1000)\n"
+
+# Each script prints the milliseconds it measured
+SCRIPTS = {
+    "core_import": PROLOGUE + """
+import src.core.manager, src.core.history, src.core.contact
+""" + REPORT,
+
+    "ui_import": PROLOGUE + """
+import src.UI
+""" + REPORT,
+
+    "first_window": PROLOGUE + """
+from src.logger import Logger
+from src.UI import ChatWindow
+chat = ChatWindow(logger=Logger())
+chat.window.refresh()
+""" + REPORT + """
+chat.window.close()
+""",
+
+    "network_ready": """
+import time
+from src.logger import Logger
+from src.UI import ChatWindow
+chat = ChatWindow(logger=Logger())
+chat.window.refresh()
+start = time.perf_counter()
+chat.start_network()
+chat.manager.close_all() # Waits until the listen has been done
+""" + REPORT + """
+chat.engine.stop()
+chat.window.close()
+""",
+}
+
+
+def measure(name: str, script: str) -> float:
+
+    """
+        Runs the script in a fresh interpreter and returns the
+        milliseconds it printed, or None if it needs a GUI that is
+        missing here. Raises RuntimeError if the script failed otherwise.
+    """
+
+    result = subprocess.run([sys.executable, "-c", script], cwd=CODE,
+                            capture_output=True, text=True)
+
+    if result.returncode != 0:
+        if name != "core_import" and any(error in result.stderr
+                                         for error in MISSING_GUI):
+            return None
+
+        raise RuntimeError(f"exited with status {result.returncode}:"
+                           f" {result.stderr.strip()[-500:]}")
+
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", action="append", default=[],
+                        metavar="NAME=MS", help="Overrides a budget, such"
+                        " as first_window=1000")
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS_MS)
+    for item in args.budget:
+        name, ms = item.split("=")
+        budgets[name] = float(ms)
+
+    failed = False
+
+    for name, script in SCRIPTS.items():
+        times = []
+
+        try:
+            for _ in range(args.runs):
+                ms = measure(name, script)
+                if ms is None:
+                    break
+                times.append(ms)
+
+        except RuntimeError as e:
+            print(f"{name:<14} FAILED, {e}")
+            failed = True
+            continue
+
+        if not times:
+            print(f"{name:<14} skipped, needs PySimpleGUI and a display")
+            continue
+
+        median = statistics.median(times)
+        over = median > budgets[name]
+        failed |= over
+
+        print(f"{name:<14} {median:8.1f} ms  budget {budgets[name]:6g} ms"
+              f"  {'OVER BUDGET' if over else 'ok'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+    Transcript memory benchmark.
+
+    Keeps count messages once as formatted lines, the way the transcript
+    used to, and once in a MessageLog, and prints the memory per message
+    and the time to render, filter and export them.
+
+    Run from the Code folder: python bench/transcript.py
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.messages import MessageLog, ME
+from src.timestamp import TimeStamp
+
+
+def messages(count: int, size: int) -> list:
+
+    """
+        Returns (seconds, sent, text) of count messages, a few per second.
+    """
+
+    start = time.time() - count
+    return [(start + i / 4, random.random() < 0.5,
+             f"message {i} " + "x" * random.randint(1, size))
+            for i in range(count)]
+
+
+def measure(build) -> tuple:
+
+    """
+        Returns what build returns and the bytes it allocated.
+    """
+
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return result, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=200000)
+    parser.add_argument("--size", type=int, default=60)
+    args = parser.parse_args()
+
+    rows = messages(args.count, args.size)
+
+    def build_lines() -> list:
+        return [TimeStamp.get_time(seconds)
+                + (" ME: " if sent else " alice: ") + text
+                for seconds, sent, text in rows]
+
+    def build_log() -> MessageLog:
+        log = MessageLog()
+        peer = log.sender_id("alice")
+
+        for seconds, sent, text in rows:
+            log.add(ME if sent else peer, text, seconds)
+
+        return log
+
+    lines, lines_size = measure(build_lines)
+    log, log_size = measure(build_log)
+
+    print(f"formatted lines {lines_size / args.count:8.1f} bytes/message")
+    print(f"message log     {log_size / args.count:8.1f} bytes/message")
+
+    start = time.perf_counter()
+    log.lines()
+    print(f"render          {time.perf_counter() - start:8.3f} s")
+
+    start = time.perf_counter()
+    mine = [line for line in lines if line[24:29] == " ME: "]
+    parsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    records = log.records(sender=ME)
+    print(f"filter sender   {time.perf_counter() - start:8.3f} s records,"
+          f" {parsed:.3f} s parsing lines ({len(records)} = {len(mine)})")
+
+    start = time.perf_counter()
+    found = log.records(words="message 1999")
+    print(f"filter words    {time.perf_counter() - start:8.3f} s"
+          f" ({len(found)} found)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+    Compares the old polling UI loop with the event driven one.
+
+    PySimpleGUI needs a display, so the window is modelled by a queue that
+    stands in for window.read. The polling loop is the old one: it reads
+    with a 10 ms timeout and then checks the socket like get_msg did, with
+    a 0.1 ms recv timeout. The event loop blocks on the queue while the
+    real NetworkEngine, Connection and read_loop receive the messages from
+    a peer ConnectionManager and emit them, and the emit callback puts
+    them on the queue with a time stamp, the way write_event_value does.
+
+    Every message carries its send time, so latency is measured until the
+    window loop has the message, and for the event loop also until it was
+    emitted. Idle CPU is taken while connected and nothing is sent, it
+    includes both sides and their heartbeats.
+
+    Run from the Code folder: python bench/ui_loop.py
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import sys
+import time
+from queue import Queue, SimpleQueue, Empty
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.logger import Logger
+from src.core.engine import NetworkEngine
+from src.core.manager import ConnectionManager
+from src.core.events import EVENT_CONNECTED, EVENT_MESSAGES
+
+
+IDLE_SECONDS = 2.0
+MESSAGES = 100
+GAP = 0.02 # Seconds between messages, slower than one poll
+
+
+def stamp() -> bytes:
+    return f"{time.perf_counter():.6f}\n".encode()
+
+
+def idle_cpu() -> float:
+
+    """
+        Returns the share of one core the process used while idle.
+    """
+
+    cpu_start = time.process_time()
+    time.sleep(IDLE_SECONDS)
+
+    return (time.process_time() - cpu_start) / IDLE_SECONDS
+
+
+def summary(cpu: float, latencies: list, emitted: list = None) -> dict:
+    result = {
+        "idle_cpu_percent": round(cpu * 100, 2),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "latency_max_ms": round(max(latencies) * 1000, 3),
+    }
+
+    if emitted:
+        result["emit_p50_ms"] = round(statistics.median(emitted) * 1000, 3)
+
+    return result
+
+
+def measure_polling(port: int) -> dict:
+
+    """
+        Old loop shape, window.read(10) followed by get_msg.
+    """
+
+    listener = socket.create_server(("127.0.0.1", port))
+    remote = socket.create_connection(("127.0.0.1", port))
+    local, _ = listener.accept()
+    listener.close()
+
+    events = Queue() # Only user events, nothing arrives while measuring
+    latencies = []
+    done = []
+
+    def window_loop() -> None:
+        while not done:
+            try:
+                events.get(timeout=0.01) # window.read(timeout=10)
+            except Empty:
+                pass
+
+            try:
+                local.settimeout(0.0001) # Does quick check
+                data = local.recv(1024).decode()
+            except socket.timeout:
+                continue
+
+            now = time.perf_counter()
+            latencies.extend(now - float(sent) for sent in data.split())
+
+    thread = Thread(target=window_loop)
+    thread.start()
+
+    cpu = idle_cpu()
+
+    for _ in range(MESSAGES):
+        remote.sendall(stamp())
+        time.sleep(GAP)
+
+    deadline = time.perf_counter() + 10
+    while len(latencies) < MESSAGES and time.perf_counter() < deadline:
+        time.sleep(GAP)
+
+    done.append(True)
+    thread.join()
+    local.close()
+    remote.close()
+
+    return summary(cpu, latencies)
+
+
+def measure_event(port: int) -> dict:
+
+    """
+        New loop shape, window.read() blocks until the engine emits.
+    """
+
+    logger = Logger()
+    events = Queue()
+    peer_events = SimpleQueue()
+    latencies = []
+    emitted = []
+
+    def emit(event: str, value) -> None:
+        events.put((event, value, time.perf_counter()))
+
+    def window_loop() -> None:
+        while len(latencies) < MESSAGES:
+            event, value, at = events.get() # window.read()
+            if event is None:
+                return
+
+            if event == EVENT_MESSAGES:
+                now = time.perf_counter()
+
+                for msg in value[1]:
+                    latencies.append(now - float(msg))
+                    emitted.append(at - float(msg))
+
+    app_engine = NetworkEngine(logger=logger)
+    peer_engine = NetworkEngine(logger=logger)
+    app_engine.start()
+    peer_engine.start()
+
+    app = ConnectionManager(emit=emit, logger=logger, engine=app_engine,
+                            s_port=port, outbox=None)
+    app.listen()
+
+    peer = ConnectionManager(emit=lambda event, value:
+                                 peer_events.put((event, value)),
+                             logger=logger, engine=peer_engine,
+                             s_port=port + 1, outbox=None)
+    peer.open(key="app", ip="127.0.0.1", port=port)
+
+    while peer_events.get(timeout=30)[0] != EVENT_CONNECTED:
+        pass
+
+    thread = Thread(target=window_loop)
+    thread.start()
+
+    cpu = idle_cpu()
+
+    for _ in range(MESSAGES):
+        peer.send("app", stamp().decode().strip())
+        time.sleep(GAP)
+
+    thread.join(timeout=10)
+    events.put((None, None, None))
+
+    peer.close_all()
+    app.close_all()
+    peer_engine.stop()
+    app_engine.stop()
+
+    return summary(cpu, latencies, emitted)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=1550, help="Port of"
+                        " the app, the peer of the event loop uses port + 1")
+    args = parser.parse_args()
+
+    print("polling", measure_polling(args.port))
+    print("event", measure_event(args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+from src.logger import Logger
+from src.core.hub import RelayHub, RelayPool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless chat relay, add"
+                                     " its address and port as a contact to"
+                                     " join the lobby room.")
+    parser.add_argument("--port", type=int, default=1500)
+    parser.add_argument("--host", default="")
+    parser.add_argument("--log-level", default=None,
+                        help="DEBUG, INFO, WARNING or ERROR, overrides"
+                        " CHAT_LOG_LEVEL")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes sharing the port, one per"
+                        " core")
+    args = parser.parse_args()
+
+    logger = Logger(level=args.log_level) # Create log object
+
+    if args.workers > 1 and not RelayPool.supported():
+        print("Worker processes need fork and SO_REUSEPORT, using one")
+        args.workers = 1
+
+    if args.workers > 1:
+        hub = RelayPool(logger=logger, port=args.port, host=args.host,
+                        workers=args.workers)
+    else:
+        hub = RelayHub(logger=logger, port=args.port, host=args.host)
+
+    try:
+        hub.run() # Start relay
+
+    except KeyboardInterrupt:
+        pass
+
+    except Exception as e:
+        print(f"Exception caught in relay: {e}!")
+        logger.log.error(f"Exception caught in relay: {e}!")
+
+    finally:
+        hub.close()
+        print("Terminated!")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,33 @@
-from threading import Thread, Event
 import PySimpleGUI as sg
+import os
+import time
 from src.logger import Logger
-from src.connection import Server, Client
+from src.core.events import (EVENT_MESSAGES, EVENT_CLOSED, EVENT_CONNECTED,
+                             EVENT_FAILED, EVENT_RECONNECTING,
+                             EVENT_DELIVERED, EVENT_FILE_SENT,
+                             EVENT_FILE_RECEIVED, EVENT_FILE_FAILED,
+                             EVENT_FILE_OFFER)
 from src.timestamp import TimeStamp
-from src.contact import NewContactUI, ShowContactsUI, SelectContactUI
-from src.setServerPort import ServerPortUI
+from src.transcript import Transcript, SCROLLBACK
+from src.core.metrics import Histogram
+from src.core.protocol import MAX_PAYLOAD
+
+# Networking, storage and the secondary windows are imported when first
+# used, so the main window shows without waiting for them.
+
+# Conversation states
+CONNECTING = "Connecting"
+CONNECTED = "Connected"
+DISCONNECTED = "Disconnected"
+
+# Events that open a window and wait for it, left out of the loop timing
+MODAL_EVENTS = ("Add contact", "Show contacts", "Search history",
+                "Set server port", "Connect", "Send file", "Statistics",
+                "Export conversation", "Load older", EVENT_FILE_OFFER)
 
 class ChatWindow:
 
-    def __init__(self, logger: Logger) -> None:
+    def __init__(self, logger: Logger, scrollback: int = SCROLLBACK) -> None:
 
         """
             Initializes chat window object.
@@ -22,11 +41,102 @@ class ChatWindow:
         self.window = self.make_window()
         self.window["MY_MESSAGE"].bind("<Return>", "_Enter")
 
+        self.scrollback = scrollback
+
+        # Status tab, used for messages not tied to a conversation
+        self.transcript = Transcript(self.window['MESSAGES'],
+                                     scrollback=scrollback)
+
+        self.transcripts = {} # Conversation key -> Transcript of its tab
+        self.states = {}      # Conversation key -> state of its connection
+        self.pending = {}     # Conversation key -> own messages not delivered
+        self.__delivery = ""  # Delivery text shown for the selected tab
+
+        self.__contacts = None # Loaded when first used
+        self.__history = None  # Opened when first used
+        self.oldest = {} # Conversation key -> id of oldest message shown
+
         self.time_stamp = TimeStamp()
         self.logger = logger
 
         self.server_port = 1500
 
+        self.engine = None  # Started by start_network
+        self.manager = None
+
+        self.events = 0 # Events handled by run
+        self.event_time = Histogram() # Seconds spent handling an event
+
+    @property
+    def contacts(self) -> "ContactRepository":
+
+        """
+            Every contact, read from the csv file the first time.
+        """
+
+        if self.__contacts is None:
+            from src.core.contact import ContactRepository
+            self.__contacts = ContactRepository()
+
+        return self.__contacts
+
+    @property
+    def history(self) -> "HistoryStore":
+
+        """
+            Message history, the database is opened the first time.
+        """
+
+        if self.__history is None:
+            from src.core.history import HistoryStore
+            self.__history = HistoryStore()
+
+        return self.__history
+
+    def start_network(self) -> None:
+
+        """
+            Starts the network engine and listens on the server port.
+            Called by run once the window is shown.
+        """
+
+        if self.manager is not None:
+            return
+
+        from src.core.engine import NetworkEngine
+        from src.core.manager import ConnectionManager
+
+        self.engine = NetworkEngine(logger=self.logger) # Serves every socket
+        self.engine.start()
+
+        # Network events become window events, read by run
+        self.manager = ConnectionManager(emit=self.window.write_event_value,
+                                         logger=self.logger,
+                                         engine=self.engine,
+                                         s_port=self.server_port,
+                                         contacts=self.contacts)
+        self.manager.listen()
+
+        self.manager.registry.add(self.collect)
+
+        port = os.environ.get("CHAT_METRICS_PORT")
+        if port:
+            self.manager.serve_metrics(int(port))
+
+    def collect(self) -> list:
+
+        """
+            Returns the metric families of the chat window.
+        """
+
+        return [
+            ("chat_ui_events_total", "counter", "Events handled by the chat"
+             " window.", [({}, self.events)]),
+            ("chat_ui_event_seconds", "histogram", "Seconds the chat window"
+             " spent handling an event, windows it opened left out.",
+             [({}, self.event_time)]),
+        ]
+
     @staticmethod
     def make_window() -> sg.Window:
 
@@ -35,186 +145,363 @@ class ChatWindow:
         """
 
         menu_layout =   [
-                            ["Connection", ["Connect", "Disconnect"]],
-                            ["Contacts", ["Add contact", "Show contacts"]],
+                            ["Connection", ["Connect", "Disconnect",
+                                            "Connection stats",
+                                            "Statistics"]],
+                            ["Contacts", ["Add contact", "Show contacts",
+                                          "Search history",
+                                          "Export conversation"]],
                             ["Settings", ["Set server port"]]
                         ]
 
+        status_layout = [
+                            [sg.Multiline(expand_x=True, expand_y=True,
+                            disabled=True, key='MESSAGES', autoscroll=True,
+                            write_only=True)]
+                        ]
+
         layout =    [
                         [sg.Menu(menu_layout, key='MENU')],
 
-                        [sg.Multiline(expand_x=True, expand_y=True, 
-                        disabled=True, key='MESSAGES', autoscroll=True)],
+                        [sg.TabGroup([[sg.Tab("Status", status_layout,
+                                              key='STATUS')]],
+                        expand_x=True, expand_y=True, key='TABS')],
 
-                        [sg.Input(expand_x=True, do_not_clear=True, 
-                        key='MY_MESSAGE'), sg.Button('Send')]
+                        [sg.Button('Load older'), 
+                        sg.Input(expand_x=True, do_not_clear=True,
+                        key='MY_MESSAGE'), sg.Button('Send'),
+                        sg.Button('Send file'),
+                        sg.Text("", size=(14, 1), key='DELIVERY')]
                     ]
 
         return sg.Window("Chat", layout, size=(800, 650), finalize=True)
 
-    def connect(self, name: str, ip: str, port: str) -> None:
+    def open_tab(self, key: str) -> Transcript:
 
         """
-            Creates a server and client object and runs their open_connection
-            methods in new threads.
+            Returns the transcript of the conversation, adding a tab for it
+            the first time, showing the latest page of its history.
         """
 
-        # Server
-        self.server = Server(window=self.window, logger=self.logger, name=name, 
-                                s_port=self.server_port)
-        
-        server_thread = Thread(target=self.server.open_connection, 
-                                    args=(self.server_connected_done,
-                                            self.server_connected_err))
-        server_thread.start()
+        if key not in self.transcripts:
+            layout = [
+                        [sg.Multiline(expand_x=True, expand_y=True,
+                        disabled=True, key=('MESSAGES', key), autoscroll=True,
+                        write_only=True)]
+                     ]
 
-        # Client
-        self.client = Client(window=self.window, logger=self.logger, 
-                                ip=ip, c_port=port)
+            self.window['TABS'].add_tab(sg.Tab(key, layout, key=('TAB', key)))
 
-        client_thread = Thread(target=self.client.open_connection, 
-                                    args=(self.client_connected_done,
-                                            self.client_connected_err))
-        client_thread.start()
-   
-    def run(self) -> None:
+            self.transcripts[key] = Transcript(self.window[('MESSAGES', key)],
+                                               scrollback=self.scrollback)
+
+            rows = self.history.page(key)
+            self.transcripts[key].add_rows(key, rows)
+            self.oldest[key] = rows[0][0] if rows else None
+
+        return self.transcripts[key]
+
+    def load_older(self, key: str) -> None:
+
+        """
+            Shows the page of history before the oldest message shown.
+        """
+
+        if self.oldest.get(key) is None:
+            return
+
+        rows = self.history.page(key, before=self.oldest[key])
+        if not rows:
+            self.oldest[key] = None
+            return
+
+        added = self.transcripts[key].prepend_rows(key, rows)
+        if added:
+            self.oldest[key] = rows[-added][0]
+
+        if added < len(rows):
+            sg.popup(f"Only the last {self.scrollback} lines are shown,"
+                     " use Search history for older messages.")
+
+    def export(self, key: str) -> None:
+
+        """
+            Asks for a file and writes the lines of the conversation, or
+            of the status tab when key is None, into it.
+        """
+
+        transcript = self.transcript if key is None else self.transcripts[key]
+
+        path = sg.popup_get_file("Export conversation to", save_as=True,
+                                 default_extension=".txt",
+                                 file_types=(("Text", "*.txt"),))
+
+        if path:
+            count = transcript.export(path)
+            sg.popup(f"Exported {count} lines to {path}")
+
+    def select_tab(self, key: str) -> None:
+
+        """
+            Shows the tab of the conversation.
+        """
+
+        self.window[('TAB', key)].select()
+
+    def note_pending(self, key: str) -> None:
+
+        """
+            Tells how many own messages wait for the connection to be
+            back, they are kept in the outbox until then.
+        """
+
+        if self.pending.get(key):
+            self.transcripts[key].append([f"{self.pending[key]} messages"
+                                          " will be sent once connected"])
+
+    def show_delivery(self, key: str) -> None:
+
+        """
+            Shows how many own messages of the selected conversation the
+            peer has not acknowledged yet. The element is only updated
+            when the text changes.
+        """
+
+        if self.pending.get(key):
+            text = f"{self.pending[key]} pending"
+        elif key in self.pending:
+            text = "All delivered"
+        else:
+            text = ""
+
+        if text != self.__delivery:
+            self.window['DELIVERY'].update(text)
+            self.__delivery = text
+
+    @staticmethod
+    def current_key(values: dict) -> str:
 
         """
-            Main event loop for chat window.
+            Returns the key of the conversation in the selected tab, or
+            None when the status tab is selected.
         """
 
-        self.client_connected_done = Event()
-        self.client_connected_err = Event()
+        tab = values['TABS']
+
+        if isinstance(tab, tuple):
+            return tab[1]
 
-        self.server_connected_done = Event()
-        self.server_connected_err = Event()
+        return None
 
-        connecting = False
-        connected = False
+    def run(self) -> None:
+
+        """
+            Main event loop for chat window. The loop blocks until the
+            user or the network engine writes an event into the window.
+        """
+
+        self.window.refresh() # Shown before the network is started
+        self.start_network()
 
         while True:
             try:
-                # If not connected only run loop on event
-                if not connecting and not connected:
-                    event, values = self.window.read()
-
-                # Else continuously run the loop
-                else:
-                    event, values = self.window.read(10)
+                event, values = self.window.read()
 
                 # Break loop when window is closed
                 if event == sg.WIN_CLOSED:
                     break
 
-                # While trying to connect
-                if connecting:
-                    if (self.client_connected_err.is_set()
-                        or self.server_connected_err.is_set()):
-                        # If error during connection
-                        try:
-                            self.client.close_connection()
-                            self.server.close_connection()
-
-                            connected = False
-                            connecting = False
-
-                            self.client_connected_done.clear()
-                            self.client_connected_err.clear()
-
-                            self.server_connected_done.clear()
-                            self.server_connected_err.clear()
-                            
-                            self.window['MESSAGES'].update("Connection failed!")
-                        except Exception as e:
-                            self.logger.log.error(f"ERR: {e}")
-
-                    elif (self.client_connected_done.is_set()
-                            and self.server_connected_done.is_set()):
-                            # If connection is established
-                            connected = True
-                            connecting = False
-
-                            self.client_connected_done.clear()
-                            self.client_connected_err.clear()
-
-                            self.server_connected_done.clear()
-                            self.server_connected_err.clear()
-                            
-                            self.window['MESSAGES'].update("Connected!")
-                    else:
-                        continue
+                start = time.perf_counter()
+                self.events += 1
+
+                if event == EVENT_CONNECTED:
+                    key = values[event]
+
+                    self.open_tab(key).append(["Connected!"])
+                    self.states[key] = CONNECTED
+
+                if event == EVENT_FAILED:
+                    key = values[event]
+
+                    self.open_tab(key).append(["Connection failed!"])
+                    self.states[key] = DISCONNECTED
+                    self.note_pending(key)
+
+                if event == EVENT_RECONNECTING:
+                    key = values[event]
+
+                    self.open_tab(key).append(["Connection lost,"
+                                               " reconnecting..."])
+                    self.states[key] = CONNECTING
+
+                if event == EVENT_DELIVERED:
+                    key, count = values[event]
+
+                    self.pending[key] = max(0, self.pending.get(key, 0)
+                                               - count)
+
+                if event == EVENT_MESSAGES:
+                    key, messages = values[event]
+
+                    # Shown first, the history is written in the background
+                    self.open_tab(key).add(key, False, messages)
+                    self.history.add_soon(key, False, messages)
+
+                if (event == EVENT_CLOSED
+                    and self.states.get(values[event]) != DISCONNECTED):
+
+                    key = values[event]
+
+                    self.open_tab(key).append(["Disconnected"])
+                    self.states[key] = DISCONNECTED
+                    self.note_pending(key)
+
+                    print("Connection ended by other user")
+
+                if event == EVENT_FILE_SENT:
+                    key, name = values[event]
+
+                    self.open_tab(key).append([self.time_stamp.get_time()
+                                               + " File sent: " + name])
+
+                if event == EVENT_FILE_RECEIVED:
+                    key, path = values[event]
+
+                    self.open_tab(key).append([self.time_stamp.get_time()
+                                               + " File received: " + path])
+
+                if event == EVENT_FILE_FAILED:
+                    key, name = values[event]
+
+                    self.open_tab(key).append(["Could not send file "
+                                               + name + "!"])
+
+                if event == EVENT_FILE_OFFER:
+                    key, transfer_id, name, size = values[event]
+
+                    answer = sg.popup_yes_no(f"{key} wants to send you"
+                                             f" {name} ({size / 2**20:.1f}"
+                                             " MiB). Accept?",
+                                             title="Incoming file")
+
+                    self.manager.answer_file(transfer_id, answer == "Yes")
 
                 if event == "Add contact":
-                    NewContactUI().run()
+                    from src.contact import NewContactUI
+                    NewContactUI(repository=self.contacts).run()
 
                 if event == "Show contacts":
-                    ShowContactsUI().run()
+                    from src.contact import ShowContactsUI
+                    ShowContactsUI(repository=self.contacts).run()
+
+                if event == "Search history":
+                    from src.search import SearchUI
+                    SearchUI(history=self.history).run()
+
+                if event == "Export conversation":
+                    self.export(self.current_key(values))
+
+                if event == "Statistics":
+                    from src.stats import StatsUI
+                    StatsUI(manager=self.manager).run()
 
                 if event == "Set server port":
+                    from src.setServerPort import ServerPortUI
                     rv = ServerPortUI().run()
                     print("EY")
                     if isinstance(rv, int):
                         self.server_port = rv
+                        self.manager.listen(s_port=rv)
+
+                if event == 'Connect':
+                    from src.contact import SelectContactUI
 
-                # When connected
-                if event == 'Connect' and not connected:
-                    
                     try:
-                        name, ip, port = SelectContactUI().run()
+                        name, ip, port = SelectContactUI(repository=self.contacts).run()
                     except TypeError:
-                        self.window['MESSAGES'].update("Connection failed!\n"
-                                                        "No contact selected!")
+                        self.transcript.reset("Connection failed!\n"
+                                              "No contact selected!")
+                        self.window['STATUS'].select()
                         continue
 
-                    self.window['MESSAGES'].update("Connecting...")
+                    transcript = self.open_tab(name)
+                    self.select_tab(name)
+
+                    if self.states.get(name) in (CONNECTING, CONNECTED):
+                        continue # Switching to an open conversation
 
-                    connecting = True
-                    
-                    self.connect(name=name, ip=ip, port=int(port))
+                    transcript.append(["Connecting..."])
+                    self.states[name] = CONNECTING
+
+                    self.manager.open(key=name, ip=ip, port=int(port))
 
                     self.window['MY_MESSAGE'].update("")
 
-                if event == 'Disconnect' and connected:
-                    self.window['MESSAGES'].update("Disconnected")
+                key = self.current_key(values)
 
-                    connected = False
-                    
-                    self.client.close_connection()
-                    self.server.close_connection()
+                if event == 'Load older' and key is not None:
+                    self.load_older(key)
 
-                    del self.client
-                    del self.server
+                if event == 'Connection stats' and key is not None:
+                    summary = self.manager.stats(key)
 
-                if ((event == 'Send' or event == "MY_MESSAGE_Enter") 
-                    and connected and values['MESSAGES'] != ""):
+                    self.transcripts[key].append([summary if summary
+                                                  else "Not connected"])
 
-                    self.window['MESSAGES'].update(values['MESSAGES'] + '\n' 
-                                                    + self.time_stamp.get_time()
-                                                    + ' ME: ' 
-                                                    + values['MY_MESSAGE'])
+                if (event == 'Disconnect'
+                    and self.states.get(key) in (CONNECTING, CONNECTED)):
 
-                    self.client.send(msg=values['MY_MESSAGE'])
+                    self.transcripts[key].append(["Disconnected"])
+                    self.states[key] = DISCONNECTED
+                    self.note_pending(key)
 
-                    self.window['MY_MESSAGE'].update("")
+                    self.manager.close(key)
+
+                if (event == 'Send file'
+                    and self.states.get(key) == CONNECTED):
+
+                    path = sg.popup_get_file("File to send")
 
-                if connected:
-                    resp = self.server.get_msg(previous_text=values['MESSAGES'])
-                    if resp == "Close":
-                        
-                        self.window['MESSAGES'].update("Disconnected")
-                        
-                        connected = False
-                        
-                        self.client.close_connection()
-                        self.server.close_connection()
+                    if path:
+                        self.transcripts[key].append(["Sending file "
+                                                      + path + "..."])
+                        self.manager.send_file(key=key, path=path)
 
-                        del self.client
-                        del self.server
+                # Messages sent while not connected wait in the outbox
+                if ((event == 'Send' or event == "MY_MESSAGE_Enter")
+                    and key is not None
+                    and values['MY_MESSAGE'] != ""):
 
-                        print("Connection ended by other user")
+                    if self.manager.send(key=key, msg=values['MY_MESSAGE']):
+                        self.transcripts[key].add(key, True,
+                                                  [values['MY_MESSAGE']])
+
+                        self.history.add_soon(key, True,
+                                              [values['MY_MESSAGE']])
+                        self.pending[key] = self.pending.get(key, 0) + 1
+
+                        self.window['MY_MESSAGE'].update("")
+                    else:
+                        self.transcripts[key].append(["Message not sent, it"
+                                                      " is larger than"
+                                                      f" {MAX_PAYLOAD >> 20}"
+                                                      " MiB"])
+
+                self.show_delivery(key)
+
+                if event not in MODAL_EVENTS:
+                    self.event_time.observe(time.perf_counter() - start)
 
             # except AttributeError as e:
             #     pass
             except Exception as e:
                 self.logger.log.error(f"Exception in chatwindow run: {e}!")
 
+        self.manager.close_all()
+        self.engine.stop()
+
+        if self.__contacts is not None:
+            self.__contacts.flush()
+
+        if self.__history is not None:
+            self.__history.close()
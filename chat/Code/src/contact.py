@@ -1,106 +1,91 @@
 import PySimpleGUI as sg
-import csv
 from typing import Optional
+from src.core.contact import ContactRepository
+
+
+class SelectContactUI:
 
-class Contact:
-    
     """
-        Contact object contains name, address and port
+        A window to select a contact to try and connect to. Typing in the
+        filter box narrows the list, and only the rows that fit in the list
+        are handed to the widget, the slider scrolls through the rest.
     """
 
-    def __init__(self, name: str, address: str, port: int = 1500) -> None:
-        
-        assert isinstance(name, str), (f"The given name {name} is not of type"
-                                        " string!")
+    ROWS = 15 # Contacts shown at once
 
-        assert isinstance(address, str), (f"The given address {address} is"
-                                            " not of type string!")
+    def __init__(self, repository: ContactRepository) -> None:
 
-        assert isinstance(port, int), (f"The given port number {port} is not"
-                                        " of type int!")
+        assert isinstance(repository, ContactRepository), (f"The given"
+                    f" repository {repository} is not of type"
+                     " ContactRepository!")
 
-        self.name = name
+        self.repository = repository
+        self.index = None
+        self.matches = []
+        self.offset = 0 # Position of the first shown match
+        self.window = self.make_window()
 
-        self.address = address
+    @classmethod
+    def make_window(cls) -> sg.Window:
+        layout =    [
+                        [sg.Input(expand_x=True, key="FILTER",
+                         enable_events=True)],
 
-        self.port = port
+                        [sg.Listbox(values=[], key="CONTACT_DISPLAY", 
+                         expand_x=True, expand_y=True,
+                         no_scrollbar=True),
+                         sg.Slider(range=(0, 0), orientation="v",
+                         disable_number_display=True, enable_events=True,
+                         key="SCROLL", expand_y=True)],
+
+                         [sg.Button("Connect to selected"),
+                          sg.Text("", key="COUNT")]
+                    ]
 
-    @property
-    def name(self) -> str:
-        return self.__name
+        return sg.Window("Contacts", layout, size=(300, 400), finalize=True)
 
-    @name.setter
-    def name(self, name: str) -> None:
-        assert isinstance(name, str), (f"The given name {name} is not of type"
-                                        " string!")
+    def get_contacts(self) -> None:
+        self.index = self.repository.index()
 
-        self.__name = name
+    def filter(self, text: str) -> None:
 
-    @property
-    def address(self) -> str:
-        return self.__address
+        """
+            Shows the contacts matching text from the top.
+        """
 
-    @address.setter
-    def address(self, address: str) -> None:
-        assert isinstance(address, str), (f"The given address {address} is not"
-                                        " of type string!")
-                                        
-        self.__address = address
+        self.matches = self.index.search(text)
+        self.offset = 0
 
-    @property
-    def port(self) -> int:
-        return self.__port
+        last = max(len(self.matches) - self.ROWS, 0)
+        # The slider runs top to bottom, so its value is inverted
+        self.window["SCROLL"].update(value=last, range=(0, last))
+        self.window["COUNT"].update(f"{len(self.matches)} contacts")
 
-    @port.setter
-    def port(self, port: int) -> None:
-        assert isinstance(port, int), (f"The given port {port} is not of type"
-                                        " int!")                     
-        self.__port = port
+        self.show()
 
-    @property
-    def contact_connection(self) -> tuple:
-        """
-            This is used to get name address and port to connect to.
-        """
-        return (self.__name, self.__address, self.__port)
+    def scroll(self, offset: int) -> None:
 
-    def __repr__(self) -> str:
         """
-            Used when writing contact to csv file
+            Shows the matches starting at offset.
         """
-        return f"{self.name},{self.address},{self.port}"
-
-    def __str__(self) -> str:
-        return f"{self.name}: \n{self.address}:{self.port}"
 
+        last = max(len(self.matches) - self.ROWS, 0)
+        self.offset = min(max(offset, 0), last)
 
-class SelectContactUI:
-
-    """
-        A window to select a contact to try and connect to. 
-    """
+        self.window["SCROLL"].update(value=last - self.offset)
+        self.show()
 
-    def __init__(self) -> None:
-        self.contacts = []
-        self.window = self.make_window()
+    def show(self) -> None:
 
-    @staticmethod
-    def make_window() -> sg.Window:
-        layout =    [
-                        [sg.Listbox(values=[], key="CONTACT_DISPLAY", 
-                         expand_x=True, expand_y=True)],
-                         [sg.Button("Connect to selected")]
-                    ]
-
-        return sg.Window("Contacts", layout, size=(300, 400))
+        """
+            Hands the visible rows to the listbox.
+        """
 
-    def get_contacts(self) -> None:
-        with open(".\Code\src\contacts.csv", "r") as csv_file:
-            reader = csv.reader(csv_file)
+        contacts = self.index.contacts
+        visible = self.matches[self.offset:self.offset + self.ROWS]
 
-            for row in reader:
-                if row != []:
-                    self.contacts.append(Contact(row[0], row[1], int(row[2])))
+        self.window["CONTACT_DISPLAY"].update(
+                                    values=[contacts[i] for i in visible])
 
     def run(self) -> Optional[tuple]:
         """
@@ -109,22 +94,36 @@ class SelectContactUI:
             is returned.
         """
         self.get_contacts()
-        init = False
-        while True:
-            if init is True:
-                event, values = self.window.read()
-            else:
-                event, values = self.window.read(10)
 
-            if init is False:
+        self.window["CONTACT_DISPLAY"].bind("<MouseWheel>", "_Wheel")
+        self.window["CONTACT_DISPLAY"].bind("<Button-4>", "_Up")
+        self.window["CONTACT_DISPLAY"].bind("<Button-5>", "_Down")
 
-                self.window["CONTACT_DISPLAY"].update(values = self.contacts)
-                init = True
-                continue
+        self.filter("")
+
+        while True:
+            event, values = self.window.read()
 
             if event == sg.WIN_CLOSED:
                 break
 
+            if event == "FILTER":
+                self.filter(values["FILTER"])
+
+            if event == "SCROLL":
+                last = max(len(self.matches) - self.ROWS, 0)
+                self.scroll(last - int(values["SCROLL"]))
+
+            if event == "CONTACT_DISPLAY_Wheel":
+                delta = self.window["CONTACT_DISPLAY"].user_bind_event.delta
+                self.scroll(self.offset - (3 if delta > 0 else -3))
+
+            if event == "CONTACT_DISPLAY_Up":
+                self.scroll(self.offset - 3)
+
+            if event == "CONTACT_DISPLAY_Down":
+                self.scroll(self.offset + 3)
+
             if (event == "Connect to selected" 
                             and len(values["CONTACT_DISPLAY"]) == 1):
                                 
@@ -133,6 +132,8 @@ class SelectContactUI:
                 self.window.close()
                 return contact.contact_connection
 
+        self.window.close()
+
 
 class ShowContactsUI:
     
@@ -140,7 +141,13 @@ class ShowContactsUI:
         A window to display contacts in list.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, repository: ContactRepository) -> None:
+
+        assert isinstance(repository, ContactRepository), (f"The given"
+                    f" repository {repository} is not of type"
+                     " ContactRepository!")
+
+        self.repository = repository
         self.contacts = []
         self.window = self.make_window()
 
@@ -154,12 +161,7 @@ class ShowContactsUI:
         return sg.Window("Contacts", layout, size=(300, 400))
 
     def get_contacts(self) -> None:
-        with open(".\Code\src\contacts.csv", "r") as csv_file:
-            reader = csv.reader(csv_file)
-
-            for row in reader:
-                if row != []:
-                    self.contacts.append(Contact(row[0], row[1], int(row[2])))
+        self.contacts = self.repository.all()
 
     def run(self) -> None:
         self.get_contacts()
@@ -187,7 +189,14 @@ class NewContactUI:
         A window to create a new contact.
     """
 
-    def __init__(self) -> None: # Pass in theme later?
+    def __init__(self, repository: ContactRepository) -> None:
+        # Pass in theme later?
+
+        assert isinstance(repository, ContactRepository), (f"The given"
+                    f" repository {repository} is not of type"
+                     " ContactRepository!")
+
+        self.repository = repository
         self.window = self.make_window()
 
     @staticmethod
@@ -208,16 +217,6 @@ class NewContactUI:
 
         return sg.Window("New Contact", layout, size=(300, 125))  
 
-    @staticmethod
-    def save_contact(contact: Contact) -> None:
-        """
-            Writes the new contact to file.
-        """
-        with open(".\Code\src\contacts.csv", "a") as csv_file:
-            writer = csv.writer(csv_file)
-            row = [fld for fld in repr(contact).split(",")]
-            writer.writerow(row)
-
     def run(self) -> None:
         """
             Runs the new contact window.
@@ -228,6 +227,7 @@ class NewContactUI:
             self.window["OUTPUT"].update("")
 
             if event == sg.WIN_CLOSED:
+                self.repository.flush() # Save every contact created
                 break
 
             if event == "Create":
@@ -235,13 +235,15 @@ class NewContactUI:
                     and values["ADDRESS"] != "" 
                     and values["PORT"] != ""):
                     try:
-                        new_contact = Contact(values["NAME"], 
+                        new_contact = self.repository.add(values["NAME"], 
                                                 values["ADDRESS"],
                                                 int(values["PORT"]))
                         
-                        self.save_contact(new_contact)
-
-                        self.window["OUTPUT"].update("New contact added")
+                        if new_contact is None:
+                            self.window["OUTPUT"].update("Contact already"
+                                                         " exists")
+                        else:
+                            self.window["OUTPUT"].update("New contact added")
                     except ValueError:
                         self.window["OUTPUT"].update("Port needs to be integer")
                 else:
@@ -0,0 +1,143 @@
+import time
+import zlib
+from src.core.protocol import (encode_frame, ProtocolError, MAX_PAYLOAD,
+                               MSG_CHAT, MSG_CHAT_Z)
+
+
+THRESHOLD = 128 # Messages shorter than this many bytes are sent raw
+LEVEL = 1       # Fastest level, chat text still shrinks to about 40%
+
+# Every sync flush ends with these bytes, they are left off the wire
+SYNC_TAIL = b"\x00\x00\xff\xff"
+
+
+class CompressionStats:
+
+    """
+        Byte counts and CPU time of the chat codec of one connection.
+    """
+
+    __slots__ = ("sent", "compressed", "sent_raw", "sent_wire", "received",
+                 "received_raw", "received_wire", "cpu")
+
+    def __init__(self) -> None:
+        self.sent = 0          # Messages sent
+        self.compressed = 0    # Messages sent compressed
+        self.sent_raw = 0      # Bytes of sent messages before compression
+        self.sent_wire = 0     # Bytes of sent payloads
+        self.received = 0      # Messages received
+        self.received_raw = 0  # Bytes of received messages after inflating
+        self.received_wire = 0 # Bytes of received payloads
+        self.cpu = 0.0         # Seconds spent compressing and decompressing
+
+    @property
+    def ratio(self) -> float:
+
+        """
+            Sent payload bytes per message byte, 1.0 if nothing was sent.
+        """
+
+        return self.sent_wire / self.sent_raw if self.sent_raw else 1.0
+
+    def summary(self) -> str:
+
+        """
+            Returns the stats as one line of text.
+        """
+
+        return (f"Sent {self.sent} messages ({self.compressed} compressed),"
+                f" {self.sent_raw} -> {self.sent_wire} bytes"
+                f" ({self.ratio:.0%}). Received {self.received} messages,"
+                f" {self.received_wire} -> {self.received_raw} bytes."
+                f" Codec CPU {self.cpu * 1000:.1f} ms")
+
+
+class ChatCodec:
+
+    """
+        Turns chat messages into frames and back for one connection. When
+        compression is negotiated, messages of at least threshold bytes
+        are sent through a zlib stream that lives as long as the
+        connection, so words repeated across messages compress too. Each
+        message is sync flushed so it can be read as soon as it arrives.
+        The stream depends on frame order, which the send queue and the
+        read loop keep.
+    """
+
+    def __init__(self, compress: bool = False, threshold: int = THRESHOLD,
+                                               level: int = LEVEL) -> None:
+
+        assert isinstance(threshold, int) and threshold >= 0, (f"The given"
+                                        f" threshold {threshold} is not a"
+                                         " non-negative int!")
+
+        self.compress = compress
+        self.threshold = threshold
+
+        self.stats = CompressionStats()
+
+        self.__compressor = zlib.compressobj(level) if compress else None
+        self.__decompressor = zlib.decompressobj()
+
+    def encode(self, msg: str) -> bytes:
+
+        """
+            Returns the frame of a chat message.
+        """
+
+        data = msg.encode()
+        stats = self.stats
+
+        # Checked before the shared compressor sees it, the peer could not
+        # take it either way
+        if len(data) > MAX_PAYLOAD:
+            raise ProtocolError(f"Message of {len(data)} bytes is too large!")
+
+        stats.sent += 1
+        stats.sent_raw += len(data)
+
+        if self.__compressor is None or len(data) < self.threshold:
+            stats.sent_wire += len(data)
+            return encode_frame(MSG_CHAT, data)
+
+        start = time.thread_time()
+
+        payload = (self.__compressor.compress(data)
+                   + self.__compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+        stats.cpu += time.thread_time() - start
+        stats.compressed += 1
+        stats.sent_wire += len(payload)
+
+        return encode_frame(MSG_CHAT_Z, payload)
+
+    def decode(self, msg_type: int, payload: bytes) -> str:
+
+        """
+            Returns the message carried by a MSG_CHAT or MSG_CHAT_Z frame.
+        """
+
+        stats = self.stats
+
+        stats.received += 1
+        stats.received_wire += len(payload)
+
+        if msg_type == MSG_CHAT_Z:
+            start = time.thread_time()
+
+            try:
+                data = self.__decompressor.decompress(payload + SYNC_TAIL,
+                                                      MAX_PAYLOAD)
+            except zlib.error as e:
+                raise ProtocolError(f"Compressed message is corrupt: {e}!")
+
+            if self.__decompressor.unconsumed_tail:
+                raise ProtocolError("Compressed message is too large!")
+
+            stats.cpu += time.thread_time() - start
+        else:
+            data = payload
+
+        stats.received_raw += len(data)
+
+        return data.decode()
@@ -0,0 +1,698 @@
+import asyncio
+import os
+import random
+import socket
+from src.core.engine import NetworkEngine
+from src.logger import Logger
+from src.core.sendqueue import SendQueue, MAX_BATCH, LINGER
+from src.core.compression import ChatCodec, THRESHOLD
+from src.core.metrics import ConnectionMetrics
+from src.core.resolver import Resolver
+from src.core.delivery import Delivery, WINDOW
+from src.core.outbox import OutboxFile
+from src.core.events import (Emit, EVENT_MESSAGES, EVENT_CLOSED,
+                             EVENT_CONNECTED, EVENT_FAILED,
+                             EVENT_RECONNECTING, EVENT_DELIVERED)
+from src.core.protocol import (FrameDecoder, ProtocolError, encode_frame,
+                               encode_hello, encode_hello_ack,
+                               decode_hello_ack, encode_ack, MSG_CHAT,
+                               MSG_CHAT_Z, MSG_CLOSE, MSG_HELLO_ACK,
+                               MSG_HEARTBEAT, MSG_SYNC, MSG_ACK, FEATURE_ZLIB,
+                               FEATURE_HEARTBEAT, FEATURE_ACK)
+
+
+CONNECT_TIMEOUT = 30 # Seconds to wait for the other side
+READ_SIZE = 65536    # Bytes read from the socket at once
+HANDSHAKE_TIMEOUT = 5 # Seconds to wait for the hello of the other side
+
+CONNECT_WINDOW = 10   # Seconds a new conversation tries before it fails
+RECONNECT_WINDOW = 60 # Seconds a lost conversation tries before it fails
+ATTEMPT_TIMEOUT = 3   # Seconds one connect attempt may take
+BACKOFF_BASE = 0.25   # Seconds before the first retry, doubled every retry
+BACKOFF_MAX = 5       # Seconds between retries at most
+STAGGER = 0.25        # Seconds before the next address is tried too
+
+HEARTBEAT_INTERVAL = 2 # Seconds of sending nothing before a heartbeat
+HEARTBEAT_MISSES = 3   # Intervals without a frame before the peer is lost
+
+# Probes of the OS, for peers that do not send heartbeats
+KEEPALIVE_IDLE = 10    # Seconds of silence before the first probe
+KEEPALIVE_INTERVAL = 3 # Seconds between probes
+KEEPALIVE_COUNT = 3    # Unanswered probes before the socket fails
+
+HEARTBEAT = encode_frame(MSG_HEARTBEAT)
+
+
+def backoff(attempt: int) -> float:
+
+    """
+        Returns the seconds to wait before the given retry, counted from
+        0. The delay doubles up to BACKOFF_MAX and half of it is random,
+        so peers that lost each other at once do not retry in step.
+    """
+
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+async def connect_first(addresses: list, port: int,
+                        stagger: float = STAGGER) -> tuple:
+
+    """
+        Connects to whichever address answers first, Happy Eyeballs
+        style. The next address is tried stagger seconds after the last
+        one, or at once when an attempt fails. The other attempts are
+        cancelled once one succeeds. Returns (reader, writer), raises
+        OSError if every address fails.
+    """
+
+    waiting = list(addresses)
+    pending = set()
+    errors = []
+
+    try:
+        while waiting or pending:
+            if waiting:
+                pending.add(asyncio.create_task(
+                            asyncio.open_connection(waiting.pop(0), port)))
+
+            done, pending = await asyncio.wait(pending,
+                                    timeout=stagger if waiting else None,
+                                    return_when=asyncio.FIRST_COMPLETED)
+
+            connected = None
+
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                elif connected is None:
+                    connected = task.result()
+                else:
+                    task.result()[1].close() # Finished at the same time
+
+            if connected is not None:
+                return connected
+
+    finally:
+        for task in pending:
+            task.cancel()
+
+    raise OSError(f"Could not connect to any of {addresses}: {errors}")
+
+
+def set_keepalive(writer: asyncio.StreamWriter) -> None:
+
+    """
+        Turns TCP keepalive on for the socket of the writer, with the
+        probe timing set where the platform allows it.
+    """
+
+    sock = writer.get_extra_info("socket")
+
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        for name, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+                            ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                            ("TCP_KEEPCNT", KEEPALIVE_COUNT)):
+            if hasattr(socket, name):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name),
+                                value)
+
+    except OSError as e:
+        print(f"Could not set keepalive: {e}!")
+
+
+async def read_frame(reader: asyncio.StreamReader, decoder: FrameDecoder,
+                     backlog: list) -> tuple:
+
+    """
+        Returns the next (type, payload) frame from the connection. Frames
+        decoded together with it are kept in backlog for the next call.
+        Returns (None, None) if the socket closes.
+    """
+
+    while not backlog:
+        data = await reader.read(READ_SIZE)
+        if data == b"":
+            return (None, None)
+
+        backlog.extend(decoder.feed(data))
+
+    return backlog.pop(0)
+
+
+async def read_loop(reader: asyncio.StreamReader, decoder: FrameDecoder,
+                    emit: Emit, logger: Logger, owner,
+                    backlog: list = None, codec: ChatCodec = None,
+                    metrics: ConnectionMetrics = None,
+                    idle: float = None, delivery: Delivery = None) -> bool:
+
+    """
+        Reads from the connection until it closes. Every chat message
+        decoded from one read is emitted as one event, tagged
+        with owner.key, the key of the conversation at that moment. Frames
+        already decoded during a handshake are given in backlog. Messages
+        are decoded by codec and counted into metrics when given. If idle
+        is given, the connection is lost when nothing arrives for that
+        many seconds. With delivery, chat frames are sequenced, messages
+        received twice are dropped and owner._acknowledge is called after
+        every read.
+
+        Returns True if the peer closed the connection with a close
+        frame, False if the connection was lost.
+    """
+
+    frames = backlog or []
+
+    try:
+        while True:
+            if not frames:
+                if idle is None:
+                    data = await reader.read(READ_SIZE)
+                else:
+                    data = await asyncio.wait_for(reader.read(READ_SIZE),
+                                                  timeout=idle)
+
+                if data == b"":
+                    # Peer closed the socket without sending a close frame
+                    return False
+
+                if metrics is not None:
+                    metrics.bytes_in += len(data)
+
+                frames = decoder.feed(data)
+
+            messages = []
+            acked = 0
+            close = False
+
+            for msg_type, payload in frames:
+                if msg_type in (MSG_CHAT, MSG_CHAT_Z):
+                    # Duplicates are decoded too, the zlib stream needs them
+                    if codec is not None:
+                        msg = codec.decode(msg_type, payload)
+                    elif msg_type == MSG_CHAT:
+                        msg = payload.decode()
+                    else:
+                        continue
+
+                    if delivery is None or delivery.receive():
+                        messages.append(msg)
+
+                elif msg_type == MSG_CLOSE:
+                    print("Connection terminated by peer")
+                    close = True
+                    break
+
+                elif delivery is None:
+                    continue
+
+                elif msg_type == MSG_SYNC:
+                    delivery.sync(payload)
+
+                elif msg_type == MSG_ACK:
+                    acked += delivery.ack(payload)
+
+            frames = []
+
+            if messages:
+                if metrics is not None:
+                    metrics.messages_in += len(messages)
+
+                emit(EVENT_MESSAGES, (owner.key, messages))
+
+            if delivery is not None:
+                owner._acknowledge(acked)
+
+            if close:
+                return True
+
+    except asyncio.TimeoutError:
+        print("Peer stopped answering")
+        return False
+
+    except Exception as e:
+        logger.log.error("Exception during read_loop: %s!", e)
+        return False
+
+
+class Connection:
+
+    """
+        A single full duplex connection to a peer. Both sides listen on
+        their server port and try to connect to the other side at the same
+        time. A hello handshake decides which socket is kept, so it works
+        when only one of the sides can accept connections. Incoming
+        connections are accepted by the ConnectionManager and handed over
+        with accept. A lost connection is dialed again the same way, and
+        messages sent while it is down are sent once it is back.
+
+        Must be created on the engine loop.
+    """
+
+    def __init__(self, emit: Emit, logger: Logger, key: str,
+                        ip: str, engine: NetworkEngine, c_port: int = 1500,
+                        s_port: int = 1500, nodelay: bool = True,
+                        max_batch: int = MAX_BATCH, linger: float = LINGER,
+                        compress: bool = True,
+                        threshold: int = THRESHOLD,
+                        heartbeat: float = HEARTBEAT_INTERVAL,
+                        misses: int = HEARTBEAT_MISSES,
+                        reconnect: float = RECONNECT_WINDOW,
+                        resolver: Resolver = None,
+                        window: int = WINDOW,
+                        store: OutboxFile = None) -> None:
+
+        """
+            Initializes a single connection object. nodelay, max_batch and
+            linger control how outgoing messages are batched, see SendQueue.
+            Messages of at least threshold bytes are compressed if compress
+            is set and the peer supports it, see ChatCodec. If the peer
+            supports heartbeats, one is sent after heartbeat seconds of
+            quiet, and the peer is lost after misses heartbeats did not
+            come. Both sides should use the same interval. A lost
+            connection is dialed for reconnect seconds before it fails.
+            Names are resolved by resolver, a shared one saves lookups.
+            If the peer acknowledges messages, at most window of them are
+            sent ahead of the acknowledgements. Messages are kept in store
+            until acknowledged, see Delivery.
+        """
+
+        # Parameter validation
+        assert callable(emit), f"The given emit {emit} is not callable!"
+
+        assert isinstance(logger, Logger), (f"The given logger {logger}"
+                                            " is not of type Logger!")
+
+        assert isinstance(key, str), (f"The given key {key} is not"
+                                        " of type str!")
+
+        assert isinstance(ip, str), (f"The given ip {ip} is not of type str!")
+
+        assert isinstance(engine, NetworkEngine), (f"The given engine {engine}"
+                                            " is not of type NetworkEngine!")
+
+        assert isinstance(c_port, int), (f"The given client port {c_port}"
+                                         " is not of type int!")
+
+        assert isinstance(s_port, int), (f"The given server port {s_port}"
+                                        " is not of type int!")
+
+        assert heartbeat > 0, (f"The given heartbeat {heartbeat} is not"
+                                " positive!")
+
+        assert isinstance(misses, int) and misses > 0, (f"The given misses"
+                                    f" {misses} is not a positive int!")
+
+        # Setting instance attributes
+        self.key = key # Conversation this connection belongs to
+
+        self.server_port = s_port
+
+        if ip == "localhost":
+            self.client = (socket.gethostname(), c_port)
+        else:
+            self.client = (ip, c_port)
+
+        self.addresses = {ip} # Every address the peer is known by
+        self.resolver = resolver if resolver is not None else Resolver()
+
+        self.emit = emit # Receives the events
+        self.engine = engine
+        self.logger = logger # Used to log errors
+
+        self.nonce = os.urandom(8) # Breaks ties if both sides connect at once
+
+        self.nodelay = nodelay
+        self.max_batch = max_batch
+        self.linger = linger
+
+        # Offered in hellos
+        self.features = (FEATURE_HEARTBEAT | FEATURE_ACK
+                         | (FEATURE_ZLIB if compress else 0))
+        self.threshold = threshold
+
+        self.heartbeat = heartbeat
+        self.misses = misses
+        self.reconnect = reconnect
+
+        self.reader = None
+        self.writer = None
+        self.queue = None # Outgoing frames, drained by the engine loop
+        self.codec = None # Chat messages, set up with the agreed features
+        self.metrics = ConnectionMetrics()
+        # Outgoing messages wait here
+        self.delivery = Delivery(window, store,
+                                 latency=self.metrics.ack_latency)
+
+        self.__chosen = engine.loop.create_future() # Set to the kept socket
+        self.__pending = set() # Writers of outgoing hellos not yet answered
+
+        self.__sequenced = False # Whether the peer acknowledges messages
+        self.__sent = False     # Whether a message went out this interval
+        self.__closing = False  # Set by _close, stops reconnecting
+
+    async def resolve(self) -> None:
+
+        """
+            Adds every address of the peer, so incoming connections from
+            it can be recognized.
+        """
+
+        try:
+            self.addresses.update(await self.resolver.resolve(self.client[0]))
+
+        except OSError as e:
+            self.logger.log.error("Could not resolve %s: %s!",
+                                  self.client[0], e)
+
+    async def open_connection(self) -> None:
+
+        """
+            Connects, then reads from the connection until it closes. A
+            lost connection is dialed again until the reconnect window has
+            passed. The outcome is emitted as events.
+        """
+
+        window = CONNECT_WINDOW
+
+        while True:
+            chosen = await self.__choose(window)
+            if chosen is None:
+                return
+
+            if await self.__session(*chosen) or self.__closing:
+                self.emit(EVENT_CLOSED, self.key)
+                return
+
+            print("Connection lost, reconnecting")
+            self.metrics.reconnects += 1
+            self.emit(EVENT_RECONNECTING, self.key)
+
+            self.__chosen = self.engine.loop.create_future()
+            window = self.reconnect
+
+    async def __choose(self, window: float) -> tuple:
+
+        """
+            Connects until one connection is agreed on or window seconds
+            have passed. Returns what the handshake gave, or None after
+            emitting why there is no connection.
+        """
+
+        if self.__closing:
+            self.emit(EVENT_CLOSED, self.key)
+            return None
+
+        connector = asyncio.create_task(self.__connect())
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.__chosen),
+                                          timeout=window)
+
+        except asyncio.CancelledError:
+            # Closed before a connection was agreed on
+            self.emit(EVENT_CLOSED, self.key)
+
+        except asyncio.TimeoutError:
+            print("Connection timed out")
+            self.metrics.timeouts += 1
+            self.emit(EVENT_FAILED, self.key)
+
+        except Exception as e:
+            print(f"Exception during connection: {e}!")
+            self.logger.log.error("Exception during connection: %s!", e)
+            self.emit(EVENT_FAILED, self.key)
+
+        finally:
+            connector.cancel()
+
+        return None
+
+    async def __session(self, reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter, decoder: FrameDecoder,
+                        backlog: list, features: int) -> bool:
+
+        """
+            Sends the messages that were not sent or not acknowledged,
+            then reads from the agreed connection until it ends. Returns
+            True if the peer closed it.
+        """
+
+        self.reader, self.writer = reader, writer
+
+        set_keepalive(writer)
+
+        self.queue = SendQueue(writer, self.logger,
+                               max_batch=self.max_batch, linger=self.linger,
+                               nodelay=self.nodelay, metrics=self.metrics)
+
+        self.codec = ChatCodec(compress=bool(features & FEATURE_ZLIB),
+                               threshold=self.threshold)
+
+        print("Connected to", writer.get_extra_info("peername"))
+        self.emit(EVENT_CONNECTED, self.key)
+
+        self.__sequenced = bool(features & FEATURE_ACK)
+        sync = self.delivery.restart()
+
+        if self.__sequenced:
+            self.queue.put(sync)
+
+        self.__pump()
+
+        heartbeat = None
+        idle = None
+        delivery = self.delivery if self.__sequenced else None
+
+        if features & FEATURE_HEARTBEAT:
+            heartbeat = asyncio.create_task(self.__beat(self.queue))
+            idle = self.heartbeat * self.misses
+
+        try:
+            return await read_loop(reader, decoder, self.emit, self.logger,
+                                   self, backlog, self.codec, self.metrics,
+                                   idle, delivery)
+
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+
+            if not self.__closing:
+                # _close shuts a connection it closes down itself
+                self.queue.abort()
+                writer.close()
+
+                self.reader = self.writer = self.queue = None
+
+    async def __beat(self, queue: SendQueue) -> None:
+
+        """
+            Sends a heartbeat after every interval in which nothing else
+            was sent, so the peer can tell a quiet connection from a dead
+            one.
+        """
+
+        while True:
+            await asyncio.sleep(self.heartbeat)
+
+            if not self.__sent:
+                queue.put(HEARTBEAT)
+
+            self.__sent = False
+
+    async def __connect(self) -> None:
+
+        """
+            Connects to the other side, retrying with backoff until a
+            connection has been chosen. The connecting side sends the first
+            hello.
+        """
+
+        attempt = 0
+
+        host, port = self.client
+
+        while not self.__chosen.done():
+            try:
+                addresses = await self.resolver.resolve(host)
+                self.addresses.update(addresses)
+
+                reader, writer = await asyncio.wait_for(
+                                    connect_first(addresses, port),
+                                    timeout=ATTEMPT_TIMEOUT)
+
+            except (OSError, asyncio.TimeoutError) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.metrics.timeouts += 1
+
+                self.metrics.retries += 1
+                await asyncio.sleep(backoff(attempt))
+                attempt += 1
+                continue
+
+            if self.__chosen.done():
+                writer.close()
+                return
+
+            decoder = FrameDecoder()
+            backlog = []
+
+            self.__pending.add(writer)
+            try:
+                writer.write(encode_hello(self.nonce, self.server_port,
+                                          self.features))
+
+                msg_type, payload = await asyncio.wait_for(
+                                    read_frame(reader, decoder, backlog),
+                                    timeout=HANDSHAKE_TIMEOUT)
+
+                if msg_type == MSG_HELLO_ACK:
+                    features = decode_hello_ack(payload) & self.features
+
+            except asyncio.TimeoutError:
+                self.metrics.timeouts += 1
+                msg_type = None
+
+            except (OSError, ProtocolError):
+                msg_type = None
+
+            finally:
+                self.__pending.discard(writer)
+
+            if msg_type == MSG_HELLO_ACK and not self.__chosen.done():
+                self.__chosen.set_result((reader, writer, decoder, backlog,
+                                          features))
+                return
+
+            # Rejected, the connection from the other side is used instead
+            writer.close()
+            self.metrics.retries += 1
+            await asyncio.sleep(backoff(attempt))
+            attempt += 1
+
+    def accept(self, reader: asyncio.StreamReader,
+               writer: asyncio.StreamWriter, decoder: FrameDecoder,
+               backlog: list, nonce: bytes, features: int = 0) -> bool:
+
+        """
+            Answers the hello of a connecting peer. The connection is kept
+            unless one is already chosen, or our own hello is waiting for an
+            answer and our nonce is the lower one. Returns True if kept.
+            The answer carries the features both sides support.
+        """
+
+        if self.__chosen.done() or (self.__pending and self.nonce < nonce):
+            writer.write(encode_frame(MSG_CLOSE))
+            writer.close()
+            return False
+
+        features &= self.features
+        writer.write(encode_hello_ack(features))
+
+        for pending in self.__pending:
+            pending.close() # Our own attempt lost the tie break
+
+        self.__chosen.set_result((reader, writer, decoder, backlog, features))
+        return True
+
+    async def _close(self) -> None:
+
+        """
+            Sends the close frame and closes the socket on the loop.
+        """
+
+        self.__closing = True
+
+        if not self.__chosen.done():
+            self.__chosen.cancel() # Stops connecting
+
+        if self.queue is None:
+            return
+
+        self.queue.put(encode_frame(MSG_CLOSE))
+
+        try:
+            await self.queue.close(timeout=1)
+        finally:
+            self.writer.close()
+
+    def send(self, msg: str) -> None:
+
+        """
+            Queues a message for the other side, must be called on the
+            engine loop. While not connected, or while the window is full,
+            the message waits in the delivery outbox.
+        """
+
+        self.delivery.add(msg)
+        self.__pump()
+
+    def _use_store(self, store: OutboxFile) -> None:
+
+        """
+            Moves the conversation onto the given outbox, see
+            Delivery.use_store. Acknowledgements still on the way count in
+            the old numbers, so with messages in flight the connection is
+            dropped and the new numbers start on the next one.
+        """
+
+        in_flight = bool(self.delivery.unacked)
+        self.delivery.use_store(store)
+
+        if self.queue is None:
+            return
+
+        if self.__sequenced:
+            if in_flight:
+                self.writer.close() # Dialed again like a lost connection
+                return
+
+            self.queue.put(self.delivery.restart())
+
+        self.__pump()
+
+    def __pump(self) -> None:
+
+        """
+            Sends the waiting messages the window has room for. Without
+            acknowledgements a message counts as delivered once queued.
+        """
+
+        if self.queue is None:
+            return
+
+        messages = self.delivery.take(self.__sequenced)
+
+        if not messages:
+            return
+
+        for msg in messages:
+            self.queue.put(self.codec.encode(msg))
+
+        self.metrics.messages_out += len(messages)
+        self.__sent = True
+
+        if not self.__sequenced:
+            self.emit(EVENT_DELIVERED, (self.key, len(messages)))
+
+    def _acknowledge(self, acked: int) -> None:
+
+        """
+            Called by the read loop after every read. Acknowledges the
+            chat messages received, and sends more of ours when the peer
+            acknowledged some.
+        """
+
+        if self.delivery.ack_due and self.queue is not None:
+            self.delivery.ack_due = False
+            self.queue.put(encode_ack(self.delivery.received))
+
+        if acked:
+            self.emit(EVENT_DELIVERED, (self.key, acked))
+            self.__pump()
@@ -0,0 +1,268 @@
+import csv
+import os
+from bisect import bisect_left
+from typing import Optional
+
+# Kept next to the source files
+CONTACTS_PATH = os.path.join(os.path.dirname(os.path.dirname(
+                                        os.path.abspath(__file__))),
+                             "contacts.csv")
+
+
+class Contact:
+    
+    """
+        Contact object contains name, address and port. Values are checked
+        once by ContactRepository.add, not on every access.
+    """
+
+    __slots__ = ("name", "address", "port")
+
+    def __init__(self, name: str, address: str, port: int = 1500) -> None:
+        self.name = name
+        self.address = address
+        self.port = port
+
+    @property
+    def contact_connection(self) -> tuple:
+        """
+            This is used to get name address and port to connect to.
+        """
+        return (self.name, self.address, self.port)
+
+    def __repr__(self) -> str:
+        """
+            Used when writing contact to csv file
+        """
+        return f"{self.name},{self.address},{self.port}"
+
+    def __str__(self) -> str:
+        return f"{self.name}: \n{self.address}:{self.port}"
+
+
+class ContactRepository:
+
+    """
+        Every contact, loaded from the csv file once and indexed by name
+        and by address and port. The file is read again only when its
+        modification time changes, and new contacts are appended to it in
+        one batch by flush.
+    """
+
+    def __init__(self, path: str = CONTACTS_PATH) -> None:
+
+        assert isinstance(path, str), (f"The given path {path} is not of"
+                                        " type str!")
+
+        self.path = path
+
+        self.__contacts = []   # In file order
+        self.__by_name = {}    # Name -> Contact
+        self.__by_address = {} # (address, port) -> Contact
+        self.__unsaved = []    # Added contacts not yet written to file
+        self.__mtime = None    # Modification time of the loaded file
+
+        self.version = 0       # Changes whenever the contacts change
+        self.__index_cache = None
+
+        self.reload()
+
+    def __len__(self) -> int:
+        self.reload()
+        return len(self.__contacts)
+
+    def __mtime_of_file(self) -> float:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self) -> None:
+
+        """
+            Reads the file again if it changed since it was loaded.
+        """
+
+        mtime = self.__mtime_of_file()
+        if mtime == self.__mtime:
+            return
+
+        self.__contacts = []
+        self.__by_name = {}
+        self.__by_address = {}
+
+        if mtime is not None:
+            with open(self.path, "r", newline="") as csv_file:
+                for row in csv.reader(csv_file):
+                    if len(row) != 3:
+                        continue
+                    try:
+                        self.__index(Contact(row[0], row[1], int(row[2])))
+                    except ValueError:
+                        pass # Skip rows with a broken port
+
+        for contact in self.__unsaved:
+            self.__index(contact)
+
+        self.__mtime = mtime
+        self.version += 1
+
+    def __index(self, contact: Contact) -> bool:
+
+        """
+            Adds the contact to the indexes, returns False if the name or
+            the address and port is already used.
+        """
+
+        address = (contact.address, contact.port)
+
+        if contact.name in self.__by_name or address in self.__by_address:
+            return False
+
+        self.__contacts.append(contact)
+        self.__by_name[contact.name] = contact
+        self.__by_address[address] = contact
+        return True
+
+    def all(self) -> list:
+
+        """
+            Returns every contact in file order.
+        """
+
+        self.reload()
+        return self.__contacts
+
+    def get(self, name: str) -> Optional[Contact]:
+
+        """
+            Returns the contact with the given name.
+        """
+
+        self.reload()
+        return self.__by_name.get(name)
+
+    def find(self, address: str, port: int) -> Optional[Contact]:
+
+        """
+            Returns the contact at the given address and port.
+        """
+
+        self.reload()
+        return self.__by_address.get((address, port))
+
+    def add(self, name: str, address: str, port: int) -> Optional[Contact]:
+
+        """
+            Adds a new contact, it is written to file by flush. Returns
+            None if the name or address and port is already used.
+        """
+
+        assert isinstance(name, str), (f"The given name {name} is not of type"
+                                        " string!")
+
+        assert isinstance(address, str), (f"The given address {address} is"
+                                            " not of type string!")
+
+        assert isinstance(port, int), (f"The given port number {port} is not"
+                                        " of type int!")
+
+        self.reload()
+
+        contact = Contact(name, address, port)
+        if not self.__index(contact):
+            return None
+
+        self.__unsaved.append(contact)
+        self.version += 1
+        return contact
+
+    def index(self) -> "ContactIndex":
+
+        """
+            Returns the search index of the contacts, rebuilt only after
+            they changed.
+        """
+
+        self.reload()
+
+        if (self.__index_cache is None
+            or self.__index_cache.version != self.version):
+            self.__index_cache = ContactIndex(self.__contacts, self.version)
+
+        return self.__index_cache
+
+    def flush(self) -> None:
+
+        """
+            Appends every added contact to the file.
+        """
+
+        if not self.__unsaved:
+            return
+
+        self.reload() # Pick up changes made by someone else first
+
+        with open(self.path, "a", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerows([contact.name, contact.address, contact.port]
+                             for contact in self.__unsaved)
+
+        self.__unsaved = []
+        self.__mtime = self.__mtime_of_file() # Our own write, no reload
+
+
+class ContactIndex:
+
+    """
+        Prefix index over the names and addresses of contacts. Both are
+        kept as sorted keys with a parallel list of contact positions, so
+        the matches of a prefix are found with two binary searches and
+        copied out with one slice.
+    """
+
+    def __init__(self, contacts: list, version: int = 0) -> None:
+        self.contacts = contacts
+        self.version = version # Repository version the index was built from
+
+        self.__names, self.__name_positions = self.__build(
+                [contact.name.lower() for contact in contacts])
+
+        self.__addresses, self.__address_positions = self.__build(
+                [f"{contact.address}:{contact.port}".lower()
+                 for contact in contacts])
+
+    @staticmethod
+    def __build(keys: list) -> tuple:
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return [keys[i] for i in order], order
+
+    @staticmethod
+    def __range(keys: list, prefix: str) -> tuple:
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + "\uffff", lo=start)
+        return start, end
+
+    def search(self, text: str):
+
+        """
+            Returns the positions of the contacts whose name or address
+            starts with text, ignoring case. Names match first.
+        """
+
+        prefix = text.strip().lower()
+
+        if prefix == "":
+            return range(len(self.contacts))
+
+        start, end = self.__range(self.__names, prefix)
+        matches = self.__name_positions[start:end]
+
+        start, end = self.__range(self.__addresses, prefix)
+        if start < end:
+            found = set(matches)
+            matches += [position for position
+                        in self.__address_positions[start:end]
+                        if position not in found]
+
+        return matches
@@ -0,0 +1,218 @@
+import os
+import time
+from collections import deque
+from src.core.protocol import (encode_sync, decode_sync, decode_ack,
+                               chat_fits, ProtocolError)
+from src.core.outbox import OutboxFile
+from src.core.metrics import Histogram
+
+
+WINDOW = 1024 # Chat messages sent but not acknowledged at most
+
+
+class Delivery:
+
+    """
+        Sequence numbers, acknowledgements and the send window of the chat
+        messages of one conversation. Kept by the Connection across
+        reconnects, so messages that were not acknowledged are sent again
+        and messages received twice are dropped. Only keeps state, the
+        Connection does the sending.
+
+        Every connection starts with a sync frame from each side, giving
+        the sender's stream id and the sequence number of the next chat
+        frame. The chat frames that follow count up from it, so they carry
+        no number of their own. After each read the receiver acknowledges
+        the highest number it has, which frees the window of the sender.
+
+        With a store, every message is kept on disk until acknowledged,
+        and the messages, numbers and stream id of the store are taken
+        over. Nothing is lost across restarts, and a peer that kept
+        running drops what it already has.
+
+        With latency, the seconds from sending each message until it is
+        acknowledged are observed into it.
+    """
+
+    def __init__(self, window: int = WINDOW, store: OutboxFile = None,
+                        latency: Histogram = None) -> None:
+
+        assert isinstance(window, int) and window > 0, (f"The given window"
+                                        f" {window} is not a positive int!")
+
+        self.window = window
+        self.store = store
+        self.latency = latency
+
+        self.unacked = deque() # (seq, msg) sent, not acknowledged yet
+        self.outbox = deque()  # (seq, msg) not sent yet
+        self.sent_at = deque() # Send time of every unacked message
+
+        if store is None:
+            self.stream = os.urandom(8) # A restarted peer sends a new one
+            self.next_seq = 1
+        else:
+            self.stream = store.stream
+            self.next_seq = store.next_seq
+
+            # Too large ones were saved before sizes were checked
+            self.outbox.extend(record for record in store.pending()
+                               if chat_fits(record[1]))
+
+        self.peer_stream = None
+        self.received = 0 # Highest sequence number of the peer delivered
+        self.expected = 1 # Sequence number of the next chat frame
+        self.ack_due = False # Chat frames came since the last ack
+
+    @property
+    def pending(self) -> int:
+
+        """
+            Messages not acknowledged yet.
+        """
+
+        return len(self.unacked) + len(self.outbox)
+
+    def add(self, msg: str) -> None:
+
+        """
+            Numbers a message and queues it for sending. Raises
+            ProtocolError if it does not fit into a chat frame, before it
+            is saved.
+        """
+
+        if not chat_fits(msg):
+            raise ProtocolError(f"Message of {len(msg.encode())} bytes is"
+                                 " too large!")
+
+        if self.store is not None:
+            self.next_seq = self.store.add(msg)
+
+        self.outbox.append((self.next_seq, msg))
+        self.next_seq += 1
+
+    def use_store(self, store: OutboxFile) -> None:
+
+        """
+            Moves the conversation onto the given store. The messages it
+            kept come first, then those not acknowledged here, numbered
+            again in its stream, and nothing is left in the old store.
+            The peer must get the sync of restart before any more chat
+            frames.
+        """
+
+        moved = list(self.unacked) + list(self.outbox)
+
+        self.unacked.clear()
+        self.sent_at.clear()
+        self.outbox.clear()
+        self.outbox.extend(record for record in store.pending()
+                           if chat_fits(record[1]))
+
+        for _, msg in moved:
+            self.outbox.append((store.add(msg), msg))
+
+        if moved and self.store is not None:
+            self.store.acknowledge(moved[-1][0]) # Safe in the new store
+
+        self.store = store
+        self.stream = store.stream
+        self.next_seq = store.next_seq
+
+    def restart(self) -> bytes:
+
+        """
+            Returns the sync frame that starts a new connection. Messages
+            the old connection did not get acknowledged are sent again.
+        """
+
+        self.outbox.extendleft(reversed(self.unacked))
+        self.unacked.clear()
+        self.sent_at.clear() # Timed again from the next send
+
+        first = self.outbox[0][0] if self.outbox else self.next_seq
+
+        return encode_sync(self.stream, first)
+
+    def take(self, acknowledged: bool = True) -> list:
+
+        """
+            Returns the queued messages the window has room for, in order.
+            Without acknowledgements every message is taken and none is
+            kept, so the store must not send them again either.
+        """
+
+        if not acknowledged:
+            messages = [msg for _, msg in self.outbox]
+
+            if self.outbox and self.store is not None:
+                self.store.acknowledge(self.outbox[-1][0])
+
+            self.outbox.clear()
+            return messages
+
+        messages = []
+        now = time.perf_counter()
+
+        while self.outbox and len(self.unacked) < self.window:
+            item = self.outbox.popleft()
+            self.unacked.append(item)
+            self.sent_at.append(now)
+            messages.append(item[1])
+
+        return messages
+
+    def sync(self, payload: bytes) -> None:
+
+        """
+            Starts counting the chat frames of the peer from its sync.
+        """
+
+        stream, first = decode_sync(payload)
+
+        if stream != self.peer_stream:
+            # New to us, nothing of it was delivered yet
+            self.peer_stream = stream
+            self.received = first - 1
+
+        self.expected = first
+
+    def receive(self) -> bool:
+
+        """
+            Numbers the next chat frame, returns False if it was already
+            delivered before a reconnect.
+        """
+
+        seq = self.expected
+        self.expected += 1
+        self.ack_due = True
+
+        if seq <= self.received:
+            return False
+
+        self.received = seq
+        return True
+
+    def ack(self, payload: bytes) -> int:
+
+        """
+            Drops the acknowledged messages, returns how many there were.
+        """
+
+        seq = decode_ack(payload)
+        count = 0
+        now = time.perf_counter()
+
+        while self.unacked and self.unacked[0][0] <= seq:
+            self.unacked.popleft()
+            sent = self.sent_at.popleft()
+            count += 1
+
+            if self.latency is not None:
+                self.latency.observe(now - sent)
+
+        if count and self.store is not None:
+            self.store.acknowledge(seq)
+
+        return count
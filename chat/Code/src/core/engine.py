@@ -0,0 +1,108 @@
+import asyncio
+from concurrent.futures import Future
+from threading import Thread
+from src.logger import Logger
+
+
+class NetworkEngine:
+
+    """
+        Runs one asyncio event loop on a background thread. Every socket
+        of the program is served by coroutines running on this loop.
+    """
+
+    def __init__(self, logger: Logger) -> None:
+
+        """
+            Initializes the engine, the loop is not started until start
+            is called.
+        """
+
+        assert isinstance(logger, Logger), (f"The given logger {logger}"
+                                            " is not of type Logger!")
+
+        self.logger = logger # Used to log errors
+
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = Thread(target=self.__run, name="NetworkEngine",
+                               daemon=True)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+
+        """
+            The event loop owned by the engine.
+        """
+
+        return self.__loop
+
+    def __run(self) -> None:
+
+        """
+            Target of the engine thread, runs the loop until stopped.
+        """
+
+        asyncio.set_event_loop(self.__loop)
+
+        try:
+            self.__loop.run_forever()
+
+        except Exception as e:
+            print(f"Exception in network engine: {e}!")
+            self.logger.log.error("Exception in network engine: %s!", e)
+
+        finally:
+            self.__loop.close()
+
+    def start(self) -> None:
+
+        """
+            Starts the engine thread.
+        """
+
+        if not self.__thread.is_alive():
+            self.__thread.start()
+
+    def stop(self) -> None:
+
+        """
+            Cancels all running coroutines and stops the loop.
+        """
+
+        if not self.__thread.is_alive():
+            return
+
+        async def shutdown() -> None:
+            tasks = [task for task in asyncio.all_tasks()
+                     if task is not asyncio.current_task()]
+
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            self.submit(shutdown()).result(timeout=5)
+
+        except Exception as e:
+            self.logger.log.error("Exception during engine shutdown: %s!", e)
+
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join(timeout=5)
+
+    def submit(self, coro) -> Future:
+
+        """
+            Schedules a coroutine on the engine loop from any thread and
+            returns a future for its result.
+        """
+
+        return asyncio.run_coroutine_threadsafe(coro, self.__loop)
+
+    def call_soon(self, callback, *args) -> None:
+
+        """
+            Schedules a plain callback on the engine loop from any thread.
+        """
+
+        self.__loop.call_soon_threadsafe(callback, *args)
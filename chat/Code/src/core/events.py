@@ -0,0 +1,27 @@
+from typing import Callable
+
+
+# Receives every event of the core as emit(event, value). The chat window
+# passes its write_event_value, headless programs any callback, such as
+# lambda event, value: queue.put((event, value)).
+Emit = Callable[[str, object], None]
+
+# Kept apart from the networking code, so the window can compare events
+# without importing asyncio before it is shown.
+
+# Events emitted by the network engine, the value is the key of the
+# conversation unless noted
+EVENT_MESSAGES = "-MESSAGES-" # Value is (key, list of received messages)
+EVENT_CLOSED = "-CLOSED-"     # Connection ended by the other user
+EVENT_CONNECTED = "-CONNECTED-" # Single connection is established
+EVENT_FAILED = "-FAILED-"       # Single connection could not be established
+EVENT_RECONNECTING = "-RECONNECTING-" # Connection lost, getting it back
+EVENT_DELIVERED = "-DELIVERED-" # Value is (key, number of own messages)
+
+# File transfer events, the value is (key, file name or path)
+EVENT_FILE_SENT = "-FILE SENT-"
+EVENT_FILE_RECEIVED = "-FILE RECEIVED-"
+EVENT_FILE_FAILED = "-FILE FAILED-"
+# A peer wants to send a file, value is (key, transfer id, name, size). The
+# window answers with ConnectionManager.answer_file.
+EVENT_FILE_OFFER = "-FILE OFFER-"
@@ -0,0 +1,246 @@
+import os
+import queue
+import sqlite3
+import time
+from threading import Thread
+
+
+# Kept next to contacts.csv
+HISTORY_PATH = os.path.join(os.path.dirname(os.path.dirname(
+                                os.path.abspath(__file__))), "history.db")
+
+PAGE_SIZE = 200 # Messages loaded at once
+SEARCH_LIMIT = 100 # Search results returned at most
+
+
+class HistoryStore:
+
+    """
+        Local message history of every contact, stored in SQLite. Messages
+        are indexed by contact and id so the newest page, or the page
+        before a given message, is found without reading the rest. A full
+        text index over the messages is kept up to date by a trigger.
+        Messages given to add_soon are written by a background thread on
+        a connection of its own, so the caller never waits for the disk.
+    """
+
+    def __init__(self, path: str = HISTORY_PATH) -> None:
+
+        assert isinstance(path, str), (f"The given path {path} is not of"
+                                        " type str!")
+
+        self.path = path
+
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL") # fsync at checkpoints
+
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id      INTEGER PRIMARY KEY,
+                contact TEXT    NOT NULL,
+                sent    INTEGER NOT NULL, -- 1 if sent by me
+                time    REAL    NOT NULL, -- Seconds since the epoch
+                text    TEXT    NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_contact
+                ON messages (contact, id);
+        """)
+
+        self.__create_index()
+
+        self.__queue = queue.SimpleQueue() # Rows for the writer thread
+        self.__writer = None # Started by the first add_soon
+
+    def __create_index(self) -> None:
+
+        """
+            Creates the full text index, filling it from existing messages
+            the first time.
+        """
+
+        exists = self.db.execute("SELECT 1 FROM sqlite_master WHERE name ="
+                                 " 'messages_fts'").fetchone()
+
+        with self.db:
+            self.db.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+                    USING fts5(text, content='messages', content_rowid='id');
+
+                CREATE TRIGGER IF NOT EXISTS messages_fts_insert
+                    AFTER INSERT ON messages BEGIN
+                        INSERT INTO messages_fts (rowid, text)
+                            VALUES (new.id, new.text);
+                    END;
+
+                CREATE TRIGGER IF NOT EXISTS messages_fts_delete
+                    AFTER DELETE ON messages BEGIN
+                        INSERT INTO messages_fts (messages_fts, rowid, text)
+                            VALUES ('delete', old.id, old.text);
+                    END;
+            """)
+
+            if exists is None:
+                self.db.execute("INSERT INTO messages_fts (messages_fts)"
+                                " VALUES ('rebuild')")
+
+    def add(self, contact: str, sent: bool, text: str,
+                                timestamp: float = None) -> int:
+
+        """
+            Stores one message and returns its id.
+        """
+
+        return self.add_many(contact, sent, [text], timestamp)
+
+    def add_many(self, contact: str, sent: bool, texts: list,
+                                timestamp: float = None) -> int:
+
+        """
+            Stores messages in one transaction and returns the id of the
+            last one.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO messages (contact, sent, time, text)"
+                " VALUES (?, ?, ?, ?)",
+                [(contact, int(sent), timestamp, text) for text in texts])
+
+        return self.db.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+    def add_soon(self, contact: str, sent: bool, texts: list,
+                                timestamp: float = None) -> None:
+
+        """
+            Stores messages in the background, in the order given. What
+            gathers while a transaction is written goes into the next one.
+            Reads see them once written.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        if self.__writer is None:
+            self.__writer = Thread(target=self.__write, name="HistoryWriter",
+                                   daemon=True)
+            self.__writer.start()
+
+        self.__queue.put([(contact, int(sent), timestamp, text)
+                          for text in texts])
+
+    def __write(self) -> None:
+
+        """
+            Target of the writer thread, runs until close puts None.
+        """
+
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA synchronous=NORMAL")
+
+        try:
+            while True:
+                batch = self.__queue.get()
+                rows = []
+
+                while batch is not None:
+                    rows.extend(batch)
+
+                    try:
+                        batch = self.__queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+                try:
+                    with db:
+                        db.executemany("INSERT INTO messages (contact, sent,"
+                                       " time, text) VALUES (?, ?, ?, ?)",
+                                       rows)
+
+                except sqlite3.Error as e:
+                    print(f"Could not store {len(rows)} messages: {e}!")
+
+                if batch is None:
+                    return
+
+        finally:
+            db.close()
+
+    def page(self, contact: str, before: int = None,
+                                limit: int = PAGE_SIZE) -> list:
+
+        """
+            Returns up to limit messages of the contact older than the
+            message with id before, or the newest ones if before is None.
+            Messages are (id, sent, time, text) tuples, oldest first.
+        """
+
+        if before is None:
+            rows = self.db.execute(
+                    "SELECT id, sent, time, text FROM messages"
+                    " WHERE contact = ? ORDER BY id DESC LIMIT ?",
+                    (contact, limit)).fetchall()
+        else:
+            rows = self.db.execute(
+                    "SELECT id, sent, time, text FROM messages"
+                    " WHERE contact = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                    (contact, before, limit)).fetchall()
+
+        rows.reverse()
+        return rows
+
+    def search(self, words: str, contact: str = None, since: float = None,
+                        until: float = None, limit: int = SEARCH_LIMIT) -> list:
+
+        """
+            Returns up to limit messages containing every given word,
+            newest first, optionally only of one contact and between the
+            since and until times. Messages are (id, contact, sent, time,
+            text) tuples.
+        """
+
+        # Quote every word so user input is never read as query syntax
+        query = " ".join('"' + word.replace('"', '""') + '"'
+                         for word in words.split())
+
+        if not query:
+            return []
+
+        sql = ("SELECT m.id, m.contact, m.sent, m.time, m.text"
+               " FROM messages_fts JOIN messages AS m"
+               " ON m.id = messages_fts.rowid"
+               " WHERE messages_fts MATCH ?")
+        args = [query]
+
+        if contact is not None:
+            sql += " AND m.contact = ?"
+            args.append(contact)
+
+        if since is not None:
+            sql += " AND m.time >= ?"
+            args.append(since)
+
+        if until is not None:
+            sql += " AND m.time < ?"
+            args.append(until)
+
+        sql += " ORDER BY messages_fts.rowid DESC LIMIT ?"
+        args.append(limit)
+
+        return self.db.execute(sql, args).fetchall()
+
+    def close(self) -> None:
+
+        """
+            Writes what add_soon queued and closes the database.
+        """
+
+        if self.__writer is not None:
+            self.__queue.put(None)
+            self.__writer.join()
+            self.__writer = None
+
+        self.db.close()
@@ -0,0 +1,627 @@
+import os
+import selectors
+import signal
+import socket
+import struct
+import sys
+from collections import deque
+from src.logger import Logger
+from src.core.protocol import (FrameDecoder, ProtocolError, encode_frame,
+                               decode_hello, MSG_CHAT, MSG_CONTROL, MSG_CLOSE,
+                               MSG_HELLO, MSG_HELLO_ACK)
+
+
+READ_SIZE = 65536          # Bytes read from a socket at once
+MAX_BACKLOG = 4 * 1024 * 1024 # Members with more unsent bytes are dropped
+DEFAULT_ROOM = "lobby"
+JOIN = "join "             # Control message used to change room
+MAX_ROOM = 255             # Bytes of a room name at most
+LEAVE = "leave "           # Bus message, a worker has no member left in a room
+
+# Bus chat payload: length of the room name, then the name and the relayed
+# frame
+ROOM = struct.Struct("!H")
+
+
+class Member:
+
+    """
+        One connected chat program, kept as small as possible since the
+        hub holds thousands of them.
+    """
+
+    __slots__ = ("sock", "name", "room", "decoder", "out", "out_size",
+                 "writing")
+
+    def __init__(self, sock: socket.socket, name: str) -> None:
+        self.sock = sock
+        self.name = name
+        self.room = None
+        self.decoder = FrameDecoder()
+        self.out = deque()    # Frames waiting for the socket to be writable
+        self.out_size = 0
+        self.writing = False  # Registered for write events
+
+
+class RelayHub:
+
+    """
+        Headless relay. Chat programs connect to it like to any contact,
+        and every chat message is sent on to all other members of the
+        sender's room. Uses non-blocking sockets on one selector, and each
+        relayed message is encoded once and shared by every recipient.
+    """
+
+    def __init__(self, logger: Logger, port: int = 1500,
+                                        host: str = "") -> None:
+
+        assert isinstance(logger, Logger), (f"The given logger {logger}"
+                                            " is not of type Logger!")
+
+        assert isinstance(port, int), (f"The given port {port} is not"
+                                       " of type int!")
+
+        self.logger = logger # Used to log errors
+        self.server = (host, port)
+
+        self.selector = selectors.DefaultSelector()
+        self.members = set() # Every connected member
+        self.rooms = {}      # Room name -> set of members
+
+        self.links = set()   # Bus links to the other workers of a pool
+        self.remote = {}     # Room name -> set of links with members in it
+
+        self.server_soc = None
+        self.running = False
+
+    def open(self, server_soc: socket.socket = None) -> None:
+
+        """
+            Binds the listening socket, or uses the given listening one.
+        """
+
+        if server_soc is None:
+            server_soc = socket.socket()
+            server_soc.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server_soc.bind(self.server)
+            server_soc.listen(1024)
+
+            print(f"Relay listening on port {server_soc.getsockname()[1]}")
+
+        self.server_soc = server_soc
+        self.server_soc.setblocking(False)
+
+        self.selector.register(self.server_soc, selectors.EVENT_READ, None)
+
+    def link(self, sock: socket.socket, name: str) -> None:
+
+        """
+            Adds a bus link to another worker of the pool. Messages of
+            rooms the other worker has members in are sent over it, and
+            the rooms of this worker are announced to it.
+        """
+
+        sock.setblocking(False)
+
+        link = Member(sock, name)
+        self.links.add(link)
+        self.selector.register(sock, selectors.EVENT_READ, link)
+
+        for room in self.rooms:
+            self.send(link, encode_frame(MSG_CONTROL, (JOIN + room).encode()))
+
+    def run(self) -> None:
+
+        """
+            Serves members until stop is called.
+        """
+
+        if self.server_soc is None:
+            self.open()
+
+        self.running = True
+
+        while self.running:
+            for key, mask in self.selector.select(timeout=1):
+                try:
+                    self.handle(key.data, mask)
+
+                except Exception as e:
+                    # Only this event is lost, the other members go on
+                    self.logger.log.error("Exception in relay: %r!", e)
+
+        self.close()
+
+    def handle(self, member: Member, mask: int) -> None:
+
+        """
+            Serves one ready socket, member is None for the listening one.
+        """
+
+        if member is None:
+            self.accept()
+            return
+
+        if mask & selectors.EVENT_READ:
+            self.read(member)
+
+        if mask & selectors.EVENT_WRITE and member.sock.fileno() != -1:
+            self.flush(member)
+
+    def stop(self) -> None:
+
+        """
+            Makes run return after the current pass.
+        """
+
+        self.running = False
+
+    def close(self) -> None:
+
+        """
+            Closes every member and the listening socket.
+        """
+
+        for member in list(self.members) + list(self.links):
+            self.drop(member)
+
+        if self.server_soc is not None:
+            self.selector.unregister(self.server_soc)
+            self.server_soc.close()
+            self.server_soc = None
+
+    def accept(self) -> None:
+
+        """
+            Accepts every waiting connection.
+        """
+
+        while True:
+            try:
+                sock, addr = self.server_soc.accept()
+            except BlockingIOError:
+                return
+            except OSError as e:
+                self.logger.log.error("Exception during relay accept: %s!", e)
+                return
+
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            member = Member(sock, f"{addr[0]}:{addr[1]}")
+            self.members.add(member)
+            self.selector.register(sock, selectors.EVENT_READ, member)
+
+    def read(self, member: Member) -> None:
+
+        """
+            Reads from a member and handles every complete frame.
+        """
+
+        try:
+            data = member.sock.recv(READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if data == b"":
+            self.drop(member)
+            return
+
+        try:
+            frames = member.decoder.feed(data)
+        except ProtocolError as e:
+            self.logger.log.error("Dropping relay member %s: %s!",
+                                  member.name, e)
+            self.drop(member)
+            return
+
+        if member in self.links:
+            self.read_bus(member, frames)
+            return
+
+        for msg_type, payload in frames:
+            if msg_type == MSG_CHAT and member.room is not None:
+                self.broadcast(member, payload)
+
+            elif msg_type == MSG_HELLO:
+                try:
+                    _, port, _ = decode_hello(payload)
+                except ProtocolError:
+                    self.drop(member)
+                    return
+
+                member.name = f"{member.name.rsplit(':', 1)[0]}:{port}"
+                # No features, frames are relayed to many members as is
+                self.send(member, encode_frame(MSG_HELLO_ACK))
+                self.join(member, DEFAULT_ROOM)
+
+            elif msg_type == MSG_CONTROL:
+                text = payload.decode(errors="replace")
+                room = text[len(JOIN):].strip()
+
+                # Longer names do not fit the bus frames of a pool
+                if text.startswith(JOIN) and len(room.encode()) <= MAX_ROOM:
+                    self.join(member, room)
+
+            elif msg_type == MSG_CLOSE:
+                self.drop(member)
+                return
+
+    def read_bus(self, link: Member, frames: list) -> None:
+
+        """
+            Handles frames from another worker: messages for the members
+            of a room here, and the rooms the other worker has members in.
+        """
+
+        for msg_type, payload in frames:
+            if msg_type == MSG_CHAT:
+                end = ROOM.size + ROOM.unpack_from(payload)[0]
+                room = payload[ROOM.size:end].decode()
+                frame = payload[end:]
+
+                for member in list(self.rooms.get(room, ())):
+                    self.send(member, frame)
+
+            elif msg_type == MSG_CONTROL:
+                text = payload.decode()
+
+                if text.startswith(JOIN):
+                    self.remote.setdefault(text[len(JOIN):],
+                                           set()).add(link)
+
+                elif text.startswith(LEAVE):
+                    self.forget(link, text[len(LEAVE):])
+
+    def forget(self, link: Member, room: str) -> None:
+
+        """
+            Stops sending messages of the room over the link.
+        """
+
+        links = self.remote.get(room)
+
+        if links is not None:
+            links.discard(link)
+            if not links:
+                del self.remote[room]
+
+    def announce(self, text: str) -> None:
+
+        """
+            Sends a control message to every other worker.
+        """
+
+        frame = encode_frame(MSG_CONTROL, text.encode())
+
+        for link in list(self.links):
+            self.send(link, frame)
+
+    def join(self, member: Member, room: str) -> None:
+
+        """
+            Moves a member to the given room.
+        """
+
+        if member.room is not None:
+            self.leave(member)
+
+        member.room = room
+
+        if room not in self.rooms:
+            self.rooms[room] = set()
+            self.announce(JOIN + room)
+
+        self.rooms[room].add(member)
+
+    def leave(self, member: Member) -> None:
+
+        """
+            Removes a member from its room.
+        """
+
+        members = self.rooms.get(member.room)
+
+        if members is not None:
+            members.discard(member)
+            if not members:
+                del self.rooms[member.room]
+                self.announce(LEAVE + member.room)
+
+        member.room = None
+
+    def broadcast(self, sender: Member, payload: bytes) -> None:
+
+        """
+            Sends the message to every other member of the sender's room.
+            The frame is encoded once and shared by every recipient, and
+            sent once to every other worker with members in the room.
+        """
+
+        links = self.remote.get(sender.room)
+
+        try:
+            frame = encode_frame(MSG_CHAT, sender.name.encode() + b": "
+                                           + payload)
+
+            if links:
+                room = sender.room.encode()
+                bus_frame = encode_frame(MSG_CHAT, ROOM.pack(len(room))
+                                                   + room + frame)
+
+        except ProtocolError as e:
+            # Fitted on its own, the name and the room in front make it
+            # too large. Dropped everywhere, not only on the other workers
+            self.logger.log.error("Dropping message of relay member %s: %s!",
+                                  sender.name, e)
+            return
+
+        for member in list(self.rooms.get(sender.room, ())):
+            if member is not sender:
+                self.send(member, frame)
+
+        for link in list(links or ()):
+            self.send(link, bus_frame)
+
+    def send(self, member: Member, frame: bytes) -> None:
+
+        """
+            Writes the frame now if possible, otherwise queues it until the
+            socket is writable.
+        """
+
+        if not member.out:
+            try:
+                sent = member.sock.send(frame)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self.drop(member)
+                return
+
+            if sent == len(frame):
+                return
+
+            frame = memoryview(frame)[sent:]
+
+        member.out.append(frame)
+        member.out_size += len(frame)
+
+        if member.out_size > MAX_BACKLOG and member not in self.links:
+            # Too slow to keep up with the room
+            self.logger.log.error("Dropping slow relay member %s", member.name)
+            self.drop(member)
+            return
+
+        if not member.writing:
+            member.writing = True
+            self.selector.modify(member.sock,
+                                 selectors.EVENT_READ | selectors.EVENT_WRITE,
+                                 member)
+
+    def flush(self, member: Member) -> None:
+
+        """
+            Writes queued frames until the socket would block.
+        """
+
+        while member.out:
+            frame = member.out[0]
+
+            try:
+                sent = member.sock.send(frame)
+            except BlockingIOError:
+                return
+            except OSError:
+                self.drop(member)
+                return
+
+            member.out_size -= sent
+
+            if sent < len(frame):
+                member.out[0] = memoryview(frame)[sent:]
+                return
+
+            member.out.popleft()
+
+        member.writing = False
+        self.selector.modify(member.sock, selectors.EVENT_READ, member)
+
+    def drop(self, member: Member) -> None:
+
+        """
+            Closes a member and forgets it.
+        """
+
+        if member.sock.fileno() == -1:
+            return
+
+        if member in self.links:
+            if self.running:
+                self.logger.log.error("Lost relay bus link %s", member.name)
+
+            self.links.discard(member)
+            for room in list(self.remote):
+                self.forget(member, room)
+
+        self.leave(member)
+        self.members.discard(member)
+        self.selector.unregister(member.sock)
+        member.sock.close()
+
+    @property
+    def member_count(self) -> int:
+        return len(self.members)
+
+
+class RelayPool:
+
+    """
+        Runs the relay in several worker processes, so it is not bound to
+        one core by the GIL. Every worker is a RelayHub with a listening
+        socket of its own, bound to the same port with SO_REUSEPORT, and
+        the kernel spreads new connections over them. Each pair of workers
+        is joined by a Unix socket pair, the bus, over which a message is
+        sent once to every worker with members in the sender's room.
+        Needs fork and SO_REUSEPORT, so Linux or a BSD.
+    """
+
+    def __init__(self, logger: Logger, port: int = 1500, host: str = "",
+                                        workers: int = 2) -> None:
+
+        assert isinstance(logger, Logger), (f"The given logger {logger}"
+                                            " is not of type Logger!")
+
+        assert isinstance(port, int), (f"The given port {port} is not"
+                                       " of type int!")
+
+        assert isinstance(workers, int) and workers > 0, (f"The given workers"
+                                        f" {workers} is not a positive int!")
+
+        self.logger = logger
+        self.server = (host, port)
+        self.workers = workers
+
+        self.pids = [] # Process ids of the running workers
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")
+
+    def listen(self) -> list:
+
+        """
+            Returns a listening socket for every worker, all bound to one
+            port. With port 0 the first socket picks it.
+        """
+
+        host, port = self.server
+        sockets = []
+
+        for _ in range(self.workers):
+            sock = socket.socket()
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((host, port))
+            sock.listen(1024)
+
+            port = sock.getsockname()[1]
+            sockets.append(sock)
+
+        print(f"Relay listening on port {port} with {self.workers} workers")
+
+        return sockets
+
+    def run(self) -> None:
+
+        """
+            Forks the workers and waits for them. Stopped by SIGTERM or
+            Ctrl-C, which stops every worker.
+        """
+
+        sockets = self.listen()
+
+        # Bus socket pair of workers i < j: (end of i, end of j)
+        pairs = {(i, j): socket.socketpair()
+                 for i in range(self.workers)
+                 for j in range(i + 1, self.workers)}
+
+        sys.stdout.flush() # Otherwise printed again by a worker
+
+        for index in range(self.workers):
+            pid = os.fork()
+
+            if pid == 0:
+                self.__worker(index, sockets, pairs)
+
+            self.pids.append(pid)
+
+        for sock in sockets:
+            sock.close()
+
+        for first, second in pairs.values():
+            first.close()
+            second.close()
+
+        # Handled like Ctrl-C, the caller closes the pool
+        def terminate(signum: int, frame) -> None:
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, terminate)
+
+        while self.pids:
+            pid, status = os.wait()
+
+            if pid in self.pids:
+                self.pids.remove(pid)
+
+                if status:
+                    self.logger.log.error("Relay worker %s exited with"
+                                          " status %s", pid, status)
+
+    def __worker(self, index: int, sockets: list, pairs: dict) -> None:
+
+        """
+            Runs worker number index in the forked process, never returns.
+        """
+
+        code = 0
+        hub = RelayHub(logger=self.logger, port=self.server[1],
+                       host=self.server[0])
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: hub.stop())
+
+        try:
+            for number, sock in enumerate(sockets):
+                if number != index:
+                    sock.close()
+
+            for (i, j), (first, second) in pairs.items():
+                if i == index:
+                    hub.link(first, f"worker {j}")
+                    second.close()
+                elif j == index:
+                    hub.link(second, f"worker {i}")
+                    first.close()
+                else:
+                    first.close()
+                    second.close()
+
+            hub.open(sockets[index])
+            hub.run()
+
+        except KeyboardInterrupt:
+            hub.close()
+
+        except Exception as e:
+            print(f"Exception caught in relay worker {index}: {e}!")
+            self.logger.log.error("Exception caught in relay worker %s: %s!",
+                                  index, e)
+            code = 1
+
+        finally:
+            sys.stdout.flush()
+            self.logger.stop() # os._exit skips the atexit handlers
+            os._exit(code)
+
+    def close(self) -> None:
+
+        """
+            Stops every worker and waits for them.
+        """
+
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        for pid in self.pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+        self.pids = []
@@ -0,0 +1,654 @@
+import asyncio
+import os
+from src.core.engine import NetworkEngine
+from src.logger import Logger
+from src.core.connection import (Connection, read_frame, HANDSHAKE_TIMEOUT,
+                                 HEARTBEAT_INTERVAL, HEARTBEAT_MISSES,
+                                 RECONNECT_WINDOW)
+from src.core.delivery import WINDOW
+from src.core.outbox import OutboxFile, OUTBOX_PATH
+from src.core.events import (Emit, EVENT_CONNECTED, EVENT_FILE_FAILED,
+                             EVENT_FILE_OFFER)
+from src.core.protocol import (FrameDecoder, decode_hello, decode_file,
+                               chat_fits, encode_frame, MSG_HELLO, MSG_FILE,
+                               MSG_CLOSE)
+from src.core.sendqueue import MAX_BATCH, LINGER
+from src.core.compression import THRESHOLD
+from src.core.transfer import FileSender, FileReceiver, OFFER_TIMEOUT
+from src.core.metrics import MetricsRegistry
+from src.core.resolver import Resolver
+from src.core.contact import ContactRepository
+
+
+class ConnectionManager:
+
+    """
+        Keeps many peer connections open at once on the network engine.
+        One listening socket is shared by every conversation, and incoming
+        connections are routed to the conversation of the peer that sent
+        the hello. Each conversation is identified by a key, the contact
+        name, or "ip:port" for peers that are not contacts. Peers that
+        connect are looked up in contacts when given. Messages not
+        delivered yet are kept in the outbox folder, None keeps them in
+        memory only. A file is only received once the user accepts it,
+        answering EVENT_FILE_OFFER, unless accept_files answers every
+        offer.
+    """
+
+    def __init__(self, emit: Emit, logger: Logger,
+                        engine: NetworkEngine, s_port: int = 1500,
+                        nodelay: bool = True, max_batch: int = MAX_BATCH,
+                        linger: float = LINGER, compress: bool = True,
+                        threshold: int = THRESHOLD,
+                        heartbeat: float = HEARTBEAT_INTERVAL,
+                        misses: int = HEARTBEAT_MISSES,
+                        reconnect: float = RECONNECT_WINDOW,
+                        window: int = WINDOW,
+                        outbox: str = OUTBOX_PATH,
+                        accept_files: bool = None,
+                        contacts: ContactRepository = None) -> None:
+
+        assert callable(emit), f"The given emit {emit} is not callable!"
+
+        assert isinstance(logger, Logger), (f"The given logger {logger}"
+                                            " is not of type Logger!")
+
+        assert isinstance(engine, NetworkEngine), (f"The given engine {engine}"
+                                            " is not of type NetworkEngine!")
+
+        assert isinstance(s_port, int), (f"The given server port {s_port}"
+                                        " is not of type int!")
+
+        self.emit = emit # Receives the events
+        self.logger = logger # Used to log errors
+        self.engine = engine
+
+        self.server = ("", s_port) # Listen on every interface
+        self.server_port = s_port
+
+        # Batching, compression, failure detection and the send window,
+        # given to every connection
+        self.options = {"nodelay": nodelay, "max_batch": max_batch,
+                        "linger": linger, "compress": compress,
+                        "threshold": threshold, "heartbeat": heartbeat,
+                        "misses": misses, "reconnect": reconnect,
+                        "window": window}
+
+        self.resolver = Resolver() # Shared, a contact is looked up once
+
+        self.outbox = outbox
+        self.accept_files = accept_files # None asks the user
+        self.contacts = contacts # Names the peers that connect
+
+        self.server_soc = None
+        self.metrics_soc = None
+        self.__connections = {} # Key -> Connection, only used on the loop
+        self.__stores = {} # Key -> OutboxFile, only used on the loop
+        self.__offers = {} # Transfer id -> future of the user's answer
+        self.__accepted = set() # Transfer ids accepted, resumed unasked
+
+        self.__handshake_timeouts = 0 # Incoming hellos that never came
+
+        # Other parts of the program add their own collectors
+        self.registry = MetricsRegistry()
+        self.registry.add(self.__collect)
+
+    def listen(self, s_port: int = None) -> None:
+
+        """
+            Starts, or restarts on a new port, the shared listening socket.
+        """
+
+        if s_port is not None:
+            self.server = ("", s_port)
+            self.server_port = s_port
+
+        self.engine.submit(self.__listen())
+
+    async def __listen(self) -> None:
+
+        """
+            Binds the listening socket on the loop.
+        """
+
+        await self.__stop_listening()
+
+        try:
+            self.server_soc = await asyncio.start_server(self.__accept,
+                                                         *self.server,
+                                                         backlog=100)
+            print(f"Listening on port {self.server_port}")
+
+        except OSError as e:
+            # Connecting out still works
+            print(f"Could not listen on port {self.server_port}: {e}!")
+            self.logger.log.error("Could not listen on port %s: %s!",
+                                  self.server_port, e)
+
+    async def __stop_listening(self) -> None:
+
+        """
+            Closes the listening socket.
+        """
+
+        if self.server_soc is not None:
+            self.server_soc.close()
+            await self.server_soc.wait_closed()
+            self.server_soc = None
+
+    async def __accept(self, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter) -> None:
+
+        """
+            Reads the hello of a new connection and hands the connection to
+            the conversation it belongs to, creating one if needed. File
+            transfers arrive on connections of their own.
+        """
+
+        decoder = FrameDecoder()
+        backlog = []
+
+        try:
+            msg_type, payload = await asyncio.wait_for(
+                                    read_frame(reader, decoder, backlog),
+                                    timeout=HANDSHAKE_TIMEOUT)
+
+            if msg_type == MSG_FILE:
+                await self.__receive_file(reader, writer, payload)
+                return
+
+            if msg_type != MSG_HELLO:
+                writer.close()
+                return
+
+            nonce, port, features = decode_hello(payload)
+
+        except asyncio.TimeoutError:
+            self.__handshake_timeouts += 1
+            writer.close()
+            return
+
+        except Exception as e:
+            self.logger.log.error("Exception during handshake: %s!", e)
+            writer.close()
+            return
+
+        ip = writer.get_extra_info("peername")[0]
+
+        connection = self.__find(ip, port)
+        new = connection is None
+
+        if new:
+            key = self.__key(ip, port)
+            # Only an outbox kept from before, __send opens a new one
+            connection = Connection(emit=self.emit, logger=self.logger,
+                                    key=key, ip=ip, engine=self.engine,
+                                    c_port=port, s_port=self.server_port,
+                                    resolver=self.resolver,
+                                    store=self.__store(key, create=False),
+                                    **self.options)
+
+        if (connection.accept(reader, writer, decoder, backlog, nonce,
+                              features) and new):
+            self.__start(connection)
+
+    async def __receive_file(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter,
+                             payload: bytes) -> None:
+
+        """
+            Receives the file announced in payload, in the conversation of
+            the peer that sends it.
+        """
+
+        transfer_id, size, port, name = decode_file(payload)
+
+        ip = writer.get_extra_info("peername")[0]
+        connection = self.__find(ip, port)
+        key = connection.key if connection is not None else self.__key(ip,
+                                                                       port)
+
+        receiver = FileReceiver(emit=self.emit, logger=self.logger,
+                                key=key)
+
+        if not receiver.has_room(transfer_id, size):
+            print(f"No room for {name} of {size} bytes from {key}")
+            accepted = False
+        else:
+            accepted = await self.__ask(key, transfer_id, name, size)
+
+        if not accepted:
+            writer.write(encode_frame(MSG_CLOSE)) # The sender gives up
+            writer.close()
+            return
+
+        await receiver.receive(reader, writer, transfer_id, size, name)
+
+    async def __ask(self, key: str, transfer_id: bytes, name: str,
+                    size: int) -> bool:
+
+        """
+            Returns whether the user accepts the file, False if there is
+            no answer within OFFER_TIMEOUT.
+        """
+
+        if self.accept_files is not None:
+            return self.accept_files
+
+        if transfer_id in self.__accepted:
+            return True # A resumed transfer
+
+        offer = self.__offers.get(transfer_id)
+
+        if offer is None:
+            offer = self.engine.loop.create_future()
+            self.__offers[transfer_id] = offer
+            self.emit(EVENT_FILE_OFFER, (key, transfer_id, name, size))
+
+        try:
+            accepted = await asyncio.wait_for(asyncio.shield(offer),
+                                              timeout=OFFER_TIMEOUT)
+        except asyncio.TimeoutError:
+            accepted = False
+        finally:
+            if self.__offers.get(transfer_id) is offer:
+                del self.__offers[transfer_id]
+
+        if accepted:
+            self.__accepted.add(transfer_id)
+
+        return accepted
+
+    def answer_file(self, transfer_id: bytes, accept: bool) -> None:
+
+        """
+            Gives the user's answer to an EVENT_FILE_OFFER.
+        """
+
+        self.engine.call_soon(self.__answer, transfer_id, accept)
+
+    def __answer(self, transfer_id: bytes, accept: bool) -> None:
+        offer = self.__offers.get(transfer_id)
+
+        if offer is not None and not offer.done():
+            offer.set_result(accept)
+
+    def __key(self, ip: str, port: int) -> str:
+
+        """
+            Returns the key of a new conversation with the peer listening
+            on ip and port, the name of the contact if it is one.
+        """
+
+        if self.contacts is not None:
+            contact = self.contacts.find(ip, port)
+
+            if contact is not None:
+                return contact.name
+
+        return f"{ip}:{port}"
+
+    def __find(self, ip: str, port: int) -> Connection:
+
+        """
+            Returns the connection of the peer listening on ip and port.
+        """
+
+        return self.__find_any({ip}, port)
+
+    def __find_any(self, addresses: set, port: int) -> Connection:
+
+        """
+            Returns the connection of the peer listening on port on any of
+            the given addresses.
+        """
+
+        for connection in self.__connections.values():
+            if (connection.client[1] == port
+                and not addresses.isdisjoint(connection.addresses)):
+                return connection
+
+        return None
+
+    def __start(self, connection: Connection) -> None:
+
+        """
+            Registers the connection and runs it until it ends.
+        """
+
+        old = self.__connections.get(connection.key)
+        if old is not None:
+            self.engine.loop.create_task(old._close())
+
+        self.__connections[connection.key] = connection
+        self.engine.loop.create_task(self.__run(connection))
+
+    async def __run(self, connection: Connection) -> None:
+
+        """
+            Runs the connection and forgets it once it has ended.
+        """
+
+        try:
+            await connection.open_connection()
+
+        finally:
+            if self.__connections.get(connection.key) is connection:
+                del self.__connections[connection.key]
+
+    def open(self, key: str, ip: str, port: int) -> None:
+
+        """
+            Opens a conversation with the peer at ip and port. Nothing is
+            done if the conversation is already open.
+        """
+
+        self.engine.submit(self.__open(key, ip, port))
+
+    async def __open(self, key: str, ip: str, port: int) -> None:
+
+        """
+            Creates the connection on the loop.
+        """
+
+        if key in self.__connections:
+            # Already open, tell the UI again so the tab is shown
+            if self.__connections[key].writer is not None:
+                self.emit(EVENT_CONNECTED, key)
+            return
+
+        connection = Connection(emit=self.emit, logger=self.logger,
+                                key=key, ip=ip, engine=self.engine,
+                                c_port=port, s_port=self.server_port,
+                                resolver=self.resolver,
+                                store=self.__store(key), **self.options)
+
+        await connection.resolve()
+
+        if key in self.__connections:
+            return
+
+        existing = self.__find_any(connection.addresses, port)
+
+        if existing is not None:
+            # The peer connected first, the conversation takes it over
+            del self.__connections[existing.key]
+            existing.key = key
+            self.__connections[key] = existing
+
+            # Messages kept for the contact while it was offline are sent
+            # from its outbox, and new ones are kept there
+            store = self.__store(key)
+            if store is not None and store is not existing.delivery.store:
+                existing._use_store(store)
+
+            if existing.writer is not None:
+                self.emit(EVENT_CONNECTED, key)
+            return
+
+        self.__start(connection)
+
+    def send(self, key: str, msg: str) -> bool:
+
+        """
+            Sends a message in the given conversation. The write is done
+            by the engine loop so the calling thread never blocks.
+            Returns False, and sends nothing, if the message is larger
+            than a chat frame can carry.
+        """
+
+        if not chat_fits(msg):
+            self.logger.log.error("Refused a message of %s bytes to %s,"
+                                  " too large!", len(msg.encode()), key)
+            return False
+
+        self.engine.call_soon(self.__send, key, msg)
+        return True
+
+    def __send(self, key: str, msg: str) -> None:
+        connection = self.__connections.get(key)
+
+        if connection is not None:
+            if connection.delivery.store is None:
+                # A peer that connected, kept on disk from now on
+                store = self.__store(key)
+                if store is not None:
+                    connection._use_store(store)
+
+            connection.send(msg)
+            return
+
+        # Sent once the conversation is connected again
+        store = self.__store(key)
+        if store is not None:
+            store.add(msg)
+
+    def __store(self, key: str, create: bool = True) -> OutboxFile:
+
+        """
+            Returns the outbox of the conversation, opening it the first
+            time. None if outboxes are off or it cannot be opened, or if
+            it does not exist yet and create is not set.
+        """
+
+        if self.outbox is None:
+            return None
+
+        if (not create and key not in self.__stores
+            and not os.path.exists(OutboxFile.path_for(key, self.outbox))):
+            return None
+
+        if key not in self.__stores:
+            try:
+                self.__stores[key] = OutboxFile.for_key(key, self.outbox)
+
+            except OSError as e:
+                print(f"Could not open outbox of {key}: {e}!")
+                self.logger.log.error("Could not open outbox of %s: %s!",
+                                      key, e)
+                return None
+
+        return self.__stores[key]
+
+    def send_file(self, key: str, path: str) -> None:
+
+        """
+            Sends a file to the peer of the given conversation on a
+            connection of its own.
+        """
+
+        self.engine.submit(self.__send_file(key, path))
+
+    async def __send_file(self, key: str, path: str) -> None:
+        connection = self.__connections.get(key)
+
+        if connection is None:
+            self.emit(EVENT_FILE_FAILED, (key, path))
+            return
+
+        address = connection.client
+
+        if connection.writer is not None:
+            # The address the peer answered on needs no lookup
+            address = (connection.writer.get_extra_info("peername")[0],
+                       connection.client[1])
+
+        sender = FileSender(emit=self.emit, logger=self.logger, key=key,
+                            path=path, address=address,
+                            s_port=self.server_port)
+        await sender.run()
+
+    def stats(self, key: str) -> str:
+
+        """
+            Returns the compression stats of the given conversation as
+            text, or None if it is not connected.
+        """
+
+        async def stats() -> str:
+            connection = self.__connections.get(key)
+
+            if connection is None or connection.codec is None:
+                return None
+
+            return connection.codec.stats.summary()
+
+        return self.engine.submit(stats()).result(timeout=1)
+
+    def __collect(self) -> list:
+
+        """
+            Returns the metric families of every connection, labelled by
+            conversation.
+        """
+
+        connections = list(self.__connections.values())
+
+        def family(name: str, kind: str, help_text: str, value) -> tuple:
+            return (name, kind, help_text,
+                    [({"peer": c.key}, value(c)) for c in connections])
+
+        return [
+            ("chat_connections", "gauge", "Open conversations.",
+             [({}, len(connections))]),
+            ("chat_handshake_timeouts_total", "counter", "Incoming"
+             " connections that sent no hello in time.",
+             [({}, self.__handshake_timeouts)]),
+            ("chat_dns_cache_hits_total", "counter", "Host names answered"
+             " from the cache.", [({}, self.resolver.hits)]),
+            ("chat_dns_cache_misses_total", "counter", "Host names looked"
+             " up.", [({}, self.resolver.misses)]),
+            family("chat_bytes_received_total", "counter", "Bytes read from"
+                   " the socket.", lambda c: c.metrics.bytes_in),
+            family("chat_bytes_sent_total", "counter", "Bytes written to the"
+                   " socket.", lambda c: c.metrics.bytes_out),
+            family("chat_messages_received_total", "counter", "Chat"
+                   " messages received.", lambda c: c.metrics.messages_in),
+            family("chat_messages_sent_total", "counter", "Chat messages"
+                   " sent.", lambda c: c.metrics.messages_out),
+            family("chat_send_queue_depth", "gauge", "Frames waiting to be"
+                   " written.",
+                   lambda c: c.queue.depth if c.queue is not None else 0),
+            family("chat_messages_pending", "gauge", "Chat messages not"
+                   " acknowledged by the peer yet.",
+                   lambda c: c.delivery.pending),
+            family("chat_connect_retries_total", "counter", "Connect"
+                   " attempts after the first one.",
+                   lambda c: c.metrics.retries),
+            family("chat_timeouts_total", "counter", "Connects and"
+                   " handshakes that timed out.",
+                   lambda c: c.metrics.timeouts),
+            family("chat_reconnects_total", "counter", "Times the"
+                   " connection was lost and dialed again.",
+                   lambda c: c.metrics.reconnects),
+            family("chat_write_latency_seconds", "histogram", "Seconds from"
+                   " queueing a frame until the socket takes it.",
+                   lambda c: c.metrics.write_latency),
+            family("chat_ack_latency_seconds", "histogram", "Seconds from"
+                   " sending a chat message until the peer acknowledges it.",
+                   lambda c: c.metrics.ack_latency),
+        ]
+
+    def metrics(self) -> str:
+
+        """
+            Returns every registered metric in the Prometheus text format.
+            Rendered on the loop, so the counters are read consistently.
+        """
+
+        async def render() -> str:
+            return self.registry.render()
+
+        return self.engine.submit(render()).result(timeout=1)
+
+    def serve_metrics(self, port: int, host: str = "127.0.0.1") -> None:
+
+        """
+            Serves the metrics over HTTP on host and port, for a Prometheus
+            scraper or curl. Only local by default.
+        """
+
+        assert isinstance(port, int), (f"The given metrics port {port}"
+                                       " is not of type int!")
+
+        self.engine.submit(self.__serve_metrics(host, port))
+
+    async def __serve_metrics(self, host: str, port: int) -> None:
+        try:
+            self.metrics_soc = await asyncio.start_server(
+                                    self.__metrics_request, host, port)
+            print(f"Serving metrics on {host}:{port}")
+
+        except OSError as e:
+            print(f"Could not serve metrics on port {port}: {e}!")
+            self.logger.log.error("Could not serve metrics on port %s: %s!",
+                                  port, e)
+
+    async def __metrics_request(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+
+        """
+            Answers one HTTP request with the metrics, whatever the path.
+        """
+
+        try:
+            # Only the request head is read, scrapes have no body
+            await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"),
+                                   timeout=HANDSHAKE_TIMEOUT)
+
+            body = self.registry.render().encode()
+            writer.write(b"HTTP/1.0 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError):
+            pass
+
+        finally:
+            writer.close()
+
+    def close(self, key: str) -> None:
+
+        """
+            Closes the given conversation.
+        """
+
+        self.engine.submit(self.__close(key))
+
+    async def __close(self, key: str) -> None:
+        connection = self.__connections.pop(key, None)
+
+        if connection is not None:
+            await connection._close()
+
+    def close_all(self) -> None:
+
+        """
+            Closes every conversation and the listening socket, waits for
+            it to finish.
+        """
+
+        async def close_all() -> None:
+            for key in list(self.__connections):
+                await self.__close(key)
+
+            await self.__stop_listening()
+
+            if self.metrics_soc is not None:
+                self.metrics_soc.close()
+                await self.metrics_soc.wait_closed()
+                self.metrics_soc = None
+
+            for store in self.__stores.values():
+                await store.close()
+
+            self.__stores.clear()
+
+        try:
+            self.engine.submit(close_all()).result(timeout=5)
+
+        except Exception as e:
+            print(f"Exception during connection close: {e}!")
+            self.logger.log.error("Exception during connection close: %s!", e)
@@ -0,0 +1,193 @@
+import time
+from array import array
+from src.timestamp import TimeStamp
+
+
+# Sender ids every log has, peers are numbered from 2 on
+STATUS = 0 # Status lines such as "Connected!", shown without time and name
+ME = 1     # Own messages
+
+
+class MessageLog:
+
+    """
+        Messages of one conversation in columns: arrays of times, sender
+        ids and end offsets into one shared buffer of UTF-8 text. A
+        message costs 14 bytes plus its text, instead of a formatted
+        string object, and lines are only formatted when shown. Holds the
+        newest limit messages, older ones are dropped in bulk.
+    """
+
+    def __init__(self, limit: int = None) -> None:
+
+        assert limit is None or (isinstance(limit, int) and limit > 0), (
+                            f"The given limit {limit} is not a positive int!")
+
+        self.limit = limit
+
+        self.names = ["", "ME"] # Sender id -> name
+        self.__ids = {}         # Name of a peer -> sender id
+
+        self.__times = array("d")   # Seconds since the epoch
+        self.__senders = array("H")
+        self.__ends = array("I")    # Offset after the text of each message
+        self.__text = bytearray()
+        self.__first = 0 # Index of the oldest message kept
+
+    def __len__(self) -> int:
+        return len(self.__times) - self.__first
+
+    def sender_id(self, name: str) -> int:
+
+        """
+            Returns the id of a peer, numbering it the first time.
+        """
+
+        sender = self.__ids.get(name)
+
+        if sender is None:
+            sender = self.__ids[name] = len(self.names)
+            self.names.append(name)
+
+        return sender
+
+    def add(self, sender: int, text: str, seconds: float = None) -> None:
+
+        """
+            Adds a message of the given sender id, sent now or at the given
+            seconds since the epoch.
+        """
+
+        self.__text += text.encode()
+        self.__ends.append(len(self.__text))
+        self.__times.append(time.time() if seconds is None else seconds)
+        self.__senders.append(sender)
+
+        if self.limit is not None and len(self) > self.limit:
+            self.__first += 1
+
+            # Dropped ones are cut off once they are as many as the kept
+            if self.__first >= self.limit:
+                self.__compact()
+
+    def __compact(self) -> None:
+
+        """
+            Removes the dropped messages from the columns.
+        """
+
+        first = self.__first
+        start = self.__ends[first - 1]
+
+        del self.__text[:start]
+        self.__ends = array("I", [end - start for end in self.__ends[first:]])
+        self.__times = self.__times[first:]
+        self.__senders = self.__senders[first:]
+        self.__first = 0
+
+    def prepend(self, records: list) -> int:
+
+        """
+            Adds older (seconds, sender id, text) records, oldest first,
+            before the oldest message kept. Only the newest of them that
+            fit under the limit are added, returns how many.
+        """
+
+        if self.limit is not None:
+            room = max(self.limit - len(self), 0)
+            records = records[max(len(records) - room, 0):] if room else []
+
+        if not records:
+            return 0
+
+        if self.__first:
+            self.__compact()
+
+        texts = [text.encode() for _, _, text in records]
+        ends = array("I")
+        end = 0
+
+        for data in texts:
+            end += len(data)
+            ends.append(end)
+
+        self.__ends = ends + array("I", [old + end for old in self.__ends])
+        self.__text = bytearray(b"".join(texts)) + self.__text
+        self.__times = array("d", [record[0] for record in records]) \
+                       + self.__times
+        self.__senders = array("H", [record[1] for record in records]) \
+                         + self.__senders
+
+        return len(records)
+
+    def clear(self) -> None:
+        self.__times = array("d")
+        self.__senders = array("H")
+        self.__ends = array("I")
+        self.__text = bytearray()
+        self.__first = 0
+
+    def record(self, index: int) -> tuple:
+
+        """
+            Returns the (seconds, sender id, text) of the message at index,
+            counted from the oldest kept.
+        """
+
+        i = self.__first + index
+        start = self.__ends[i - 1] if i else 0
+
+        return (self.__times[i], self.__senders[i],
+                self.__text[start:self.__ends[i]].decode())
+
+    def records(self, sender: int = None, words: str = None) -> list:
+
+        """
+            Returns the (seconds, sender id, text) of every message, only
+            those of sender and containing words if given. Columns are
+            compared before any text is decoded.
+        """
+
+        first = self.__first
+        ends = self.__ends[first:]
+        starts = self.__ends[first - 1:-1] if first else \
+                 array("I", [0]) + self.__ends[:-1]
+
+        rows = zip(self.__times[first:], self.__senders[first:], starts, ends)
+
+        if sender is not None:
+            rows = [row for row in rows if row[1] == sender]
+
+        text = self.__text
+
+        if words:
+            needle = words.encode()
+            rows = [row for row in rows
+                    if text.find(needle, row[2], row[3]) >= 0]
+
+        return [(seconds, sender_id, text[start:end].decode())
+                for seconds, sender_id, start, end in rows]
+
+    def format(self, seconds: float, sender: int, text: str) -> str:
+
+        """
+            Returns the line a message is shown as.
+        """
+
+        if sender == STATUS:
+            return text
+
+        if sender == ME:
+            return TimeStamp.get_time(seconds) + " ME: " + text
+
+        return TimeStamp.get_time(seconds) + " " + self.names[sender] + ": " \
+               + text
+
+    def lines(self, sender: int = None, words: str = None) -> list:
+
+        """
+            Returns the lines of every message, filtered like records.
+        """
+
+        return [self.format(*record)
+                for record in self.records(sender, words)]
@@ -0,0 +1,155 @@
+import os
+from bisect import bisect_left
+
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0)
+
+# Written by the stats window's export
+METRICS_PATH = os.path.join(os.path.dirname(os.path.dirname(
+                                os.path.dirname(os.path.abspath(__file__)))),
+                            "log", "metrics.prom")
+
+
+class Histogram:
+
+    """
+        Counts observed values into fixed buckets, Prometheus style. Only
+        one thread may observe, any thread may read.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+
+        """
+            Returns the upper bound of the bucket holding the q quantile,
+            an estimate good enough to spot a slow peer.
+        """
+
+        rank = q * self.count
+        seen = 0
+
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return bound
+
+        return 0.0
+
+
+class ConnectionMetrics:
+
+    """
+        Counters of one connection, updated on the engine loop.
+    """
+
+    __slots__ = ("bytes_in", "bytes_out", "messages_in", "messages_out",
+                 "retries", "timeouts", "reconnects", "write_latency",
+                 "ack_latency")
+
+    def __init__(self) -> None:
+        self.bytes_in = 0      # Bytes read from the socket
+        self.bytes_out = 0     # Bytes written to the socket
+        self.messages_in = 0   # Chat messages received
+        self.messages_out = 0  # Chat messages sent
+        self.retries = 0       # Connect attempts after the first one
+        self.timeouts = 0      # Handshakes and connects that timed out
+        self.reconnects = 0    # Times the connection was lost and redialed
+
+        # Seconds from queueing a frame until the socket takes it
+        self.write_latency = Histogram()
+
+        # Seconds from sending a chat message until the peer acknowledges
+        # it, only with peers that acknowledge
+        self.ack_latency = Histogram()
+
+
+class MetricsRegistry:
+
+    """
+        Renders metrics in the Prometheus text format. Collectors are
+        callables returning (name, kind, help, samples) families, where
+        samples are (labels, value) pairs and value is a number, or a
+        Histogram for histograms.
+    """
+
+    def __init__(self) -> None:
+        self.collectors = []
+
+    def add(self, collector) -> None:
+        self.collectors.append(collector)
+
+    @staticmethod
+    def __labels(labels: dict, le: str = None) -> str:
+        pairs = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                 for name, value in labels.items()]
+
+        if le is not None:
+            pairs.append(("le", le))
+
+        if not pairs:
+            return ""
+
+        return ("{" + ",".join(f'{name}="{value}"' for name, value in pairs)
+                + "}")
+
+    def render(self) -> str:
+
+        """
+            Returns every metric as Prometheus text.
+        """
+
+        lines = []
+
+        for collector in self.collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+                for labels, value in samples:
+                    if kind != "histogram":
+                        lines.append(f"{name}{self.__labels(labels)} {value}")
+                        continue
+
+                    total = 0
+                    bounds = [str(bound) for bound in value.buckets] + ["+Inf"]
+
+                    for bound, count in zip(bounds, value.counts):
+                        total += count
+                        lines.append(f"{name}_bucket"
+                                     f"{self.__labels(labels, bound)} {total}")
+
+                    lines.append(f"{name}_sum{self.__labels(labels)}"
+                                 f" {value.sum}")
+                    lines.append(f"{name}_count{self.__labels(labels)}"
+                                 f" {value.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def write_metrics(text: str, path: str = METRICS_PATH) -> None:
+
+    """
+        Writes rendered metrics to a file, replacing it atomically so a
+        scraper never reads half of it.
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path + ".tmp", "w") as metrics_file:
+        metrics_file.write(text)
+
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,310 @@
+import asyncio
+import os
+import struct
+import zlib
+from urllib.parse import quote
+
+
+# Messages not delivered yet are kept here, one file per conversation
+OUTBOX_PATH = os.path.join(os.path.dirname(os.path.dirname(
+                                os.path.dirname(os.path.abspath(__file__)))),
+                           "outbox")
+
+SYNC_DELAY = 0.05 # Seconds appends are gathered before one fsync
+
+# Record header: length of the text, crc32 of sequence number and text,
+# sequence number. A torn record at the end fails the crc and is dropped.
+RECORD = struct.Struct("!IIQ")
+
+# State file: id of the message stream, highest sequence number the peer
+# has acknowledged
+STATE = struct.Struct("!8sQ")
+
+
+class OutboxFile:
+
+    """
+        Append only log on disk of the chat messages of one conversation
+        that the peer has not acknowledged, so they survive a failed
+        connection and a restart of the program. Every message is written
+        to the file at once, which a crash of the program cannot undo.
+        fsync, which protects against a crash of the machine, runs on the
+        executor at most every SYNC_DELAY seconds, for every message
+        appended since. Once every message is acknowledged the file is
+        emptied, but only after the acknowledgement is safely in the state
+        file, or a crash of the machine could lose both. Sequence numbers
+        and the stream id are kept with it, so the peer can tell a message
+        sent again after a restart.
+
+        Must be used on the engine loop.
+    """
+
+    def __init__(self, path: str) -> None:
+
+        assert isinstance(path, str), (f"The given path {path} is not of"
+                                        " type str!")
+
+        self.path = path
+        self.state_path = path + ".state"
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        state = self.__load_state()
+
+        if state is None:
+            # Saved at once, replayed records must keep their stream
+            state = (os.urandom(8), 0)
+            self.stream, self.acked = state
+            self.__save_state(0)
+
+        self.stream, self.acked = state
+        self.__saved = self.acked # Acknowledgement in the state file
+
+        self.__fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND
+                                  | getattr(os, "O_BINARY", 0))
+
+        records = self.__replay()
+        last = records[-1][0] if records else 0
+
+        self.next_seq = max(last, self.acked) + 1
+        self.__size = os.fstat(self.__fd).st_size
+
+        self.__loop = asyncio.get_running_loop()
+        self.__handle = None    # Scheduled sync
+        self.__syncing = None   # Saving and fsync running on the executor
+        self.__unsynced = False # Appends since the last fsync
+        self.__state_dirty = False
+
+    @classmethod
+    def for_key(cls, key: str,
+                     directory: str = OUTBOX_PATH) -> "OutboxFile":
+
+        """
+            Returns the outbox of the conversation with the given key.
+        """
+
+        return cls(cls.path_for(key, directory))
+
+    @staticmethod
+    def path_for(key: str, directory: str = OUTBOX_PATH) -> str:
+
+        """
+            Returns the path of the outbox of the given key.
+        """
+
+        return os.path.join(directory, quote(key, safe="") + ".out")
+
+    def __load_state(self) -> tuple:
+
+        """
+            Returns the stream id and the acknowledged sequence number,
+            None if there is no state yet.
+        """
+
+        try:
+            with open(self.state_path, "rb") as state_file:
+                return STATE.unpack(state_file.read())
+
+        except (OSError, struct.error):
+            return None
+
+    def __save_state(self, acked: int) -> None:
+
+        """
+            Replaces the state file, a crash leaves the old or the new one.
+            Returns once the new one is on disk.
+        """
+
+        with open(self.state_path + ".tmp", "wb") as state_file:
+            state_file.write(STATE.pack(self.stream, acked))
+            state_file.flush()
+            os.fsync(state_file.fileno())
+
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+        if hasattr(os, "O_DIRECTORY"):
+            # The rename itself is only durable once the folder is synced
+            folder = os.open(os.path.dirname(self.state_path) or ".",
+                             os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(folder)
+            finally:
+                os.close(folder)
+
+    def __replay(self) -> list:
+
+        """
+            Returns every (seq, text) record in the file. A torn or
+            corrupt record ends the log, it and what follows is cut off.
+        """
+
+        with open(self.path, "rb") as log_file:
+            data = log_file.read()
+
+        records = []
+        offset = 0
+
+        while offset + RECORD.size <= len(data):
+            length, crc, seq = RECORD.unpack_from(data, offset)
+            end = offset + RECORD.size + length
+
+            if end > len(data):
+                break
+
+            body = data[offset + 8:end] # Sequence number and text
+
+            if zlib.crc32(body) != crc:
+                break
+
+            records.append((seq, data[offset + RECORD.size:end].decode()))
+            offset = end
+
+        if offset < len(data):
+            print(f"Outbox {self.path} cut at a torn record")
+            os.ftruncate(self.__fd, offset)
+
+        return records
+
+    def pending(self) -> list:
+
+        """
+            Returns the (seq, text) records the peer has not acknowledged.
+        """
+
+        return [record for record in self.__replay()
+                if record[0] > self.acked]
+
+    def add(self, text: str) -> int:
+
+        """
+            Appends a message and returns its sequence number.
+        """
+
+        seq = self.next_seq
+        self.next_seq += 1
+
+        data = text.encode()
+        body = struct.pack("!Q", seq) + data
+
+        record = RECORD.pack(len(data), zlib.crc32(body), seq) + data
+        os.write(self.__fd, record)
+
+        self.__size += len(record)
+        self.__unsynced = True
+        self.__sync_soon()
+
+        return seq
+
+    def acknowledge(self, seq: int) -> None:
+
+        """
+            Marks every message up to seq as delivered.
+        """
+
+        if seq > self.acked:
+            self.acked = seq
+            self.__state_dirty = True
+            self.__sync_soon()
+
+    def __sync_soon(self) -> None:
+        if self.__handle is None:
+            self.__handle = self.__loop.call_later(SYNC_DELAY, self.__sync)
+
+    def __sync(self) -> None:
+
+        """
+            Starts saving the state and an fsync of what was appended on
+            the executor. The log is emptied once that is done.
+        """
+
+        self.__handle = None
+
+        if self.__syncing is not None:
+            return # __synced starts the next one
+
+        acked = self.acked if self.__state_dirty else None
+        log = self.__unsynced
+
+        if acked is None and not log:
+            return
+
+        self.__state_dirty = False
+        self.__unsynced = False
+
+        self.__syncing = self.__loop.run_in_executor(None, self.__persist,
+                                                     acked, log)
+        self.__syncing.add_done_callback(self.__synced)
+
+    def __persist(self, acked: int, log: bool) -> int:
+
+        """
+            Runs on the executor. Saves the state if acked is given and
+            syncs the log if log is set, returns acked.
+        """
+
+        if acked is not None:
+            self.__save_state(acked)
+
+        if log:
+            os.fsync(self.__fd)
+
+        return acked
+
+    def __synced(self, future: asyncio.Future) -> None:
+        self.__syncing = None
+
+        if future.exception() is not None:
+            print(f"Could not sync outbox {self.path}:"
+                  f" {future.exception()}!")
+
+            # Tried again with the next sync
+            self.__state_dirty |= self.acked > self.__saved
+            self.__unsynced = True
+
+        elif future.result() is not None:
+            self.__saved = max(self.__saved, future.result())
+            self.__truncate()
+
+        if self.__unsynced or self.__state_dirty:
+            self.__sync_soon() # Changed while the sync ran
+
+    def __truncate(self) -> None:
+
+        """
+            Empties the log once the saved state acknowledges every record
+            in it. Runs on the loop, so no append can come in between.
+        """
+
+        if self.__size and self.__saved >= self.next_seq - 1:
+            try:
+                os.ftruncate(self.__fd, 0)
+                self.__size = 0
+
+            except OSError as e:
+                print(f"Could not empty outbox {self.path}: {e}!")
+
+    async def close(self) -> None:
+
+        """
+            Writes everything out and closes the file.
+        """
+
+        if self.__syncing is not None:
+            await asyncio.gather(self.__syncing, return_exceptions=True)
+
+        if self.__handle is not None:
+            self.__handle.cancel()
+            self.__handle = None
+
+        try:
+            if self.__state_dirty:
+                self.__save_state(self.acked)
+                self.__saved = self.acked
+
+            self.__truncate()
+            os.fsync(self.__fd)
+
+        except OSError as e:
+            print(f"Could not close outbox {self.path}: {e}!")
+
+        os.close(self.__fd)
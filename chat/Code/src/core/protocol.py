@@ -0,0 +1,279 @@
+import struct
+
+
+# Message types carried in the frame header
+MSG_CHAT = 1       # A chat message typed by the user
+MSG_CONTROL = 2    # Protocol level information, never shown to the user
+MSG_CLOSE = 3      # The sender is terminating the connection
+MSG_HELLO = 4      # First frame on a single connection, see encode_hello
+MSG_HELLO_ACK = 5  # The receiver of a hello keeps the connection
+MSG_FILE = 6       # First frame on a file transfer connection, see encode_file
+MSG_FILE_ACK = 7   # Bytes of the file the receiver has stored
+MSG_CHAT_Z = 8     # A chat message compressed with the connection's zlib stream
+MSG_HEARTBEAT = 9  # Sent on a quiet connection to show the sender is alive
+MSG_SYNC = 10      # Starts the sequenced chat messages of a connection
+MSG_ACK = 11       # Chat messages received so far, see encode_ack
+
+# Frame header: payload length (4 bytes) followed by message type (1 byte)
+HEADER = struct.Struct("!IB")
+HEADER_SIZE = HEADER.size
+
+MAX_PAYLOAD = 16 * 1024 * 1024 # Frames larger than this are rejected
+
+# Hello payload: random nonce used to break ties, the sender's server port
+# and the features it supports. The hello ack carries the features both
+# sides support. Peers that send no features support none of them.
+HELLO = struct.Struct("!8sHB")
+HELLO_V1 = struct.Struct("!8sH")
+HELLO_ACK = struct.Struct("!B")
+
+# Features negotiated in the hello
+FEATURE_ZLIB = 0x01      # Chat messages may be sent as MSG_CHAT_Z
+FEATURE_HEARTBEAT = 0x02 # Both sides send MSG_HEARTBEAT when quiet
+FEATURE_ACK = 0x04       # Chat messages are sequenced and acknowledged
+
+# File payload: transfer id, file size and the sender's server port, then name
+FILE = struct.Struct("!16sQH")
+FILE_ACK = struct.Struct("!Q")
+
+# Sync payload: id of the sender's message stream and the sequence number
+# of the first chat message after it, the next ones count up from there.
+# The ack carries the highest sequence number received.
+SYNC = struct.Struct("!8sQ")
+ACK = struct.Struct("!Q")
+
+
+class ProtocolError(Exception):
+
+    """
+        Raised when the received byte stream is not a valid frame stream.
+    """
+
+
+def encode_frame(msg_type: int, payload: bytes = b"") -> bytes:
+
+    """
+        Returns a frame containing the header and the given payload.
+    """
+
+    assert isinstance(payload, (bytes, bytearray)), (f"The given payload"
+                                                f" {payload} is not of type"
+                                                 " bytes!")
+
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload of {len(payload)} bytes is too large!")
+
+    return HEADER.pack(len(payload), msg_type) + payload
+
+
+def chat_fits(msg: str) -> bool:
+
+    """
+        Whether the message fits into one chat frame. Larger ones must be
+        refused before they are queued, they could never be sent.
+    """
+
+    return len(msg.encode()) <= MAX_PAYLOAD
+
+
+def encode_chat(msg: str) -> bytes:
+
+    """
+        Returns a chat frame containing the given message.
+    """
+
+    return encode_frame(MSG_CHAT, msg.encode())
+
+
+def encode_hello(nonce: bytes, s_port: int, features: int = 0) -> bytes:
+
+    """
+        Returns a hello frame with the given nonce, server port and
+        supported features.
+    """
+
+    return encode_frame(MSG_HELLO, HELLO.pack(nonce, s_port, features))
+
+
+def decode_hello(payload: bytes) -> tuple:
+
+    """
+        Returns the (nonce, server port, features) tuple carried by a hello
+        frame.
+    """
+
+    if len(payload) == HELLO_V1.size:
+        return HELLO_V1.unpack(payload) + (0,)
+
+    if len(payload) != HELLO.size:
+        raise ProtocolError(f"Hello of {len(payload)} bytes is malformed!")
+
+    return HELLO.unpack(payload)
+
+
+def encode_hello_ack(features: int = 0) -> bytes:
+
+    """
+        Returns a hello ack frame with the features both sides support.
+    """
+
+    return encode_frame(MSG_HELLO_ACK, HELLO_ACK.pack(features))
+
+
+def decode_hello_ack(payload: bytes) -> int:
+
+    """
+        Returns the features carried by a hello ack frame.
+    """
+
+    if payload == b"":
+        return 0
+
+    if len(payload) != HELLO_ACK.size:
+        raise ProtocolError(f"Hello ack of {len(payload)} bytes is"
+                             " malformed!")
+
+    return HELLO_ACK.unpack(payload)[0]
+
+
+def encode_file(transfer_id: bytes, size: int, s_port: int,
+                name: str) -> bytes:
+
+    """
+        Returns a file frame announcing a transfer.
+    """
+
+    return encode_frame(MSG_FILE, FILE.pack(transfer_id, size, s_port)
+                                  + name.encode())
+
+
+def decode_file(payload: bytes) -> tuple:
+
+    """
+        Returns the (transfer id, size, server port, name) tuple carried by
+        a file frame.
+    """
+
+    if len(payload) < FILE.size:
+        raise ProtocolError(f"File frame of {len(payload)} bytes is"
+                             " malformed!")
+
+    return FILE.unpack_from(payload) + (payload[FILE.size:].decode(),)
+
+
+def encode_file_ack(offset: int) -> bytes:
+
+    """
+        Returns a file ack frame with the number of bytes stored.
+    """
+
+    return encode_frame(MSG_FILE_ACK, FILE_ACK.pack(offset))
+
+
+def decode_file_ack(payload: bytes) -> int:
+
+    """
+        Returns the offset carried by a file ack frame.
+    """
+
+    if len(payload) != FILE_ACK.size:
+        raise ProtocolError(f"File ack of {len(payload)} bytes is malformed!")
+
+    return FILE_ACK.unpack(payload)[0]
+
+
+def encode_sync(stream: bytes, first: int) -> bytes:
+
+    """
+        Returns a sync frame with the stream id and the sequence number of
+        the chat message that follows it.
+    """
+
+    return encode_frame(MSG_SYNC, SYNC.pack(stream, first))
+
+
+def decode_sync(payload: bytes) -> tuple:
+
+    """
+        Returns the (stream id, first sequence number) tuple carried by a
+        sync frame.
+    """
+
+    if len(payload) != SYNC.size:
+        raise ProtocolError(f"Sync of {len(payload)} bytes is malformed!")
+
+    return SYNC.unpack(payload)
+
+
+def encode_ack(seq: int) -> bytes:
+
+    """
+        Returns an ack frame for every chat message up to seq.
+    """
+
+    return encode_frame(MSG_ACK, ACK.pack(seq))
+
+
+def decode_ack(payload: bytes) -> int:
+
+    """
+        Returns the sequence number carried by an ack frame.
+    """
+
+    if len(payload) != ACK.size:
+        raise ProtocolError(f"Ack of {len(payload)} bytes is malformed!")
+
+    return ACK.unpack(payload)[0]
+
+
+class FrameDecoder:
+
+    """
+        Streaming decoder, bytes are fed in as they arrive from the socket
+        and every complete frame is returned in one pass.
+    """
+
+    def __init__(self) -> None:
+        self.__buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+
+        """
+            Adds data to the buffer and returns a list of (type, payload)
+            tuples for every complete frame. Incomplete data is kept until
+            the rest of it arrives.
+        """
+
+        self.__buffer += data
+
+        frames = []
+        offset = 0
+        available = len(self.__buffer)
+
+        while available - offset >= HEADER_SIZE:
+            length, msg_type = HEADER.unpack_from(self.__buffer, offset)
+
+            if length > MAX_PAYLOAD:
+                raise ProtocolError(f"Frame of {length} bytes is too large!")
+
+            end = offset + HEADER_SIZE + length
+            if end > available:
+                break # Wait for the rest of the frame
+
+            frames.append((msg_type,
+                           bytes(self.__buffer[offset + HEADER_SIZE:end])))
+            offset = end
+
+        if offset:
+            del self.__buffer[:offset] # Drop everything that was decoded
+
+        return frames
+
+    @property
+    def pending(self) -> int:
+
+        """
+            Number of buffered bytes not yet part of a complete frame.
+        """
+
+        return len(self.__buffer)
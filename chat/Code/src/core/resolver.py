@@ -0,0 +1,112 @@
+import asyncio
+import socket
+import time
+
+
+TTL = 60         # Seconds a resolved name is kept
+NEGATIVE_TTL = 5 # Seconds a name that could not be resolved is kept
+
+
+def interleave(addresses: list) -> list:
+
+    """
+        Returns the addresses with the families taking turns, starting
+        with the family of the first one, the order RFC 8305 tries them in.
+    """
+
+    first = [a for a in addresses if ":" in a] # IPv6
+    second = [a for a in addresses if ":" not in a] # IPv4
+
+    if addresses and ":" not in addresses[0]:
+        first, second = second, first
+
+    result = []
+    for pair in zip(first, second):
+        result.extend(pair)
+
+    longer = first if len(first) > len(second) else second
+    result.extend(longer[min(len(first), len(second)):])
+
+    return result
+
+
+class Resolver:
+
+    """
+        Resolves host names on the engine loop and keeps the answers for
+        ttl seconds, failures for negative_ttl seconds. getaddrinfo does
+        not tell the TTL of the records, so one is used for every name.
+        Lookups of a name that is already being resolved wait for the
+        same answer.
+
+        Must be used on the engine loop.
+    """
+
+    def __init__(self, ttl: float = TTL,
+                        negative_ttl: float = NEGATIVE_TTL) -> None:
+
+        assert ttl >= 0, f"The given ttl {ttl} is negative!"
+
+        assert negative_ttl >= 0, (f"The given negative_ttl {negative_ttl}"
+                                    " is negative!")
+
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self.hits = 0   # Names answered from the cache
+        self.misses = 0 # Names looked up
+
+        self.__cache = {} # Host -> (expiry, addresses or the OSError)
+        self.__lookups = {} # Host -> lookup in progress
+
+    async def resolve(self, host: str) -> list:
+
+        """
+            Returns every address of the host, interleaved by family.
+            Raises OSError if the host cannot be resolved.
+        """
+
+        entry = self.__cache.get(host)
+
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+
+            if isinstance(entry[1], OSError):
+                raise entry[1]
+
+            return entry[1]
+
+        lookup = self.__lookups.get(host)
+
+        if lookup is None:
+            self.misses += 1
+            lookup = asyncio.ensure_future(self.__lookup(host))
+            self.__lookups[host] = lookup
+        else:
+            self.hits += 1
+
+        # A caller that gives up does not cancel the lookup of the others
+        return await asyncio.shield(lookup)
+
+    async def __lookup(self, host: str) -> list:
+
+        """
+            Resolves the host by the executor and caches the answer.
+        """
+
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                                host, None, type=socket.SOCK_STREAM)
+
+            addresses = interleave(list(dict.fromkeys(info[4][0]
+                                                      for info in infos)))
+
+            self.__cache[host] = (time.monotonic() + self.ttl, addresses)
+            return addresses
+
+        except OSError as e:
+            self.__cache[host] = (time.monotonic() + self.negative_ttl, e)
+            raise
+
+        finally:
+            del self.__lookups[host]
@@ -0,0 +1,189 @@
+import asyncio
+import socket
+import time
+from collections import deque
+from src.logger import Logger
+from src.core.metrics import ConnectionMetrics
+
+
+MAX_BATCH = 256 * 1024 # Bytes merged into one write at most
+LINGER = 0.0           # Seconds to wait for more frames before writing
+
+
+def set_nodelay(writer: asyncio.StreamWriter, nodelay: bool) -> None:
+
+    """
+        Turns Nagle's algorithm off (nodelay True) or on for the socket of
+        the writer.
+    """
+
+    sock = writer.get_extra_info("socket")
+
+    if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(nodelay))
+
+
+class SendQueue:
+
+    """
+        Outgoing frames of one connection. Frames are queued from the
+        engine loop and drained by a writer task that merges everything
+        queued into as few writes as possible. The transport writes all of
+        it even when the socket only takes part, and the task waits for the
+        peer before taking more, so a full receive window never blocks the
+        caller.
+
+        Must be created on the engine loop.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, logger: Logger,
+                        max_batch: int = MAX_BATCH, linger: float = LINGER,
+                        nodelay: bool = True,
+                        metrics: ConnectionMetrics = None) -> None:
+
+        assert isinstance(writer, asyncio.StreamWriter), (f"The given writer"
+                                    f" {writer} is not of type StreamWriter!")
+
+        assert isinstance(logger, Logger), (f"The given logger {logger}"
+                                            " is not of type Logger!")
+
+        assert isinstance(max_batch, int) and max_batch > 0, (f"The given"
+                                    f" max_batch {max_batch} is not a"
+                                     " positive int!")
+
+        self.writer = writer
+        self.logger = logger # Used to log errors
+
+        self.max_batch = max_batch
+        self.linger = linger
+        self.metrics = metrics # Bytes written and send latency, if given
+
+        set_nodelay(writer, nodelay)
+
+        self.__frames = deque()
+        self.__times = deque() # Queue time of every frame, kept for metrics
+        self.__size = 0 # Bytes queued
+        self.__wakeup = asyncio.Event()
+        self.__task = asyncio.get_running_loop().create_task(self.__run())
+
+    @property
+    def depth(self) -> int:
+
+        """
+            Number of frames waiting to be written.
+        """
+
+        return len(self.__frames)
+
+    @property
+    def size(self) -> int:
+
+        """
+            Number of bytes waiting to be written.
+        """
+
+        return self.__size
+
+    def put(self, frame: bytes) -> None:
+
+        """
+            Queues a frame, must be called on the engine loop.
+        """
+
+        self.__frames.append(frame)
+        self.__size += len(frame)
+        self.__wakeup.set()
+
+        if self.metrics is not None:
+            self.__times.append(time.perf_counter())
+
+    def __take(self) -> list:
+
+        """
+            Removes and returns queued frames up to max_batch bytes, at
+            least one frame is always taken.
+        """
+
+        batch = [self.__frames.popleft()]
+        size = len(batch[0])
+
+        while self.__frames and size + len(self.__frames[0]) <= self.max_batch:
+            frame = self.__frames.popleft()
+            batch.append(frame)
+            size += len(frame)
+
+        self.__size -= size
+        return batch
+
+    def __written(self, batch: list) -> None:
+
+        """
+            Counts a batch the socket has taken into the metrics.
+        """
+
+        now = time.perf_counter()
+        metrics = self.metrics
+
+        for frame in batch:
+            metrics.bytes_out += len(frame)
+            metrics.write_latency.observe(now - self.__times.popleft())
+
+    async def __run(self) -> None:
+
+        """
+            Writer task, drains the queue in batches.
+        """
+
+        try:
+            while True:
+                await self.__wakeup.wait()
+                self.__wakeup.clear()
+
+                if self.linger:
+                    await asyncio.sleep(self.linger) # Let more frames queue
+
+                while self.__frames:
+                    batch = self.__take()
+
+                    # One sendmsg where the transport supports it
+                    self.writer.writelines(batch)
+                    await self.writer.drain()
+
+                    if self.metrics is not None:
+                        self.__written(batch)
+
+        except asyncio.CancelledError:
+            pass
+
+        except Exception as e:
+            self.logger.log.error("Exception in send queue: %s!", e)
+
+    def abort(self) -> None:
+
+        """
+            Stops the writer task and drops what is still queued, for a
+            connection that is already lost.
+        """
+
+        self.__task.cancel()
+        self.__frames.clear()
+        self.__times.clear()
+        self.__size = 0
+
+    async def close(self, timeout: float = 1) -> None:
+
+        """
+            Stops the writer task and writes what is still queued.
+        """
+
+        self.__task.cancel()
+        await asyncio.gather(self.__task, return_exceptions=True)
+
+        try:
+            while self.__frames:
+                self.writer.writelines(self.__take())
+
+            await asyncio.wait_for(self.writer.drain(), timeout=timeout)
+
+        except Exception as e:
+            self.logger.log.error("Exception during send queue close: %s!", e)
@@ -0,0 +1,379 @@
+import asyncio
+import hashlib
+import mmap
+import os
+import shutil
+from src.logger import Logger
+from src.core.connection import read_frame, CONNECT_TIMEOUT
+from src.core.events import (Emit, EVENT_FILE_SENT, EVENT_FILE_RECEIVED,
+                             EVENT_FILE_FAILED)
+from src.core.protocol import (FrameDecoder, ProtocolError, encode_file,
+                               encode_file_ack, decode_file_ack, MSG_FILE_ACK,
+                               MSG_CLOSE)
+
+
+# Received files are stored here
+DOWNLOADS_PATH = os.path.join(os.path.dirname(os.path.dirname(
+                                os.path.dirname(os.path.abspath(__file__)))),
+                              "downloads")
+
+CHUNK = 1024 * 1024          # Bytes read from the socket at once
+FLUSH_EVERY = 16 * 1024 * 1024 # Bytes written between saved resume points
+RETRIES = 5                  # Attempts before a transfer is given up
+RETRY_DELAY = 1              # Seconds, grows with every attempt
+FINISH_TIMEOUT = 60          # Seconds to wait for the final ack
+OFFER_TIMEOUT = 60           # Seconds the receiver has to accept a file
+FREE_RESERVE = 64 * 1024 * 1024 # Bytes of the disk a file may not take
+
+
+class TransferRefused(Exception):
+
+    """
+        Raised when the receiver does not want the file or has no room
+        for it, the transfer is not retried.
+    """
+
+
+class FileSender:
+
+    """
+        Sends one file to a peer on its own connection, so chat messages
+        keep flowing meanwhile. The file is handed to the kernel with
+        sendfile and never read into Python memory. If the connection
+        breaks the transfer is resumed from the offset the receiver
+        reports.
+    """
+
+    def __init__(self, emit: Emit, logger: Logger, key: str,
+                        path: str, address: tuple, s_port: int) -> None:
+
+        assert callable(emit), f"The given emit {emit} is not callable!"
+
+        assert isinstance(logger, Logger), (f"The given logger {logger}"
+                                            " is not of type Logger!")
+
+        assert isinstance(path, str), (f"The given path {path} is not of type"
+                                        " str!")
+
+        self.emit = emit # Receives the events
+        self.logger = logger # Used to log errors
+        self.key = key       # Conversation the file is sent in
+        self.path = path
+        self.address = address
+        self.server_port = s_port
+
+        self.name = os.path.basename(path)
+
+    @staticmethod
+    def transfer_id(path: str) -> bytes:
+
+        """
+            Returns an id that stays the same while the file is unchanged,
+            so a restarted transfer of the same file resumes.
+        """
+
+        stat = os.stat(path)
+        ident = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+        return hashlib.sha1(ident.encode()).digest()[:16]
+
+    async def run(self) -> None:
+
+        """
+            Sends the file, retrying with a growing delay. The outcome is
+            emitted as an event.
+        """
+
+        for attempt in range(RETRIES):
+            try:
+                await self.__attempt()
+
+                self.emit(EVENT_FILE_SENT, (self.key, self.name))
+                return
+
+            except TransferRefused:
+                print(f"Transfer of {self.name} refused by receiver")
+                break
+
+            except (OSError, ProtocolError, asyncio.TimeoutError) as e:
+                self.logger.log.error("File transfer of %s failed: %r!",
+                                      self.name, e)
+
+                await asyncio.sleep(RETRY_DELAY * (attempt + 1))
+
+        self.emit(EVENT_FILE_FAILED, (self.key, self.name))
+
+    async def __attempt(self) -> None:
+
+        """
+            Sends what the receiver does not have yet over one connection.
+        """
+
+        transfer_id = self.transfer_id(self.path)
+        size = os.path.getsize(self.path)
+
+        reader, writer = await asyncio.wait_for(
+                                asyncio.open_connection(*self.address),
+                                timeout=CONNECT_TIMEOUT)
+
+        decoder = FrameDecoder()
+        backlog = []
+
+        try:
+            writer.write(encode_file(transfer_id, size, self.server_port,
+                                     self.name))
+
+            # The receiver may ask its user first, a refusal after its
+            # timeout must arrive before ours
+            offset = await self.__read_ack(reader, decoder, backlog,
+                                           OFFER_TIMEOUT + RETRY_DELAY * 5)
+
+            if offset < size:
+                await writer.drain()
+
+                with open(self.path, "rb") as file:
+                    # Zero copy where the platform supports it
+                    await asyncio.get_running_loop().sendfile(
+                                writer.transport, file, offset, size - offset)
+
+            offset = await self.__read_ack(reader, decoder, backlog,
+                                           FINISH_TIMEOUT)
+
+            if offset != size:
+                raise ProtocolError(f"Receiver stored {offset} of {size}"
+                                     " bytes!")
+
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def __read_ack(reader: asyncio.StreamReader, decoder: FrameDecoder,
+                         backlog: list, timeout: float) -> int:
+
+        """
+            Returns the offset of the next file ack.
+        """
+
+        msg_type, payload = await asyncio.wait_for(
+                                    read_frame(reader, decoder, backlog),
+                                    timeout=timeout)
+
+        if msg_type is None:
+            # Lost, not refused, the next attempt resumes
+            raise ConnectionResetError("Receiver closed the connection")
+
+        if msg_type == MSG_CLOSE:
+            raise TransferRefused()
+
+        if msg_type != MSG_FILE_ACK:
+            raise ProtocolError(f"Unexpected frame {msg_type} in transfer!")
+
+        return decode_file_ack(payload)
+
+
+class FileReceiver:
+
+    """
+        Receives one file into a preallocated, memory mapped part file.
+        The number of bytes stored is saved next to it every FLUSH_EVERY
+        bytes, and reported to the sender when it reconnects.
+    """
+
+    def __init__(self, emit: Emit, logger: Logger, key: str,
+                        directory: str = DOWNLOADS_PATH) -> None:
+
+        assert callable(emit), f"The given emit {emit} is not callable!"
+
+        assert isinstance(logger, Logger), (f"The given logger {logger}"
+                                            " is not of type Logger!")
+
+        self.emit = emit # Receives the events
+        self.logger = logger # Used to log errors
+        self.key = key       # Conversation the file is received in
+        self.directory = directory
+
+    def __part_path(self, transfer_id: bytes) -> str:
+        return os.path.join(self.directory, transfer_id.hex() + ".part")
+
+    def has_room(self, transfer_id: bytes, size: int) -> bool:
+
+        """
+            Whether the file fits on the disk, leaving FREE_RESERVE bytes
+            free. The part file of a resumed transfer already has its room.
+        """
+
+        part = self.__part_path(transfer_id)
+
+        try:
+            if os.path.exists(part) and os.path.getsize(part) == size:
+                return True
+
+            os.makedirs(self.directory, exist_ok=True)
+
+            return size + FREE_RESERVE <= shutil.disk_usage(
+                                                    self.directory).free
+
+        except OSError as e:
+            self.logger.log.error("Could not check room for a file: %s!", e)
+            return False
+
+    @staticmethod
+    def __load_offset(state: str, part: str, size: int) -> int:
+
+        """
+            Returns the saved resume point of a part file, or 0.
+        """
+
+        try:
+            with open(state, "r") as state_file:
+                offset = int(state_file.read())
+
+            if os.path.getsize(part) == size and 0 <= offset <= size:
+                return offset
+
+        except (OSError, ValueError):
+            pass
+
+        return 0
+
+    @staticmethod
+    def __save_offset(state: str, offset: int) -> None:
+
+        """
+            Saves the resume point, replacing the old one atomically.
+        """
+
+        with open(state + ".tmp", "w") as state_file:
+            state_file.write(str(offset))
+
+        os.replace(state + ".tmp", state)
+
+    @staticmethod
+    def __allocate(file, size: int) -> None:
+
+        """
+            Reserves the room of the file, may take a while on large files.
+        """
+
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(file.fileno(), 0, size)
+        else:
+            file.truncate(size)
+
+    def __checkpoint(self, mapped: mmap.mmap, state: str,
+                     position: int) -> None:
+
+        """
+            Writes the mapped file to disk and saves the resume point.
+        """
+
+        mapped.flush()
+        self.__save_offset(state, position)
+
+    def __final_path(self, name: str) -> str:
+
+        """
+            Returns a path in the download folder that is not taken yet.
+        """
+
+        base, ext = os.path.splitext(name)
+        path = os.path.join(self.directory, name)
+        number = 1
+
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{base} ({number}){ext}")
+            number += 1
+
+        return path
+
+    async def receive(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter, transfer_id: bytes,
+                      size: int, name: str) -> None:
+
+        """
+            Receives the file announced by a file frame. The outcome is
+            emitted as an event.
+        """
+
+        name = os.path.basename(name) or transfer_id.hex() # No paths
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        part = self.__part_path(transfer_id)
+        state = part + ".offset"
+
+        offset = self.__load_offset(state, part, size)
+        loop = asyncio.get_running_loop()
+
+        with open(part, "r+b" if offset else "w+b") as file:
+            if offset == 0 and size:
+                # Off the loop, chats and heartbeats go on meanwhile
+                await loop.run_in_executor(None, self.__allocate, file, size)
+
+            writer.write(encode_file_ack(offset))
+
+            position = offset
+
+            if size:
+                with mmap.mmap(file.fileno(), size) as mapped:
+                    position = await self.__copy(reader, mapped, offset,
+                                                 size, state)
+
+        if position < size:
+            print(f"Transfer of {name} interrupted at {position} bytes")
+            writer.close()
+            return
+
+        path = self.__final_path(name)
+        os.replace(part, path)
+
+        if os.path.exists(state):
+            os.remove(state)
+
+        writer.write(encode_file_ack(size))
+
+        try:
+            await asyncio.wait_for(writer.drain(), timeout=1)
+        finally:
+            writer.close()
+
+        self.emit(EVENT_FILE_RECEIVED, (self.key, path))
+
+    async def __copy(self, reader: asyncio.StreamReader, mapped: mmap.mmap,
+                     position: int, size: int, state: str) -> int:
+
+        """
+            Copies from the socket into the mapped file until the file is
+            complete or the socket closes, returns the bytes stored.
+        """
+
+        saved = position
+        loop = asyncio.get_running_loop()
+
+        try:
+            while position < size:
+                data = await reader.read(min(CHUNK, size - position))
+
+                if data == b"":
+                    break
+
+                mapped[position:position + len(data)] = data
+                position += len(data)
+
+                if position - saved >= FLUSH_EVERY:
+                    await loop.run_in_executor(None, self.__checkpoint,
+                                               mapped, state, position)
+                    saved = position
+
+        except OSError as e:
+            self.logger.log.error("File receive interrupted: %r!", e)
+
+        except asyncio.CancelledError:
+            print(f"File receive cancelled at {position} bytes")
+            raise # After the resume point is saved below
+
+        finally:
+            await loop.run_in_executor(None, self.__checkpoint, mapped,
+                                       state, position)
+
+        return position
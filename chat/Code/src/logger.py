@@ -1,28 +1,107 @@
-from asyncio.log import logger
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+
+
+# Kept in the log folder of the program
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(
+                                os.path.abspath(__file__))),
+                        "log", "chat_program.log")
+
+LOG_FORMAT = "%(levelname)s %(asctime)s %(message)s"
+LOG_LEVEL = "INFO"        # Used if neither level nor CHAT_LOG_LEVEL is set
+MAX_BYTES = 1024 * 1024   # The log file is rotated at this size
+BACKUPS = 5               # Rotated files kept, chat_program.log.1 and on
+
 
 class Logger:
     """
-        Mainly used to log errors.
+        Mainly used to log errors. Records are put on a queue and written
+        to a rotating file by a background thread, so the GUI loop and the
+        network engine never wait for the disk. The level is the given
+        level, else the CHAT_LOG_LEVEL environment variable, else
+        LOG_LEVEL. Every Logger shares one file and one writer thread. A
+        forked process gets a queue and writer thread of its own.
     """
-    def __init__(self) -> None:
-        LOG_FORMAT = "%(levelname)s %(asctime)s %(message)s"
-        try:
-            logging.basicConfig(filename = f".\Code\log\chat_program.log", 
-                                level=logging.DEBUG, # Change logging level
-                                format=LOG_FORMAT,
-                                filemode='a')
-        except:
-            print("OY")
-            logging.basicConfig(filename = f".\log\chat_program.log", 
-                                level=logging.DEBUG, # Change logging level
-                                format=LOG_FORMAT,
-                                filemode='w')
+
+    __listener = None # Writes queued records to the file
+    __queue_handler = None # Puts records on the queue of the listener
+
+    def __init__(self, level: str = None, path: str = LOG_PATH) -> None:
+        level = (level or os.environ.get("CHAT_LOG_LEVEL")
+                 or LOG_LEVEL).upper()
+
+        assert isinstance(logging.getLevelName(level), int), (f"The given"
+                                    f" level {level} is not a logging level!")
+
         self.__log = logging.getLogger()
+        self.__log.setLevel(level) # Disabled records are never formatted
+
+        if Logger.__queue_handler is None:
+            Logger.__listener = self.__start(path)
+
+    def __start(self, path: str) -> logging.handlers.QueueListener:
+        """
+            Routes every record through a queue to the file handler.
+        """
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        except OSError as e:
+            print(f"Could not create log folder: {e}!")
+
+        handler = logging.handlers.RotatingFileHandler(path,
+                                                       maxBytes=MAX_BYTES,
+                                                       backupCount=BACKUPS,
+                                                       encoding="utf-8",
+                                                       delay=True)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        records = queue.SimpleQueue()
+        Logger.__queue_handler = logging.handlers.QueueHandler(records)
+        self.__log.addHandler(Logger.__queue_handler)
+
+        listener = logging.handlers.QueueListener(records, handler)
+        listener.start()
+
+        atexit.register(Logger.stop) # Writes what is still queued
+
+        if hasattr(os, "register_at_fork"):
+            # The writer thread is not copied into a forked process
+            os.register_at_fork(after_in_child=Logger.__after_fork)
+
+        return listener
+
+    @staticmethod
+    def __after_fork() -> None:
+        """
+            Starts a writer thread in a forked process, on a new queue so
+            records the parent had queued are not written twice.
+        """
+        if Logger.__listener is None:
+            return
+
+        records = queue.SimpleQueue()
+        Logger.__queue_handler.queue = records
+
+        Logger.__listener = logging.handlers.QueueListener(
+                                    records, *Logger.__listener.handlers)
+        Logger.__listener.start()
+
+    @staticmethod
+    def stop() -> None:
+        """
+            Writes what is still queued and stops the writer thread. Run
+            at exit, processes that end with os._exit must call it.
+        """
+        if Logger.__listener is not None:
+            Logger.__listener.stop()
+            Logger.__listener = None
 
     @property
     def log(self) -> logging.getLogger:
         """
             Access to logging object
         """
-        return self.__log
\ No newline at end of file
+        return self.__log
@@ -0,0 +1,99 @@
+import PySimpleGUI as sg
+import time
+from src.core.history import HistoryStore
+from src.timestamp import TimeStamp
+
+
+class SearchUI:
+
+    """
+        A window to search the message history of every contact.
+    """
+
+    def __init__(self, history: HistoryStore) -> None:
+
+        assert isinstance(history, HistoryStore), (f"The given history"
+                                    f" {history} is not of type HistoryStore!")
+
+        self.history = history
+        self.time_stamp = TimeStamp()
+        self.window = self.make_window()
+
+    @staticmethod
+    def make_window() -> sg.Window:
+
+        layout =    [
+                        [sg.Text("Words:", size=(8,1)),
+                         sg.Input(expand_x=True, key="WORDS")],
+
+                        [sg.Text("Contact:", size=(8,1)),
+                         sg.Input(expand_x=True, key="CONTACT")],
+
+                        [sg.Text("From:", size=(8,1)),
+                         sg.Input(size=(12,1), key="SINCE"),
+                         sg.Text("To:"),
+                         sg.Input(size=(12,1), key="UNTIL"),
+                         sg.Text("(YYYY-MM-DD)")],
+
+                        [sg.Button("Search", bind_return_key=True),
+                         sg.Text("", key="OUTPUT")],
+
+                        [sg.Listbox(values=[], key="RESULTS",
+                         expand_x=True, expand_y=True)]
+                    ]
+
+        return sg.Window("Search history", layout, size=(600, 450))
+
+    @staticmethod
+    def parse_date(text: str) -> float:
+
+        """
+            Returns the local midnight of a YYYY-MM-DD date in seconds
+            since the epoch, or None if no date is given.
+        """
+
+        if text.strip() == "":
+            return None
+
+        return time.mktime(time.strptime(text.strip(), "%Y-%m-%d"))
+
+    def run(self) -> None:
+
+        """
+            Runs the search window.
+        """
+
+        while True:
+            event, values = self.window.read()
+
+            if event == sg.WIN_CLOSED:
+                break
+
+            if event == "Search":
+                try:
+                    since = self.parse_date(values["SINCE"])
+                    until = self.parse_date(values["UNTIL"])
+                except ValueError:
+                    self.window["OUTPUT"].update("Dates need to be"
+                                                 " YYYY-MM-DD")
+                    continue
+
+                if until is not None:
+                    until += 24 * 60 * 60 # Include the whole last day
+
+                contact = values["CONTACT"].strip() or None
+
+                start = time.perf_counter()
+                rows = self.history.search(values["WORDS"], contact=contact,
+                                           since=since, until=until)
+                elapsed = (time.perf_counter() - start) * 1000
+
+                self.window["RESULTS"].update(values=[
+                        self.time_stamp.get_time(seconds) + " "
+                        + ("ME to " + name if sent else name) + ": " + text
+                        for _, name, sent, seconds, text in rows])
+
+                self.window["OUTPUT"].update(f"{len(rows)} messages found in"
+                                             f" {elapsed:.1f} ms")
+
+        self.window.close()
@@ -0,0 +1,71 @@
+import PySimpleGUI as sg
+from src.core.manager import ConnectionManager
+from src.core.metrics import write_metrics, METRICS_PATH
+
+
+REFRESH_MS = 1000 # The shown metrics are refreshed this often
+
+
+class StatsUI:
+
+    """
+        A window showing the live metrics of every connection and of the
+        chat window, as the metrics endpoint serves them.
+    """
+
+    def __init__(self, manager: ConnectionManager) -> None:
+
+        assert isinstance(manager, ConnectionManager), (f"The given manager"
+                            f" {manager} is not of type ConnectionManager!")
+
+        self.manager = manager
+        self.window = self.make_window()
+
+    @staticmethod
+    def make_window() -> sg.Window:
+
+        layout =    [
+                        [sg.Multiline(expand_x=True, expand_y=True,
+                         disabled=True, key="METRICS", font=("Courier", 9))],
+
+                        [sg.Button("Refresh"), sg.Button("Export"),
+                         sg.Text("", key="OUTPUT")]
+                    ]
+
+        return sg.Window("Statistics", layout, size=(700, 500),
+                         finalize=True)
+
+    def refresh(self) -> None:
+
+        """
+            Shows the current metrics.
+        """
+
+        self.window["METRICS"].update(self.manager.metrics())
+
+    def run(self) -> None:
+
+        """
+            Runs the statistics window.
+        """
+
+        self.refresh()
+
+        while True:
+            event, values = self.window.read(timeout=REFRESH_MS)
+
+            if event == sg.WIN_CLOSED:
+                break
+
+            if event in ("Refresh", sg.TIMEOUT_EVENT):
+                self.refresh()
+
+            if event == "Export":
+                try:
+                    write_metrics(self.manager.metrics())
+                    self.window["OUTPUT"].update(f"Saved to {METRICS_PATH}")
+
+                except OSError as e:
+                    self.window["OUTPUT"].update(f"Could not save: {e}!")
+
+        self.window.close()
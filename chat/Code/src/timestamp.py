@@ -1,16 +1,25 @@
 import time
+from functools import lru_cache
 
 class TimeStamp:
 
     """
-        Used to get timestamp.
+        Used to get timestamp. Texts are cached per second, so the
+        messages of one second are formatted once.
     """
 
     @staticmethod
-    def get_time() -> time.ctime:
+    def get_time(seconds: float = None) -> time.ctime:
 
         """
-            Used to get timestamp.
+            Used to get timestamp, of now or of the given time in seconds
+            since the epoch.
         """
 
-        return time.ctime()
\ No newline at end of file
+        return TimeStamp.second_text(int(time.time() if seconds is None
+                                         else seconds))
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def second_text(second: int) -> str:
+        return time.ctime(second)
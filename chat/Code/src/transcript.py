@@ -0,0 +1,194 @@
+import time
+from collections import deque
+import PySimpleGUI as sg
+from src.core.messages import MessageLog, STATUS, ME
+
+
+SCROLLBACK = 5000 # Default number of lines kept in the transcript
+
+
+class Transcript:
+
+    """
+        Append only view over the 'MESSAGES' multiline. New lines are added
+        to the end of the widget and the oldest lines are trimmed once the
+        scrollback is full, so each message costs the same to render no
+        matter how long the session runs. Lines are kept as records of a
+        MessageLog and formatted when they are shown, so exporting and
+        filtering read the records instead of parsing lines.
+    """
+
+    def __init__(self, element: sg.Multiline, scrollback: int = SCROLLBACK
+                                                                ) -> None:
+
+        assert isinstance(element, sg.Multiline), (f"The given element"
+                                            f" {element} is not of type"
+                                             " PySimpleGUI.Multiline!")
+
+        assert isinstance(scrollback, int) and scrollback > 0, (f"The given"
+                                        f" scrollback {scrollback} is not a"
+                                         " positive int!")
+
+        self.element = element
+        self.scrollback = scrollback
+
+        self.log = MessageLog(limit=scrollback) # Recent lines
+        # Text lines of every row shown in the widget, a message with line
+        # breaks takes several
+        self.__spans = deque()
+
+    @property
+    def lines(self) -> list:
+
+        """
+            The lines currently kept in memory.
+        """
+
+        return self.log.lines()
+
+    def reset(self, text: str = "") -> None:
+
+        """
+            Replaces the whole transcript, used for status messages such
+            as "Connected!".
+        """
+
+        self.log.clear()
+
+        for line in text.split("\n") if text else []:
+            self.log.add(STATUS, line)
+
+        lines = self.log.lines()
+
+        self.element.update("\n".join(lines))
+        self.__spans = deque(self.__span(line) for line in lines)
+
+    def append(self, lines: list) -> None:
+
+        """
+            Adds the given status lines to the end of the transcript.
+        """
+
+        for line in lines:
+            self.log.add(STATUS, line)
+
+        self.__show(lines)
+
+    def add(self, key: str, sent: bool, texts: list,
+                  seconds: float = None) -> None:
+
+        """
+            Adds messages sent to or received from the conversation with
+            the given key, now or at the given seconds since the epoch.
+        """
+
+        sender = ME if sent else self.log.sender_id(key)
+        seconds = time.time() if seconds is None else seconds
+
+        for text in texts:
+            self.log.add(sender, text, seconds)
+
+        self.__show([self.log.format(seconds, sender, text)
+                     for text in texts])
+
+    def add_rows(self, key: str, rows: list) -> None:
+
+        """
+            Adds messages loaded from history, (id, sent, seconds, text).
+        """
+
+        sender = self.log.sender_id(key)
+        lines = []
+
+        for _, sent, seconds, text in rows:
+            sender_id = ME if sent else sender
+
+            self.log.add(sender_id, text, seconds)
+            lines.append(self.log.format(seconds, sender_id, text))
+
+        self.__show(lines)
+
+    def export(self, path: str, words: str = None) -> int:
+
+        """
+            Writes the lines kept in memory to a text file, only those
+            containing words if given. Returns the number of lines written.
+        """
+
+        lines = self.log.lines(words=words)
+
+        with open(path, "w", encoding="utf-8") as export_file:
+            export_file.writelines(line + "\n" for line in lines)
+
+        return len(lines)
+
+    def __show(self, lines: list) -> None:
+
+        """
+            Adds lines to the end of the widget.
+        """
+
+        if not lines:
+            return
+
+        text = "\n".join(lines)
+        if self.__spans:
+            text = "\n" + text
+
+        self.element.update(text, append=True)
+        self.__spans.extend(self.__span(line) for line in lines)
+
+        if len(self.__spans) > self.scrollback:
+            self.__trim(len(self.__spans) - self.scrollback)
+
+    def prepend_rows(self, key: str, rows: list) -> int:
+
+        """
+            Adds older messages loaded from history, (id, sent, seconds,
+            text), to the top. Only as many of the newest of them as fit in
+            the scrollback are added, returns how many.
+        """
+
+        sender = self.log.sender_id(key)
+        records = [(seconds, ME if sent else sender, text)
+                   for _, sent, seconds, text in rows]
+
+        count = self.log.prepend(records)
+        if not count:
+            return 0
+
+        lines = [self.log.format(*record) for record in records[-count:]]
+
+        text = "\n".join(lines)
+        if self.__spans:
+            text += "\n"
+
+        widget = self.element.Widget
+        state = widget.cget("state")
+
+        widget.configure(state="normal")
+        widget.insert("1.0", text)
+        widget.configure(state=state)
+
+        self.__spans.extendleft(self.__span(line) for line in reversed(lines))
+
+        return count
+
+    @staticmethod
+    def __span(line: str) -> int:
+        return line.count("\n") + 1
+
+    def __trim(self, count: int) -> None:
+
+        """
+            Deletes the given number of rows from the top of the widget.
+        """
+
+        lines = sum(self.__spans.popleft() for _ in range(count))
+
+        widget = self.element.Widget
+        state = widget.cget("state")
+
+        widget.configure(state="normal")
+        widget.delete("1.0", f"{lines + 1}.0")
+        widget.configure(state=state)
@@ -0,0 +1,30 @@
+"""
+    Tests of the message history store.
+
+    Run from the Code folder: python -m pytest tests
+"""
+
+import os
+import sys
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE)
+
+from src.core.history import HistoryStore
+
+
+def test_add_soon_keeps_order_and_close_writes_it(tmp_path):
+    path = str(tmp_path / "history.db")
+
+    history = HistoryStore(path)
+    for i in range(500):
+        history.add_soon("bob", i % 2 == 0, [f"message {i}"])
+    history.close()
+
+    history = HistoryStore(path)
+    rows = history.page("bob", limit=1000)
+    history.close()
+
+    assert [text for _, _, _, text in rows] == [f"message {i}"
+                                                for i in range(500)]
+    assert [sent for _, sent, _, _ in rows[:2]] == [1, 0]
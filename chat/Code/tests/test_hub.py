@@ -0,0 +1,116 @@
+"""
+    Tests of the relay hub with raw members over loopback.
+
+    Run from the Code folder: python -m pytest tests
+"""
+
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE)
+
+from src.logger import Logger
+from src.core.hub import RelayHub
+from src.core.protocol import (FrameDecoder, encode_frame, encode_hello,
+                               MSG_CHAT, MSG_CONTROL, MSG_HELLO_ACK,
+                               MAX_PAYLOAD)
+
+
+def join(port: int) -> socket.socket:
+
+    """
+        Connects a member to the hub and waits until it is in the lobby.
+    """
+
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(encode_hello(os.urandom(8), 1500))
+
+    assert next_frame(sock, FrameDecoder(), [])[0] == MSG_HELLO_ACK
+
+    return sock
+
+
+def next_frame(sock: socket.socket, decoder: FrameDecoder,
+               backlog: list) -> tuple:
+    sock.settimeout(10)
+
+    while not backlog:
+        data = sock.recv(1024 * 1024)
+        assert data, "The hub closed the connection"
+        backlog.extend(decoder.feed(data))
+
+    return backlog.pop(0)
+
+
+@pytest.fixture
+def hub():
+    hub = RelayHub(logger=Logger(), port=0, host="127.0.0.1")
+    hub.open()
+
+    thread = threading.Thread(target=hub.run, daemon=True)
+    thread.start()
+
+    yield hub, thread
+
+    hub.stop()
+    thread.join(timeout=5)
+
+
+def test_too_large_after_prefix_is_dropped(hub):
+    hub, thread = hub
+    port = hub.server_soc.getsockname()[1]
+
+    sender = join(port)
+    receiver = join(port)
+
+    # Fits a frame, but not with the sender's name in front
+    sender.sendall(encode_frame(MSG_CHAT, b"x" * MAX_PAYLOAD))
+    sender.sendall(encode_frame(MSG_CHAT, b"still here"))
+
+    msg_type, payload = next_frame(receiver, FrameDecoder(), [])
+
+    assert msg_type == MSG_CHAT
+    assert payload.endswith(b": still here")
+    assert thread.is_alive()
+
+    sender.close()
+    receiver.close()
+
+
+def test_worker_survives_bad_bus_frames(hub):
+    hub, thread = hub
+    port = hub.server_soc.getsockname()[1]
+
+    ours, theirs = socket.socketpair()
+    hub.link(ours, "worker 1")
+    theirs.sendall(encode_frame(MSG_CONTROL, b"join lobby"))
+
+    sender = join(port)
+    receiver = join(port)
+
+    # Fits a frame with the sender's name, not inside a bus frame
+    name = f"127.0.0.1:{sender.getsockname()[1]}: ".encode()
+    sender.sendall(encode_frame(MSG_CHAT, b"x" * (MAX_PAYLOAD - len(name))))
+
+    theirs.sendall(encode_frame(MSG_CHAT, b"")) # No room name in it
+    sender.sendall(encode_frame(MSG_CHAT, b"still here"))
+
+    for sock in (receiver, theirs):
+        decoder, backlog = FrameDecoder(), []
+
+        msg_type, payload = next_frame(sock, decoder, backlog)
+        while msg_type == MSG_CONTROL: # Rooms announced over the bus
+            msg_type, payload = next_frame(sock, decoder, backlog)
+
+        assert msg_type == MSG_CHAT
+        assert payload.endswith(b": still here")
+
+    assert thread.is_alive()
+
+    for sock in (sender, receiver, theirs):
+        sock.close()
@@ -0,0 +1,190 @@
+"""
+    Tests of conversations between ConnectionManagers over loopback.
+
+    Run from the Code folder: python -m pytest tests
+"""
+
+import os
+import socket
+import sys
+import time
+from queue import SimpleQueue
+
+import pytest
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE)
+
+from src.logger import Logger
+from src.core.contact import ContactRepository
+from src.core.engine import NetworkEngine
+from src.core.events import EVENT_CONNECTED, EVENT_DELIVERED, EVENT_MESSAGES
+from src.core.manager import ConnectionManager
+from src.core.outbox import OutboxFile
+from src.core.protocol import encode_hello, FEATURE_ACK
+
+
+PORT = 17900 # The app, the peer listens on the next port
+
+
+def wait_for(events: SimpleQueue, wanted: str) -> object:
+
+    """
+        Returns the value of the next event of the wanted kind.
+    """
+
+    while True:
+        event, value = events.get(timeout=10)
+
+        if event == wanted:
+            return value
+
+
+def connect(port: int) -> socket.socket:
+
+    """
+        Connects once the manager listens, it binds on the engine loop.
+    """
+
+    for _ in range(100):
+        try:
+            return socket.create_connection(("127.0.0.1", port))
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+
+    raise ConnectionRefusedError(f"Nothing listens on port {port}")
+
+
+@pytest.fixture
+def engine():
+    engine = NetworkEngine(logger=Logger())
+    engine.start()
+
+    yield engine
+
+    engine.stop()
+
+
+def manager(engine: NetworkEngine, port: int, **options) -> tuple:
+    events = SimpleQueue()
+
+    manager = ConnectionManager(emit=lambda event, value:
+                                    events.put((event, value)),
+                                logger=engine.logger, engine=engine,
+                                s_port=port, **options)
+    manager.listen()
+
+    return manager, events
+
+
+def test_contact_that_connects_gets_its_name(engine, tmp_path):
+    contacts = ContactRepository(str(tmp_path / "contacts.csv"))
+    contacts.add("bob", "127.0.0.1", PORT + 1)
+
+    app, app_events = manager(engine, PORT, contacts=contacts,
+                              outbox=str(tmp_path / "app"))
+    bob, bob_events = manager(engine, PORT + 1, outbox=None)
+
+    try:
+        bob.open(key="app", ip="127.0.0.1", port=PORT)
+
+        assert wait_for(app_events, EVENT_CONNECTED) == "bob"
+
+    finally:
+        bob.close_all()
+        app.close_all()
+
+
+def test_stranger_gets_an_outbox_once_written_to(engine, tmp_path):
+    outbox = str(tmp_path / "app")
+    stranger = f"127.0.0.1:{PORT + 1}"
+
+    app, app_events = manager(engine, PORT, outbox=outbox)
+    peer, peer_events = manager(engine, PORT + 1, outbox=None)
+
+    try:
+        peer.open(key="app", ip="127.0.0.1", port=PORT)
+
+        assert wait_for(app_events, EVENT_CONNECTED) == stranger
+        assert not os.path.exists(OutboxFile.path_for(stranger, outbox))
+
+        app.send(stranger, "hello")
+
+        assert wait_for(peer_events, EVENT_MESSAGES) == ("app", ["hello"])
+        assert os.path.exists(OutboxFile.path_for(stranger, outbox))
+
+    finally:
+        peer.close_all()
+        app.close_all()
+
+
+def test_takeover_keeps_messages_in_the_contacts_outbox(engine, tmp_path):
+    outbox = str(tmp_path / "app")
+    stranger = f"127.0.0.1:{PORT + 1}"
+
+    app, app_events = manager(engine, PORT, outbox=outbox)
+    app.send("bob", "while offline") # Kept in the outbox of bob
+
+    # Never acknowledges, so every message stays in an outbox
+    bob = connect(PORT)
+
+    try:
+        bob.sendall(encode_hello(os.urandom(8), PORT + 1, FEATURE_ACK))
+
+        assert wait_for(app_events, EVENT_CONNECTED) == stranger
+
+        app.send(stranger, "before the takeover")
+        app.open(key="bob", ip="127.0.0.1", port=PORT + 1)
+
+        # Messages in flight end the connection, it is dialed again
+        bob.settimeout(10)
+        while bob.recv(65536):
+            pass
+
+        app.send("bob", "after the takeover")
+
+    finally:
+        bob.close()
+        app.close_all()
+
+    async def pending(key: str) -> list:
+        store = OutboxFile.for_key(key, outbox)
+        records = store.pending()
+        await store.close()
+
+        return [msg for _, msg in records]
+
+    # Replayed for bob after a restart, nothing left under the stranger
+    assert engine.submit(pending(stranger)).result(timeout=5) == []
+    assert engine.submit(pending("bob")).result(timeout=5) == [
+                    "while offline", "before the takeover",
+                    "after the takeover"]
+
+
+def test_acknowledged_messages_are_timed(engine, tmp_path):
+    app, app_events = manager(engine, PORT, outbox=None)
+    peer, peer_events = manager(engine, PORT + 1, outbox=None)
+
+    try:
+        peer.open(key="app", ip="127.0.0.1", port=PORT)
+        stranger = wait_for(app_events, EVENT_CONNECTED)
+
+        for i in range(3):
+            app.send(stranger, f"message {i}")
+
+        delivered = 0
+        while delivered < 3: # Acknowledged once per read of the peer
+            delivered += wait_for(app_events, EVENT_DELIVERED)[1]
+
+        metrics = app.metrics()
+
+    finally:
+        peer.close_all()
+        app.close_all()
+
+    counts = [line for line in metrics.splitlines()
+              if line.startswith("chat_ack_latency_seconds_count")]
+
+    assert len(counts) == 1 and counts[0].endswith(" 3")
+    assert "chat_write_latency_seconds_count" in metrics
+    assert "chat_send_latency_seconds" not in metrics
@@ -0,0 +1,100 @@
+"""
+    Tests of the outbox file. The crash test kills a writer process at
+    random moments, in the middle of appends, state saves and fsyncs, and
+    checks that every added message comes back.
+
+    Run from the Code folder: python -m pytest tests
+"""
+
+import asyncio
+import os
+import random
+import sys
+
+import pytest
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE)
+
+from src.core.outbox import OutboxFile, STATE, SYNC_DELAY
+from bench.outbox import crash_once, torn
+
+
+def test_kill_mid_flush(tmp_path):
+    path = str(tmp_path / "crash.out")
+
+    for _ in range(8):
+        assert crash_once(path, random.uniform(0.2, 0.6)) is None
+
+    assert torn(path) is None
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"),
+                    reason="needs /proc to name synced files")
+def test_truncated_after_state_synced(tmp_path, monkeypatch):
+    path = str(tmp_path / "peer.out")
+    calls = [] # ("fsync", path) and ("truncate", acked in the state file)
+
+    fsync = os.fsync
+    ftruncate = os.ftruncate
+
+    def record_fsync(fd: int) -> None:
+        calls.append(("fsync", os.readlink(f"/proc/self/fd/{fd}")))
+        fsync(fd)
+
+    def record_truncate(fd: int, length: int) -> None:
+        with open(path + ".state", "rb") as state_file:
+            calls.append(("truncate", STATE.unpack(state_file.read())[1]))
+        ftruncate(fd, length)
+
+    monkeypatch.setattr(os, "fsync", record_fsync)
+    monkeypatch.setattr(os, "ftruncate", record_truncate)
+
+    async def run() -> None:
+        store = OutboxFile(path)
+        del calls[:]
+
+        for i in range(3):
+            store.add(f"message {i}")
+
+        store.acknowledge(3)
+        await asyncio.sleep(SYNC_DELAY * 4)
+
+        assert os.path.getsize(path) == 0
+        await store.close()
+
+    asyncio.run(run())
+
+    truncate = calls.index(("truncate", 3))
+    synced = [name for kind, name in calls[:truncate] if kind == "fsync"]
+
+    # The state and its folder were on disk before the log was emptied
+    assert path + ".state.tmp" in synced
+    assert str(tmp_path) in synced
+
+
+def test_numbers_continue_after_truncate(tmp_path):
+    path = str(tmp_path / "peer.out")
+
+    async def run() -> tuple:
+        store = OutboxFile(path)
+        stream = store.stream
+
+        for i in range(5):
+            store.add(f"message {i}")
+
+        store.acknowledge(5)
+        await store.close()
+
+        store = OutboxFile(path)
+        seq = store.add("after restart")
+        pending = store.pending()
+        await store.close()
+
+        return stream, store.stream, seq, pending
+
+    stream, reopened, seq, pending = asyncio.run(run())
+
+    assert reopened == stream
+    assert seq == 6 # Not reused, the peer would drop it
+    assert pending == [(6, "after restart")]
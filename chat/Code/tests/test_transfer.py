@@ -0,0 +1,113 @@
+"""
+    Tests of file transfers between a FileSender and scripted receivers
+    over loopback.
+
+    Run from the Code folder: python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE)
+
+import src.core.transfer as transfer
+from src.logger import Logger
+from src.core.connection import read_frame
+from src.core.events import EVENT_FILE_SENT
+from src.core.protocol import (FrameDecoder, decode_file, encode_file_ack,
+                               MSG_FILE)
+from src.core.transfer import FileSender, FileReceiver
+
+
+SIZE = 8 * 1024 * 1024
+CUT = 1024 * 1024 # Bytes the receiver takes before it drops the connection
+
+
+def test_resumes_after_receiver_closes(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "RETRY_DELAY", 0)
+
+    path = str(tmp_path / "big.bin")
+    data = os.urandom(SIZE)
+
+    with open(path, "wb") as file:
+        file.write(data)
+
+    received = bytearray()
+    attempts = []
+    events = []
+
+    async def receiver(reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter) -> None:
+        attempts.append(len(received))
+
+        msg_type, payload = await read_frame(reader, FrameDecoder(), [])
+        assert msg_type == MSG_FILE
+        size = decode_file(payload)[1]
+
+        writer.write(encode_file_ack(len(received)))
+
+        end = CUT if len(attempts) == 1 else size
+        while len(received) < end:
+            received.extend(await reader.read(end - len(received)))
+
+        if len(attempts) == 1:
+            # Stores no more and hangs up, the sender reads EOF for its ack
+            writer.write_eof()
+            while await reader.read(CUT):
+                pass
+        else:
+            writer.write(encode_file_ack(len(received)))
+            await writer.drain()
+
+        writer.close()
+
+    async def run() -> None:
+        server = await asyncio.start_server(receiver, "127.0.0.1", 0)
+        address = server.sockets[0].getsockname()
+
+        sender = FileSender(emit=lambda event, value:
+                                events.append(event),
+                            logger=Logger(), key="peer", path=path,
+                            address=address, s_port=1500)
+        await sender.run()
+
+        server.close()
+
+    asyncio.run(run())
+
+    assert events == [EVENT_FILE_SENT]
+    assert attempts == [0, CUT]
+    assert bytes(received) == data
+
+
+def test_cancel_saves_resume_point(tmp_path):
+    receiver = FileReceiver(emit=lambda event, value: None, logger=Logger(),
+                            key="peer", directory=str(tmp_path))
+    transfer_id = b"\x01" * 16
+
+    async def run() -> None:
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"x" * CUT)
+
+        writer = type("Writer", (), {"write": lambda self, data: None,
+                                     "close": lambda self: None})()
+
+        task = asyncio.create_task(receiver.receive(reader, writer,
+                                                    transfer_id, SIZE,
+                                                    "big.bin"))
+        while reader._buffer: # Until the receiver has taken it all
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    state = tmp_path / (transfer_id.hex() + ".part.offset")
+    assert state.read_text() == str(CUT)